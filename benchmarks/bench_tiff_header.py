@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2021, 2022
+
+# Author(s):
+
+#   Trygve Aspenes
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Compare read_tiff_header with a rasterio open for reading width, height and TIFFTAG_DATETIME.
+
+Usage: python benchmarks/bench_tiff_header.py [geotiff files]
+
+Without arguments the GeoTIFF files in mapserver_tools/tests/testdata are
+used, or, if there are none, synthetic 2400x2750 GeoTIFF files.
+"""
+
+import os
+import sys
+import glob
+import time
+import argparse
+import tempfile
+
+# Run from a checkout without installing the package, from any directory
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from mapserver_tools.tiff_header import read_tiff_header  # noqa: E402
+from mapserver_tools.edit_wms_mmd_xml_files import generate_mapserver_map_file  # noqa: E402
+
+
+def make_synthetic_geotiffs(directory, count=4, width=2400, height=2750):
+    import numpy
+    import rasterio
+    from rasterio.transform import from_origin
+
+    files = []
+    for i in range(count):
+        geotiff_file = os.path.join(directory, 'overview_20210910_1233{:02d}.tif'.format(i))
+        with rasterio.open(geotiff_file, 'w', driver='GTiff', width=width, height=height, count=4, dtype='uint8',
+                           crs='EPSG:25833', transform=from_origin(-1000000, 8500000, 1000, 1000)) as dst:
+            dst.write(numpy.zeros((4, height, width), dtype='uint8'))
+            dst.update_tags(TIFFTAG_DATETIME='2021:09:10 12:33:{:02d}'.format(i))
+        files.append(geotiff_file)
+    return files
+
+
+def best_of(function, geotiff_file, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(geotiff_file)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("geotiff_files", nargs='*')
+    parser.add_argument("-r", "--repeat", type=int, default=50, help="Repetitions per file, the best is reported.")
+    cmd_args = parser.parse_args()
+
+    gmmf = generate_mapserver_map_file()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        testdata = os.path.join(REPO_ROOT, 'mapserver_tools/tests/testdata')
+        geotiff_files = cmd_args.geotiff_files or sorted(glob.glob(os.path.join(testdata, '*.tif')))
+        if not geotiff_files:
+            print("No GeoTIFF files in testdata, using synthetic files.")
+            geotiff_files = make_synthetic_geotiffs(tmp_dir)
+
+        print("{:<50} {:>14} {:>14} {:>8}".format('file', 'tiff_header', 'rasterio', 'speedup'))
+        for geotiff_file in geotiff_files:
+            header_time, header = best_of(read_tiff_header, geotiff_file, cmd_args.repeat)
+            rasterio_time, expected = best_of(gmmf.read_geotiff_metadata_rasterio, geotiff_file, cmd_args.repeat)
+            if tuple(header) != tuple(expected):
+                print("Mismatch for {}: {} != {}".format(geotiff_file, header, expected))
+                return 1
+            print("{:<50} {:>12.1f}us {:>12.1f}us {:>7.1f}x".format(
+                os.path.basename(geotiff_file)[-50:], header_time * 1e6, rasterio_time * 1e6,
+                rasterio_time / header_time))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,438 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2021, 2022
+
+# Author(s):
+
+#   Trygve Aspenes
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Benchmarks of the MMD and map file pipelines.
+
+Usage, from a checkout, the package does not need to be installed:
+    python benchmarks/run_benchmarks.py -o results.json [-k filter] [-r repeat]
+    python benchmarks/run_benchmarks.py --compare old.json new.json [--threshold 1.2]
+
+Every benchmark runs on synthetic data made in a temporary directory: MMD
+documents of growing size made from the testdata MMD file, GeoTIFF files of
+growing size, and a local HTTP server serving the testdata GetCapabilities
+document. Each benchmark is run repeat times and the min, median and mean
+seconds per operation are stored in the JSON results, together with the
+package version and git revision, so runs of different versions can be
+compared. The compare mode exits with 1 if a median got slower than threshold
+times the old median.
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import tempfile
+import statistics
+import subprocess
+import threading
+import xml.etree.ElementTree as et
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+# Run from a checkout without installing the package, from any directory
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+import mapserver_tools  # noqa: E402
+from mapserver_tools.edit_wms_mmd_xml_files import edit_wms_mmd_xml_files  # noqa: E402
+from mapserver_tools.edit_wms_mmd_xml_files import generate_mapserver_map_file  # noqa: E402
+from mapserver_tools.edit_wms_mmd_xml_files import match_input_file_with_layer_config  # noqa: E402
+from mapserver_tools.edit_wms_mmd_xml_files import read_yaml_config_file  # noqa: E402
+from mapserver_tools.layer_matcher import compile_layer_config  # noqa: E402
+from mapserver_tools.mmd_document_processor import mmd_document_processor  # noqa: E402
+from mapserver_tools.xml_backend import lxml_available  # noqa: E402
+
+TESTDATA = os.path.join(REPO_ROOT, 'mapserver_tools/tests/testdata')
+MMD_XML = os.path.join(TESTDATA, 'noaa19-avhrr-20210901070230-20210901071648.xml')
+GETCAPABILITIES = os.path.join(TESTDATA, 'getcapabilities.xml')
+CONFIG = os.path.join(REPO_ROOT, 'etc/okd-satellite-layer-metadata.yaml')
+TEMPLATES = os.path.join(REPO_ROOT, 'templates')
+TEMPLATE = 'map-file-template-okd-satellite.map'
+FAST_API = 'https://fastapi-dev.s-enda.k8s.met.no/api/get_mapserv'
+NS = {'mmd': 'http://www.met.no/schema/mmd',
+      'gml': 'http://www.opengis.net/gml'}
+
+# name -> (number of extra keyword elements in the MMD file)
+MMD_SIZES = {'small': 0, 'medium': 500, 'large': 20000}
+# name -> (width, height) of the GeoTIFF files
+GEOTIFF_SIZES = {'small': (240, 275), 'large': (2400, 2750)}
+
+BENCHMARKS = []
+
+
+def benchmark(function):
+    """Register a benchmark. It takes the work directory and returns (operations, run function)."""
+    BENCHMARKS.append(function)
+    return function
+
+
+def make_mmd_xml(mmd_xml_file, extra_keywords):
+    et.register_namespace('mmd', NS['mmd'])
+    et.register_namespace('gml', NS['gml'])
+    xtree = et.parse(MMD_XML)
+    keywords = et.SubElement(xtree.getroot(), '{%s}keywords' % NS['mmd'], vocabulary='none')
+    for i in range(extra_keywords):
+        et.SubElement(keywords, '{%s}keyword' % NS['mmd']).text = 'Synthetic keyword {}'.format(i)
+    xtree.write(mmd_xml_file, encoding='UTF-8')
+    return mmd_xml_file
+
+
+def make_geotiff(geotiff_file, width, height, seconds=18):
+    import numpy
+    import rasterio
+    from rasterio.transform import from_origin
+
+    with rasterio.open(geotiff_file, 'w', driver='GTiff', width=width, height=height, count=4, dtype='uint8',
+                       crs='EPSG:25833', transform=from_origin(-1000000, 8500000, 1000, 1000)) as dst:
+        dst.write(numpy.zeros((4, height, width), dtype='uint8'))
+        dst.update_tags(TIFFTAG_DATETIME='2021:09:10 12:33:{:02d}'.format(seconds))
+    return geotiff_file
+
+
+class _getcapabilities_handler(BaseHTTPRequestHandler):
+    body = b''
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/xml')
+        self.send_header('Content-Length', str(len(self.body)))
+        self.end_headers()
+        self.wfile.write(self.body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _threading_http_server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class stub_server():
+    """Local HTTP server answering every GET with body, for use in a with statement."""
+
+    def __init__(self, body):
+        handler = type('handler', (_getcapabilities_handler,), {'body': body})
+        self.server = _threading_http_server(('127.0.0.1', 0), handler)
+        self.url = 'http://127.0.0.1:{}/'.format(self.server.server_address[1])
+
+    def __enter__(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, kwargs={'poll_interval': 0.05})
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+
+def _mmd_benchmark(size):
+    def mmd_open_rewrite(work_dir):
+        mmd_xml_file = make_mmd_xml(os.path.join(work_dir, 'noaa19-avhrr-20210901070230-20210901071648.xml'),
+                                    MMD_SIZES[size])
+        ewmxf = edit_wms_mmd_xml_files()
+        bn, netcdf_path = ewmxf.generate_uri(mmd_xml_file)
+        state = {'i': 0}
+
+        def run():
+            # Alternate between two resources so every rewrite changes the file
+            state['i'] += 1
+            xtree = ewmxf.open_mmd_xml_file(mmd_xml_file, NS)
+            xroot = xtree.getroot()
+            ewmxf.remove_wms_from_mmd_xml(xroot, NS)
+            ewmxf.add_wms_to_mmd_xml(xroot, os.path.join(FAST_API, str(state['i'] % 2), netcdf_path),
+                                     ['overview', 'ir_window_channel'])
+            ewmxf.rewrite_mmd_xml(xtree, mmd_xml_file)
+        return 1, run
+    mmd_open_rewrite.__name__ = 'mmd_open_rewrite_{}'.format(size)
+    return mmd_open_rewrite
+
+
+for _size in MMD_SIZES:
+    benchmark(_mmd_benchmark(_size))
+
+
+MMD_BATCH_SIZE = 500
+
+
+def _mmd_batch(work_dir):
+    mmd_xml_file = make_mmd_xml(os.path.join(work_dir, 'noaa19-avhrr-20210901070230-20210901071648.xml'), 0)
+    with open(mmd_xml_file, 'rb') as fh:
+        document = fh.read()
+    return mmd_xml_file, document
+
+
+@benchmark
+def mmd_batch_methods(work_dir):
+    """Edit a batch of in memory documents with the edit_wms_mmd_xml_files methods."""
+    mmd_xml_file, document = _mmd_batch(work_dir)
+    ewmxf = edit_wms_mmd_xml_files()
+
+    def run():
+        for _ in range(MMD_BATCH_SIZE):
+            bn, netcdf_path = ewmxf.generate_uri(mmd_xml_file)
+            xtree = ewmxf.open_mmd_xml_file(io.BytesIO(document), NS)
+            xroot = xtree.getroot()
+            ewmxf.get_metadata_indentifier_from_mmd_xml(xroot, NS)
+            ewmxf.remove_wms_from_mmd_xml(xroot, NS)
+            ewmxf.get_platform_and_instrument_from_mmd_xml(xroot, NS)
+            ewmxf.add_wms_to_mmd_xml(xroot, os.path.join(FAST_API, netcdf_path), ['overview', 'ir_window_channel'])
+            xtree.write(io.BytesIO(), encoding='UTF-8')
+    return MMD_BATCH_SIZE, run
+
+
+def _mmd_batch_processor(backend):
+    def mmd_batch_processor(work_dir):
+        """The same batch as mmd_batch_methods with one mmd_document_processor."""
+        return _mmd_batch_processor_run(work_dir, backend)
+    mmd_batch_processor.__name__ = 'mmd_batch_processor' + ('_' + backend if backend != 'etree' else '')
+    return mmd_batch_processor
+
+
+def _mmd_batch_processor_run(work_dir, backend):
+    mmd_xml_file, document = _mmd_batch(work_dir)
+    processor = mmd_document_processor(NS, backend=backend)
+
+    def run():
+        for _ in range(MMD_BATCH_SIZE):
+            bn, netcdf_path = processor.ewmxf.generate_uri(mmd_xml_file)
+            xtree = processor.parse(io.BytesIO(document))
+            xroot = xtree.getroot()
+            processor.metadata_identifier(xroot)
+            processor.remove_wms(xroot)
+            processor.platform_and_instrument(xroot)
+            processor.add_wms(xroot, os.path.join(FAST_API, netcdf_path), ['overview', 'ir_window_channel'])
+            processor.serialize(xtree)
+    return MMD_BATCH_SIZE, run
+
+
+benchmark(_mmd_batch_processor('etree'))
+if lxml_available():
+    benchmark(_mmd_batch_processor('lxml'))
+
+
+@benchmark
+def parse_layers_from_getcapabilities(work_dir):
+    with open(GETCAPABILITIES, 'r') as fh:
+        gcd = fh.read()
+    ewmxf = edit_wms_mmd_xml_files()
+
+    def run():
+        ewmxf.parse_layers_from_getcapabilities(gcd)
+    return 1, run
+
+
+@benchmark
+def parse_layers_from_getcapabilities_processor(work_dir):
+    with open(GETCAPABILITIES, 'r') as fh:
+        gcd = fh.read()
+    processor = mmd_document_processor(NS)
+
+    def run():
+        processor.parse_layers_from_getcapabilities(gcd)
+    return 1, run
+
+
+def _input_file_names(count):
+    names = []
+    for i in range(count):
+        layer = 'overview' if i % 2 else 'natural_with_night_fog'
+        names.append('/data/{}_20210910_{:06d}.tif'.format(layer, i))
+    return names
+
+
+@benchmark
+def match_layer_config(work_dir):
+    config = read_yaml_config_file(CONFIG)
+    names = _input_file_names(1000)
+
+    def run():
+        for name in names:
+            match_input_file_with_layer_config(name, config)
+    return len(names), run
+
+
+@benchmark
+def match_layer_config_compiled(work_dir):
+    matcher = compile_layer_config(read_yaml_config_file(CONFIG))
+    names = _input_file_names(1000)
+
+    def run():
+        for name in names:
+            matcher.match(name)
+    return len(names), run
+
+
+def _geotiff_benchmark(size, cached):
+    def get_geotiff_timestamp(work_dir):
+        geotiff_file = make_geotiff(os.path.join(work_dir, 'overview_20210910_123318.tif'), *GEOTIFF_SIZES[size])
+        gmmf = generate_mapserver_map_file()
+
+        def run():
+            if cached:
+                gmmf.get_geotiff_timestamp(geotiff_file)
+            else:
+                generate_mapserver_map_file().get_geotiff_timestamp(geotiff_file)
+        return 1, run
+    get_geotiff_timestamp.__name__ = 'get_geotiff_timestamp_{}{}'.format(size, '_cached' if cached else '')
+    return get_geotiff_timestamp
+
+
+for _size in GEOTIFF_SIZES:
+    benchmark(_geotiff_benchmark(_size, False))
+benchmark(_geotiff_benchmark('small', True))
+
+
+@benchmark
+def generate_render_data_and_template(work_dir):
+    config = read_yaml_config_file(CONFIG)
+    input_data_files = [make_geotiff(os.path.join(work_dir, 'overview_20210910_123318.tif'), 240, 275),
+                        make_geotiff(os.path.join(work_dir, 'natural_with_night_fog_20210910_123318.tif'), 240, 275)]
+    output_dir = os.path.join(work_dir, 'map-files')
+    os.mkdir(output_dir)
+
+    def run():
+        gmmf = generate_mapserver_map_file()
+        template = gmmf.load_template(TEMPLATES, TEMPLATE)
+        data = gmmf.generate_render_data('http://localhost', '/data', 'mapserver-20210910_123318.map',
+                                         input_data_files, config)
+        template.render(data=data)
+    return 1, run
+
+
+@benchmark
+def read_layers_from_getcapabilities(work_dir):
+    with open(GETCAPABILITIES, 'rb') as fh:
+        body = fh.read()
+    server = stub_server(body).__enter__()
+    ewmxf = edit_wms_mmd_xml_files()
+
+    def run():
+        ewmxf.read_layers_from_getcapabilities(server.url)
+    run.close = lambda: server.__exit__()
+    return 1, run
+
+
+def run_benchmark(function, repeat, warmup=1):
+    work_dir = tempfile.mkdtemp(prefix='mapserver-tools-bench-')
+    try:
+        operations, run = function(work_dir)
+        try:
+            for _ in range(warmup):
+                run()
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                run()
+                timings.append((time.perf_counter() - start) / operations)
+        finally:
+            if hasattr(run, 'close'):
+                run.close()
+    finally:
+        shutil.rmtree(work_dir)
+    return {'min': min(timings), 'median': statistics.median(timings), 'mean': statistics.mean(timings),
+            'repeat': repeat, 'operations': operations}
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL,
+                                       cwd=REPO_ROOT, universal_newlines=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(names=None, repeat=20):
+    results = {}
+    for function in BENCHMARKS:
+        if names and not any(name in function.__name__ for name in names):
+            continue
+        result = run_benchmark(function, repeat)
+        print("{:<45} {:>12.1f}us median {:>12.1f}us min".format(function.__name__, result['median'] * 1e6,
+                                                                 result['min'] * 1e6))
+        results[function.__name__] = result
+    return {'version': mapserver_tools.__version__,
+            'git_revision': git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'date': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'results': results}
+
+
+def compare(old, new, threshold):
+    """Print old against new medians, return the names slower than threshold times the old median."""
+    print("{:<45} {:>14} {:>14} {:>8}".format('benchmark', old.get('git_revision') or old['version'],
+                                              new.get('git_revision') or new['version'], 'ratio'))
+    slower = []
+    for name in sorted(set(old['results']) | set(new['results'])):
+        if name not in old['results'] or name not in new['results']:
+            print("{:<45} only in {}".format(name, 'new' if name in new['results'] else 'old'))
+            continue
+        old_median = old['results'][name]['median']
+        new_median = new['results'][name]['median']
+        ratio = new_median / old_median if old_median else float('inf')
+        flag = ''
+        if ratio > threshold:
+            flag = '  SLOWER'
+            slower.append(name)
+        print("{:<45} {:>12.1f}us {:>12.1f}us {:>7.2f}x{}".format(name, old_median * 1e6, new_median * 1e6,
+                                                                  ratio, flag))
+    return slower
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-o", "--output", help="JSON file to store the results in.")
+    parser.add_argument("-k", "--filter", nargs='+', help="Only run benchmarks with one of these in the name.")
+    parser.add_argument("-r", "--repeat", type=int, default=20, help="Timed repetitions per benchmark.")
+    parser.add_argument("-l", "--list", action='store_true', help="List the benchmarks.")
+    parser.add_argument("--compare", nargs=2, metavar=('OLD', 'NEW'), help="Compare two JSON result files.")
+    parser.add_argument("--threshold", type=float, default=1.2,
+                        help="Slowdown ratio of the median reported as a regression by --compare.")
+    cmd_args = parser.parse_args()
+
+    if cmd_args.list:
+        for function in BENCHMARKS:
+            print(function.__name__)
+        return 0
+    if cmd_args.compare:
+        with open(cmd_args.compare[0]) as fh:
+            old = json.load(fh)
+        with open(cmd_args.compare[1]) as fh:
+            new = json.load(fh)
+        return 1 if compare(old, new, cmd_args.threshold) else 0
+
+    results = run_benchmarks(cmd_args.filter, cmd_args.repeat)
+    if cmd_args.output:
+        with open(cmd_args.output, 'w') as fh:
+            json.dump(results, fh, indent=2, sort_keys=True)
+        print("Wrote {}".format(cmd_args.output))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2021, 2022
+
+# Author(s):
+
+#   Trygve Aspenes
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Atomic writes that leave unchanged files alone.
+
+New content goes to a temporary file in the same directory, which is
+fsynced and renamed over the target, so readers like mapserv see either the
+old or the new file, never a partial one. If the content hash equals the hash
+of the existing file, nothing is replaced and the file keeps its mtime.
+"""
+
+import os
+import shutil
+import hashlib
+import binascii
+
+_block_size = 1024 * 1024
+
+
+def file_digest(path):
+    """Return the sha256 digest of the file at path, or None if it does not exist."""
+    sha = hashlib.sha256()
+    try:
+        with open(path, 'rb') as fh:
+            for block in iter(lambda: fh.read(_block_size), b''):
+                sha.update(block)
+    except FileNotFoundError:
+        return None
+    return sha.digest()
+
+
+def _fsync_dir(directory):
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+class atomic_file_writer():
+    """Binary file-like object for writing path atomically, skipping the rename if nothing changed.
+
+    Use as a context manager; after the with block, written tells whether path was replaced.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.written = False
+
+    def __enter__(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        for _ in range(100):
+            self.tmp_path = os.path.join(directory, '.{}.{}.tmp'.format(
+                os.path.basename(self.path), binascii.hexlify(os.urandom(4)).decode()))
+            try:
+                # Created like open() would, so the file gets the permissions of the umask
+                fd = os.open(self.tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+                break
+            except FileExistsError:
+                continue
+        else:
+            raise FileExistsError(self.tmp_path)
+        self.fh = os.fdopen(fd, 'wb')
+        self.sha = hashlib.sha256()
+        return self
+
+    def write(self, data):
+        self.sha.update(data)
+        return self.fh.write(data)
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if exc_type is None and file_digest(self.path) != self.sha.digest():
+                self.fh.flush()
+                os.fsync(self.fh.fileno())
+                self.fh.close()
+                if os.path.exists(self.path):
+                    shutil.copymode(self.path, self.tmp_path)
+                os.replace(self.tmp_path, self.path)
+                _fsync_dir(os.path.dirname(os.path.abspath(self.path)))
+                self.written = True
+        finally:
+            if not self.fh.closed:
+                self.fh.close()
+            if not self.written:
+                os.remove(self.tmp_path)
+        return False
+
+
+def write_if_changed(path, content):
+    """Atomically write the bytes content to path unless the file already has that content.
+
+    Returns True if the file was written, False if it was left unchanged.
+    """
+    try:
+        size = os.path.getsize(path)
+    except OSError:
+        size = None
+    if size == len(content) and file_digest(path) == hashlib.sha256(content).digest():
+        return False
+    with atomic_file_writer(path) as fh:
+        fh.write(content)
+    return fh.written
+
+
+def write_chunks_if_changed(path, chunks):
+    """Like write_if_changed, for content given as an iterable of bytes, without holding it all in memory."""
+    with atomic_file_writer(path) as fh:
+        for chunk in chunks:
+            fh.write(chunk)
+    return fh.written
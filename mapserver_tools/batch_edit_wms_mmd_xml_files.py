@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2021, 2022
+
+# Author(s):
+
+#   Trygve Aspenes
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Run the py-mmd-edit-resource pipeline over many mmd xml files in one process pool."""
+
+import os
+import sys
+import time
+import concurrent.futures
+
+from mapserver_tools.edit_wms_mmd_xml_files import edit_wms_mmd_xml_files
+from mapserver_tools.edit_wms_mmd_xml_files import select_wms_layers
+from mapserver_tools.input_files import collect_input_files
+from mapserver_tools.mmd_document_processor import MMD_NS
+from mapserver_tools.mmd_document_processor import get_mmd_document_processor
+from mapserver_tools.product_catalog import edit_settings
+from mapserver_tools.stream_wms_mmd_xml_files import stream_edit_wms_mmd_xml_files
+from mapserver_tools.wms_layer_rules import load_wms_layer_rules
+
+
+def read_file_list(file_list):
+    """Read mmd xml file names, one per line, from a file or from stdin if file_list is '-'."""
+    if file_list == '-':
+        lines = sys.stdin.read().splitlines()
+    else:
+        with open(file_list, 'r') as fh:
+            lines = fh.read().splitlines()
+    return [line.strip() for line in lines if line.strip()]
+
+
+def collect_mmd_xml_files(inputs, pattern='*.xml'):
+    """Expand a list of files, directories and glob patterns to a list of mmd xml files, see collect_input_files."""
+    return collect_input_files(inputs, pattern)
+
+
+def edit_mmd_xml_file(mmd_xml_file, server_name, ns=MMD_NS, ewmxf=None, stream=False, layer_rules=None,
+                      backend=None, info=None):
+    """Replace the OGC WMS data_access of one mmd xml file in place.
+
+    layer_rules are the WMS layer rules, the built in rules if None. Without
+    ewmxf the file is edited by the mmd_document_processor of this process,
+    using the xml backend. info, if given, is filled with the
+    metadata_identifier, basename, netcdf_path and layers of the file.
+    Returns True if the file was written, False if it already had the new content.
+    """
+    if ewmxf is None:
+        if not stream:
+            processor = get_mmd_document_processor(ns, layer_rules, backend)
+            return processor.edit_mmd_xml_file(mmd_xml_file, server_name, info)
+        ewmxf = edit_wms_mmd_xml_files()
+    bn, netcdf_path = ewmxf.generate_uri(mmd_xml_file)
+    if info is None:
+        info = {}
+    info.update(basename=bn, netcdf_path=netcdf_path)
+    if stream:
+        def wms(document_info):
+            info['metadata_identifier'] = document_info.get('metadata_identifier')
+            info['layers'] = select_wms_layers(bn, layer_rules, document_info.get('platform'),
+                                               document_info.get('instrument'))
+            return os.path.join(server_name, netcdf_path), info['layers']
+        return stream_edit_wms_mmd_xml_files(ns).rewrite_mmd_xml_file(mmd_xml_file, wms)
+    xtree = ewmxf.open_mmd_xml_file(mmd_xml_file, ns)
+    if xtree is None:
+        raise FileNotFoundError(mmd_xml_file)
+    xroot = xtree.getroot()
+    ewmxf.remove_wms_from_mmd_xml(xroot, ns)
+    platform, instrument = ewmxf.get_platform_and_instrument_from_mmd_xml(xroot, ns)
+    info['metadata_identifier'] = ewmxf.get_metadata_indentifier_from_mmd_xml(xroot, ns)
+    info['layers'] = select_wms_layers(bn, layer_rules, platform, instrument)
+    ewmxf.add_wms_to_mmd_xml(xroot, os.path.join(server_name, netcdf_path), info['layers'])
+    return ewmxf.rewrite_mmd_xml(xtree, mmd_xml_file)
+
+
+def _edit_mmd_xml_file_worker(args):
+    mmd_xml_file, server_name, stream, layer_rules_file, backend = args
+    start = time.perf_counter()
+    info = {}
+    try:
+        written = edit_mmd_xml_file(mmd_xml_file, server_name, stream=stream,
+                                    layer_rules=load_wms_layer_rules(layer_rules_file), backend=backend, info=info)
+    except Exception as exc:
+        return (mmd_xml_file, False, "{}: {}".format(type(exc).__name__, exc), time.perf_counter() - start, False,
+                None)
+    return mmd_xml_file, True, None, time.perf_counter() - start, written, info
+
+
+def batch_edit_mmd_xml_files(mmd_xml_files, server_name, workers=None, chunksize=16, stream=False,
+                             layer_rules_file=None, backend=None, catalog=None):
+    """Edit all mmd_xml_files, using a pool of worker processes when workers > 1.
+
+    With stream=True the files are rewritten with the streaming engine
+    instead of building the full ElementTree. The WMS layers are selected with
+    the rules in layer_rules_file, or the built in rules if it is None. backend
+    is the xml backend of the tree engine, see xml_backend.get_xml_backend.
+    With a product_catalog, files it has recorded as edited with the same
+    server_name and rules, and not changed since, are skipped without being
+    read, and the edited files are recorded.
+    Returns a list of (mmd_xml_file, ok, error message, seconds, written) in
+    input order, where written is False for files that already had the new
+    content and were left untouched. A failing file does not stop the batch.
+    """
+    settings = None
+    skipped = set()
+    if catalog is not None:
+        settings = edit_settings(server_name, layer_rules_file)
+        skipped = set(f for f in mmd_xml_files if catalog.mmd_unchanged(f, settings))
+    jobs = [(mmd_xml_file, server_name, stream, layer_rules_file, backend)
+            for mmd_xml_file in mmd_xml_files if mmd_xml_file not in skipped]
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers <= 1 or len(jobs) <= 1:
+        edited = [_edit_mmd_xml_file_worker(job) for job in jobs]
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+            edited = list(executor.map(_edit_mmd_xml_file_worker, jobs, chunksize=chunksize))
+    if catalog is not None:
+        for mmd_xml_file, ok, _, _, _, info in edited:
+            if ok:
+                catalog.record_mmd(mmd_xml_file, settings, info.get('metadata_identifier'), info['basename'],
+                                   info['netcdf_path'], info.get('layers', []), commit=False)
+        catalog.commit()
+    edited = iter(edited)
+    results = []
+    for mmd_xml_file in mmd_xml_files:
+        if mmd_xml_file in skipped:
+            results.append((mmd_xml_file, True, None, 0.0, False))
+        else:
+            results.append(next(edited)[:5])
+    return results
+
+
+def print_batch_summary(results, elapsed, verbose=True):
+    """Print per file status and a throughput summary. Returns the number of failed files."""
+    failed = 0
+    skipped = 0
+    for mmd_xml_file, ok, message, seconds, written in results:
+        if ok and not written:
+            skipped += 1
+            if verbose:
+                print("SKIPPED {} unchanged ({:.3f}s)".format(mmd_xml_file, seconds))
+        elif ok:
+            if verbose:
+                print("OK      {} ({:.3f}s)".format(mmd_xml_file, seconds))
+        else:
+            failed += 1
+            print("FAILED  {}: {}".format(mmd_xml_file, message))
+    total = len(results)
+    rate = total / elapsed if elapsed > 0 else float('inf')
+    print("Processed {} files in {:.2f}s ({:.1f} files/s): {} ok, {} skipped unchanged, {} failed".format(
+        total, elapsed, rate, total - failed - skipped, skipped, failed))
+    return failed
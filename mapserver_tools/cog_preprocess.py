@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2021, 2022
+
+# Author(s):
+
+#   Trygve Aspenes
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Rewrite incoming GeoTIFF files as tiled Cloud Optimized GeoTIFFs with overviews.
+
+Strip organized GeoTIFFs without overviews make mapserver read the full
+raster for every zoomed out GetMap request. optimize_geotiffs checks the
+layout of each file with rasterio and writes a COG with the same basename to
+a separate directory for the files that are not tiled, have no overviews or
+are not compressed. The directory is seen by mapserver as
+{mapserver_data_dir}/mapserver/cog, like the map files are seen in
+{mapserver_data_dir}/mapserver/map-files, and generate_render_data points the
+layers at the optimized files given to it in cog_files.
+
+Files are only rewritten when the COG is missing or older than the input.
+"""
+
+import os
+import time
+import binascii
+
+COG_SUBDIR = 'mapserver/cog'
+
+
+def geotiff_layout(geotiff_file):
+    """Return the layout of geotiff_file: width, height, tiled, blocksize, overviews and compress."""
+    import rasterio
+
+    with rasterio.open(geotiff_file) as dataset:
+        block_height, block_width = dataset.block_shapes[0]
+        return {'width': dataset.width,
+                'height': dataset.height,
+                'tiled': bool(dataset.profile.get('tiled')) and block_width < dataset.width,
+                'blocksize': (block_width, block_height),
+                'overviews': dataset.overviews(1),
+                'compress': dataset.compression.value if dataset.compression else None}
+
+
+def cog_reasons(layout, blocksize=512):
+    """Return why a file with layout should be rewritten as a COG, an empty list if it is fine as it is."""
+    reasons = []
+    if not layout['tiled']:
+        reasons.append('not tiled')
+    if not layout['overviews'] and max(layout['width'], layout['height']) > blocksize:
+        reasons.append('no overviews')
+    if not layout['compress']:
+        reasons.append('not compressed')
+    return reasons
+
+
+def write_cog(geotiff_file, cog_file, compress='DEFLATE', blocksize=512, resampling='average'):
+    """Write geotiff_file as a COG to cog_file, replacing it atomically. The tags are kept."""
+    import rasterio
+    import rasterio.shutil
+
+    tmp_file = os.path.join(os.path.dirname(cog_file) or '.', '.{}.{}.tmp'.format(
+        os.path.basename(cog_file), binascii.hexlify(os.urandom(4)).decode()))
+    try:
+        with rasterio.Env() as env:
+            has_cog_driver = 'COG' in env.drivers()
+        if has_cog_driver:
+            rasterio.shutil.copy(geotiff_file, tmp_file, driver='COG', compress=compress, blocksize=blocksize,
+                                 overview_resampling=resampling)
+        else:
+            # GDAL < 3.1: a tiled GeoTIFF with overviews, not strictly a COG but read the same way by mapserver
+            from rasterio.enums import Resampling
+
+            rasterio.shutil.copy(geotiff_file, tmp_file, driver='GTiff', tiled=True, blockxsize=blocksize,
+                                 blockysize=blocksize, compress=compress)
+            with rasterio.open(tmp_file, 'r+') as dataset:
+                factors = []
+                factor = 2
+                while max(dataset.width, dataset.height) / factor >= blocksize / 2:
+                    factors.append(factor)
+                    factor *= 2
+                dataset.build_overviews(factors, Resampling[resampling])
+        os.replace(tmp_file, cog_file)
+    finally:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+
+
+def cog_file_name(geotiff_file, cog_output_dir):
+    return os.path.join(cog_output_dir, os.path.basename(geotiff_file))
+
+
+def optimize_geotiff(geotiff_file, cog_output_dir, compress='DEFLATE', blocksize=512, resampling='average',
+                     force=False):
+    """Write a COG of geotiff_file to cog_output_dir if it needs one.
+
+    Returns (geotiff_file, cog_file, status, message, seconds). status is
+    'optimized', 'up to date' or 'not needed', cog_file is None for 'not
+    needed'. Errors are raised.
+    """
+    start = time.perf_counter()
+    cog_file = cog_file_name(geotiff_file, cog_output_dir)
+    try:
+        up_to_date = os.stat(cog_file).st_mtime >= os.stat(geotiff_file).st_mtime
+    except FileNotFoundError:
+        up_to_date = False
+    if up_to_date and not force:
+        return geotiff_file, cog_file, 'up to date', None, time.perf_counter() - start
+    reasons = cog_reasons(geotiff_layout(geotiff_file), blocksize)
+    if not reasons and not force:
+        return geotiff_file, None, 'not needed', None, time.perf_counter() - start
+    write_cog(geotiff_file, cog_file, compress, blocksize, resampling)
+    return geotiff_file, cog_file, 'optimized', ', '.join(reasons), time.perf_counter() - start
+
+
+def _optimize_geotiff_worker(args):
+    geotiff_file = args[0]
+    start = time.perf_counter()
+    try:
+        return optimize_geotiff(*args)
+    except Exception as exc:
+        return geotiff_file, None, 'failed', "{}: {}".format(type(exc).__name__, exc), time.perf_counter() - start
+
+
+def optimize_geotiffs(geotiff_files, cog_output_dir, workers=None, compress='DEFLATE', blocksize=512,
+                      resampling='average', force=False, debug=False):
+    """Optimize geotiff_files with optimize_geotiff, in a pool of worker processes when workers > 1.
+
+    Returns a dict geotiff_file -> cog_file of the files that have a COG, to
+    be given as cog_files to generate_render_data, and the list of results of
+    optimize_geotiff in input order. Files that fail are reported and left
+    out of the dict, so the map file uses the original file.
+    """
+    os.makedirs(cog_output_dir, exist_ok=True)
+    jobs = [(geotiff_file, cog_output_dir, compress, blocksize, resampling, force) for geotiff_file in geotiff_files]
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers <= 1 or len(jobs) <= 1:
+        results = [_optimize_geotiff_worker(job) for job in jobs]
+    else:
+        import concurrent.futures
+
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(_optimize_geotiff_worker, jobs))
+    cog_files = {}
+    for geotiff_file, cog_file, status, message, seconds in results:
+        if status == 'failed':
+            print("Could not optimize {}, using it as it is: {}".format(geotiff_file, message))
+        elif cog_file is not None:
+            cog_files[geotiff_file] = cog_file
+        if debug:
+            print("{} {} ({:.3f}s){}".format(status, geotiff_file, seconds, ': ' + message if message else ''))
+    return cog_files, results
@@ -22,19 +22,64 @@
 
 import os
 import sys
-import yaml
-import jinja2
+import time
 import datetime
-import rasterio
-import requests
+import itertools
 import xml.etree.ElementTree as et
 
+from mapserver_tools.atomic_write import write_chunks_if_changed
+from mapserver_tools.atomic_write import write_if_changed
+from mapserver_tools.cog_preprocess import COG_SUBDIR
+from mapserver_tools.geotiff_metadata_cache import geotiff_metadata_cache
+from mapserver_tools.layer_matcher import compile_layer_config
+from mapserver_tools.layer_matcher import get_layer_matcher
+from mapserver_tools.layer_matcher import layer_config_match_error
+from mapserver_tools.render_environment import render_environment
+from mapserver_tools.tile_index import union_bounds
+from mapserver_tools.tile_index import write_tile_index
+from mapserver_tools.tiff_header import read_tiff_bounds
+from mapserver_tools.tiff_header import read_tiff_header
+from mapserver_tools.tiff_header import tiff_header_error
+from mapserver_tools.wms_layer_rules import compile_wms_layer_rules
+from mapserver_tools.wms_layer_rules import load_wms_layer_rules
+from mapserver_tools.xml_backend import get_xml_backend
+
 
 def match_input_file_with_layer_config(input_file, config):
-    for layer in config['layers']:
-        if os.path.basename(input_file).startswith(layer['match']):
-            return layer
-    print("Could not find matching layer config to the input file. Fix you layer config.")
+    """config is a layer config dict or a layer_matcher from compile_layer_config
+
+    A dict is compiled on the first call and the matcher reused for later calls with the same dict.
+    """
+    try:
+        return get_layer_matcher(config).match(input_file)
+    except layer_config_match_error:
+        print("Could not find matching layer config to the input file. Fix you layer config.")
+
+
+def select_wms_layers(bn, layer_rules=None, platform=None, instrument=None):
+    """Return the WMS layers for the MMD basename bn, with the built in rules if layer_rules is None
+
+    layer_rules is a rules config dict or compiled wms_layer_rules, see load_wms_layer_rules.
+    """
+    if layer_rules is None:
+        layer_rules = load_wms_layer_rules()
+    return compile_wms_layer_rules(layer_rules).select(bn, platform, instrument)
+
+
+def _encoded_chunks(parts, chunk_size):
+    """Join the strings of parts into utf-8 chunks of at least chunk_size bytes, the last may be smaller."""
+    buffer = []
+    size = 0
+    for part in parts:
+        part = part.encode('utf-8')
+        buffer.append(part)
+        size += len(part)
+        if size >= chunk_size:
+            yield b''.join(buffer)
+            buffer = []
+            size = 0
+    if buffer:
+        yield b''.join(buffer)
 
 
 def check_arguments(cmd_args):
@@ -42,6 +87,8 @@ def check_arguments(cmd_args):
 
 
 def read_yaml_config_file(yaml_config_file, debug=False):
+    import yaml
+
     config = None
     try:
         with open(yaml_config_file, 'r') as stream:
@@ -60,12 +107,17 @@ def read_yaml_config_file(yaml_config_file, debug=False):
 
 
 class edit_wms_mmd_xml_files():
+    def __init__(self, capabilities_client=None, backend=None):
+        # Optional getcapabilities_client, to reuse connections and cache GetCapabilities documents
+        self.capabilities_client = capabilities_client
+        # xml backend parsing and writing the documents, see xml_backend.get_xml_backend
+        self.xml = get_xml_backend(backend)
+
     def open_mmd_xml_file(self, input_mmd_xml_file, ns):
         xtree = None
-        et.register_namespace('mmd', ns['mmd'])
-        et.register_namespace('gml', ns['gml'])
+        self.xml.register_namespaces({'mmd': ns['mmd'], 'gml': ns['gml']})
         try:
-            xtree = et.parse(input_mmd_xml_file)
+            xtree = self.xml.parse(input_mmd_xml_file)
         except FileNotFoundError:
             print("Could not find the mmd xml input file. Please check you command line argument.")
             # sys.exit(1)
@@ -86,49 +138,136 @@ class edit_wms_mmd_xml_files():
 
         return metadata_identifier.text
 
+    def get_platform_and_instrument_from_mmd_xml(self, xroot, ns):
+        """Return the platform and instrument short names, None for those not in the mmd file"""
+        platform = xroot.findtext("mmd:platform/mmd:short_name", None, ns)
+        instrument = xroot.findtext("mmd:platform/mmd:instrument/mmd:short_name", None, ns)
+        return platform, instrument
+
     def add_wms_to_mmd_xml(self, xroot, fast_api_netcdf_path, layers):
-        wms_data_access = et.SubElement(xroot, "mmd:data_access")
-        wms_data_access_type = et.SubElement(wms_data_access, "mmd:type")
+        wms_data_access = self.xml.SubElement(xroot, "mmd:data_access")
+        wms_data_access_type = self.xml.SubElement(wms_data_access, "mmd:type")
         wms_data_access_type.text = "OGC WMS"
-        wms_data_access_description = et.SubElement(wms_data_access, "mmd:description")
+        wms_data_access_description = self.xml.SubElement(wms_data_access, "mmd:description")
         wms_data_access_description.text = "OGC Web Mapping Service, URI to GetCapabilities Document."
-        wms_data_access_resource = et.SubElement(wms_data_access, "mmd:resource")
+        wms_data_access_resource = self.xml.SubElement(wms_data_access, "mmd:resource")
         get_capabilites = 'service=WMS&version=1.3.0&request=GetCapabilities'
         wms_data_access_resource.text = f"{fast_api_netcdf_path}?{get_capabilites}"
-        wms_data_access_layers = et.SubElement(wms_data_access, 'mmd:wms_layers')
+        wms_data_access_layers = self.xml.SubElement(wms_data_access, 'mmd:wms_layers')
 
         for layer in layers:
-            wms_data_access_layer = et.SubElement(wms_data_access_layers, 'mmd:wms_layer')
+            wms_data_access_layer = self.xml.SubElement(wms_data_access_layers, 'mmd:wms_layer')
             wms_data_access_layer.text = layer
 
     def add_wms_to_mmd_xml_old(self, xroot, server_name, mapserver_data_dir, map_output_file, input_data_files, config):
-        wms_data_access = et.SubElement(xroot, "mmd:data_access")
-        wms_data_access_type = et.SubElement(wms_data_access, "mmd:type")
+        wms_data_access = self.xml.SubElement(xroot, "mmd:data_access")
+        wms_data_access_type = self.xml.SubElement(wms_data_access, "mmd:type")
         wms_data_access_type.text = "OGC WMS"
-        wms_data_access_description = et.SubElement(wms_data_access, "mmd:description")
+        wms_data_access_description = self.xml.SubElement(wms_data_access, "mmd:description")
         wms_data_access_description.text = "OGC Web Mapping Service, URI to GetCapabilities Document."
-        wms_data_access_resource = et.SubElement(wms_data_access, "mmd:resource")
+        wms_data_access_resource = self.xml.SubElement(wms_data_access, "mmd:resource")
         get_capabilites = '&service=WMS&amp;version=1.3.0&amp;request=GetCapabilities'
         wms_data_access_resource.text = "{}/cgi-bin/mapserv?map={}{}".format(server_name,
                                                                              os.path.join(mapserver_data_dir,
                                                                                           'mapserver/map-files',
                                                                                           map_output_file),
                                                                              get_capabilites)
-        wms_data_access_layers = et.SubElement(wms_data_access, 'mmd:wms_layers')
+        wms_data_access_layers = self.xml.SubElement(wms_data_access, 'mmd:wms_layers')
 
+        matcher = compile_layer_config(config)
         for file_layer in input_data_files:
-            layer_config = match_input_file_with_layer_config(file_layer, config)
-            wms_data_access_layer = et.SubElement(wms_data_access_layers, 'mmd:wms_layer')
+            layer_config = matcher.match(file_layer)
+            wms_data_access_layer = self.xml.SubElement(wms_data_access_layers, 'mmd:wms_layer')
             wms_data_access_layer.text = layer_config['name']
 
     def rewrite_mmd_xml(self, xtree, input_mmd_xml_file):
-        xtree.write(input_mmd_xml_file, encoding='UTF-8')
+        """Write xtree back atomically. Returns False if the file already had this content."""
+        return write_if_changed(input_mmd_xml_file, self.xml.tostring(xtree))
 
     def read_layers_from_getcapabilities(self, resource):
         "Read and parse layer names from getcapabilities document"
 
-        gcd = requests.get(resource).text
-        xtree = et.fromstring(gcd)
+        if self.capabilities_client is not None:
+            gcd = self.capabilities_client.get(resource)
+        else:
+            import requests
+
+            gcd = requests.get(resource).text
+        return self.parse_layers_from_getcapabilities(gcd)
+
+    def iter_layers_from_getcapabilities(self, resource, chunk_size=64 * 1024):
+        """Yield layer names from a getcapabilities document while it is downloaded
+
+        The response body is fed chunk by chunk to an incremental parser, so the
+        whole document is never held in memory. This bypasses the cache of the
+        capabilities client, but uses its session and timeout.
+        """
+        if self.capabilities_client is not None:
+            response = self.capabilities_client.session.get(resource, stream=True,
+                                                            timeout=self.capabilities_client.timeout)
+        else:
+            import requests
+
+            response = requests.get(resource, stream=True)
+        try:
+            response.raise_for_status()
+            for layer in self.iter_layers_from_getcapabilities_chunks(response.iter_content(chunk_size)):
+                yield layer
+        finally:
+            response.close()
+
+    def iter_layers_from_getcapabilities_chunks(self, chunks):
+        """Yield layer names from a getcapabilities document given as an iterable of byte chunks
+
+        Every element is dropped from the tree as soon as it is parsed.
+        """
+        wms = '{http://www.opengis.net/wms}'
+        layer_name_path = [wms + 'Capability', wms + 'Layer', wms + 'Layer', wms + 'Name']
+        parser = et.XMLPullParser(events=('start', 'end'))
+        stack = []
+        for chunk in itertools.chain(chunks, [None]):
+            if chunk is None:
+                parser.close()
+            else:
+                parser.feed(chunk)
+            for event, elem in parser.read_events():
+                if event == 'start':
+                    stack.append(elem)
+                    continue
+                if elem.tag == layer_name_path[-1] and [e.tag for e in stack[-4:]] == layer_name_path:
+                    yield elem.text
+                stack.pop()
+                if stack:
+                    stack[-1].remove(elem)
+                else:
+                    elem.clear()
+
+    def read_layers_from_getcapabilities_many(self, resources, concurrency=20, per_host=4):
+        """Read layer names from many getcapabilities documents concurrently
+
+        Returns a dict resource -> layers and a dict resource -> exception for failed resources.
+        Without a capabilities client one is made for this call only, with per_host connections per host.
+        """
+        from mapserver_tools.getcapabilities_client import getcapabilities_client
+        from mapserver_tools.getcapabilities_client import read_layers_many
+
+        client = self.capabilities_client
+        if client is None:
+            client = getcapabilities_client(pool_maxsize=per_host)
+
+        def read_layers(resource):
+            return self.parse_layers_from_getcapabilities(client.get(resource))
+
+        try:
+            return read_layers_many(resources, read_layers, concurrency, per_host)
+        finally:
+            if client is not self.capabilities_client:
+                client.close()
+
+    def parse_layers_from_getcapabilities(self, gcd):
+        "Parse layer names from the text of a getcapabilities document"
+
+        xtree = self.xml.fromstring(gcd)
         layers = []
         for layer in xtree.findall(".//{http://www.opengis.net/wms}Capability/{http://www.opengis.net/wms}Layer/"
                                    "{http://www.opengis.net/wms}Layer/{http://www.opengis.net/wms}Name"):
@@ -144,13 +283,127 @@ class edit_wms_mmd_xml_files():
 
 
 class generate_mapserver_map_file():
+    def __init__(self, metadata_cache=None, use_tiff_header_reader=True, render_env=None):
+        # Cache of the geotiff headers, so each file is opened at most once
+        if metadata_cache is None:
+            metadata_cache = geotiff_metadata_cache()
+        self.metadata_cache = metadata_cache
+        # jinja2 environments kept between load_template calls, so templates are compiled once
+        if render_env is None:
+            render_env = render_environment()
+        self.render_env = render_env
+        self.use_tiff_header_reader = use_tiff_header_reader
+        self.geotiff_timings = []
+
+    def read_geotiff_metadata(self, geotiff_file):
+        """Read width, height and TIFFTAG_DATETIME, with rasterio for files read_tiff_header can not handle"""
+        if self.use_tiff_header_reader:
+            try:
+                return read_tiff_header(geotiff_file)
+            except tiff_header_error:
+                pass
+        return self.read_geotiff_metadata_rasterio(geotiff_file)
+
+    def read_geotiff_metadata_rasterio(self, geotiff_file):
+        import rasterio
+
+        with rasterio.open(geotiff_file) as dataset:
+            return dataset.profile['width'], dataset.profile['height'], dataset.tags()['TIFFTAG_DATETIME']
+
     def get_geotiff_timestamp(self, geotiff_file):
-        dataset = rasterio.open(geotiff_file)
-        tags = dataset.tags()
-        return dataset.profile['width'], dataset.profile['height'], datetime.datetime.strptime(tags['TIFFTAG_DATETIME'],
-                                                                                               '%Y:%m:%d %H:%M:%S')
+        width, height, tiff_datetime = self.metadata_cache.get(geotiff_file, self.read_geotiff_metadata)
+        return width, height, datetime.datetime.strptime(tiff_datetime, '%Y:%m:%d %H:%M:%S')
+
+    def _timed_get_geotiff_timestamp(self, geotiff_file):
+        start = time.perf_counter()
+        metadata = self.get_geotiff_timestamp(geotiff_file)
+        return metadata, time.perf_counter() - start
+
+    def get_geotiff_timestamps(self, geotiff_files, workers=1, debug=False):
+        """Read get_geotiff_timestamp for all geotiff_files, in a pool of workers threads if workers > 1
+
+        The results are in the order of geotiff_files. The time spent per file is kept
+        in self.geotiff_timings as a list of (geotiff_file, seconds).
+        """
+        if workers > 1 and len(geotiff_files) > 1:
+            import concurrent.futures
+
+            with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+                results = list(executor.map(self._timed_get_geotiff_timestamp, geotiff_files))
+        else:
+            results = [self._timed_get_geotiff_timestamp(geotiff_file) for geotiff_file in geotiff_files]
+        self.geotiff_timings = [(geotiff_file, seconds) for geotiff_file, (_, seconds) in zip(geotiff_files, results)]
+        if debug:
+            for geotiff_file, seconds in self.geotiff_timings:
+                print("Read geotiff metadata from {} in {:.3f}s".format(geotiff_file, seconds))
+        return [metadata for metadata, _ in results]
+
+    def mapserver_geotiff_filename(self, mapserver_data_dir, geotiff_file, cog_files=None):
+        """Return the path mapserver reads geotiff_file from, its COG if there is one in cog_files"""
+        if cog_files and geotiff_file in cog_files:
+            return os.path.join(mapserver_data_dir, COG_SUBDIR, os.path.basename(cog_files[geotiff_file]))
+        return os.path.join(mapserver_data_dir, os.path.basename(geotiff_file))
+
+    def generate_render_data(self, server_name, mapserver_data_dir, map_output_file, input_data_files, config,
+                             workers=1, debug=False, cog_files=None):
+        """cog_files is a dict input file -> optimized file from cog_preprocess.optimize_geotiffs"""
+        data = {}
+        data['server_name'] = server_name
+        data['map_file_name'] = os.path.join(mapserver_data_dir, 'mapserver/map-files', map_output_file)
+        metadata = self.get_geotiff_timestamps(input_data_files, workers=workers, debug=debug)
+        # Assume width and height from the first geotiff file and the following the same
+        width, height, _ = metadata[0]
+        data['xsize'] = width
+        data['ysize'] = height
+        data['layers'] = []
+        matcher = compile_layer_config(config)
+        for file_layer, (_, _, geotiff_timestamp) in zip(input_data_files, metadata):
+            data['layers'].append(self._layer_record(matcher, mapserver_data_dir, file_layer, geotiff_timestamp,
+                                                     cog_files))
+        return data
 
-    def generate_render_data(self, server_name, mapserver_data_dir, map_output_file, input_data_files, config):
+    def _layer_record(self, matcher, mapserver_data_dir, file_layer, geotiff_timestamp, cog_files=None):
+        layer = {}
+        layer_config = matcher.match(file_layer)
+        layer['layer_name'] = layer_config['name']
+        layer['geotiff_filename'] = self.mapserver_geotiff_filename(mapserver_data_dir, file_layer, cog_files)
+        layer['layer_title'] = layer_config['title']
+        layer['geotiff_timestamp'] = geotiff_timestamp.strftime('%Y-%m-%dT%H:%M:%SZ')
+        return layer
+
+    def generate_layer_records(self, mapserver_data_dir, input_data_files, config, workers=1, cog_files=None,
+                               chunk_size=256):
+        """Yield the layers of generate_render_data one at a time.
+
+        The GeoTIFF metadata is read chunk_size files at a time, by workers
+        threads if workers > 1, so only one chunk of layers is in memory.
+        """
+        matcher = compile_layer_config(config)
+        executor = None
+        if workers > 1 and len(input_data_files) > 1:
+            import concurrent.futures
+
+            executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+        try:
+            for start in range(0, len(input_data_files), chunk_size):
+                chunk = input_data_files[start:start + chunk_size]
+                if executor is not None:
+                    metadata = executor.map(self.get_geotiff_timestamp, chunk)
+                else:
+                    metadata = map(self.get_geotiff_timestamp, chunk)
+                for file_layer, (_, _, geotiff_timestamp) in zip(chunk, metadata):
+                    yield self._layer_record(matcher, mapserver_data_dir, file_layer, geotiff_timestamp, cog_files)
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+    def generate_render_data_stream(self, server_name, mapserver_data_dir, map_output_file, input_data_files, config,
+                                    workers=1, cog_files=None, chunk_size=256):
+        """Render data like generate_render_data, with the layers as a generator from generate_layer_records.
+
+        Write it with write_map_file_stream. The layers can be iterated once,
+        so the template must loop over them only once.
+        """
         data = {}
         data['server_name'] = server_name
         data['map_file_name'] = os.path.join(mapserver_data_dir, 'mapserver/map-files', map_output_file)
@@ -158,21 +411,86 @@ class generate_mapserver_map_file():
         width, height, _ = self.get_geotiff_timestamp(input_data_files[0])
         data['xsize'] = width
         data['ysize'] = height
+        data['layers'] = self.generate_layer_records(mapserver_data_dir, input_data_files, config, workers=workers,
+                                                     cog_files=cog_files, chunk_size=chunk_size)
+        return data
+
+    def get_geotiff_bounds(self, geotiff_file):
+        """Return (minx, miny, maxx, maxy) of geotiff_file, with rasterio for files read_tiff_bounds can not handle"""
+        if self.use_tiff_header_reader:
+            try:
+                return read_tiff_bounds(geotiff_file)
+            except tiff_header_error:
+                pass
+        import rasterio
+
+        with rasterio.open(geotiff_file) as dataset:
+            return tuple(dataset.bounds)
+
+    def generate_time_index_render_data(self, server_name, mapserver_data_dir, map_output_file, input_data_files,
+                                        config, workers=1, debug=False, cog_files=None):
+        """Render data for one map file serving all input_data_files, with a TIME dimension per layer.
+
+        The files are grouped by their layer config. Each layer gets a tile index
+        with the footprint, location and time of its files, see write_tile_indexes.
+        The location is the optimized file for the files in cog_files.
+        """
+        data = {}
+        data['server_name'] = server_name
+        data['map_file_name'] = os.path.join(mapserver_data_dir, 'mapserver/map-files', map_output_file)
+        metadata = self.get_geotiff_timestamps(input_data_files, workers=workers, debug=debug)
+        if workers > 1 and len(input_data_files) > 1:
+            import concurrent.futures
+
+            with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+                bounds = list(executor.map(self.get_geotiff_bounds, input_data_files))
+        else:
+            bounds = [self.get_geotiff_bounds(geotiff_file) for geotiff_file in input_data_files]
+        width, height, _ = metadata[0]
+        data['xsize'] = width
+        data['ysize'] = height
         data['layers'] = []
-        for file_layer in input_data_files:
-            layer = {}
-            layer_config = match_input_file_with_layer_config(file_layer, config)
-            layer['layer_name'] = layer_config['name']
-            layer['geotiff_filename'] = os.path.join(mapserver_data_dir, os.path.basename(file_layer))
-            layer['layer_title'] = layer_config['title']
-            layer['geotiff_timestamp'] = self.get_geotiff_timestamp(file_layer)[2].strftime('%Y-%m-%dT%H:%M:%SZ')
-
-            data['layers'].append(layer)
+        matcher = compile_layer_config(config)
+        layers = {}
+        for file_layer, (_, _, geotiff_timestamp), file_bounds in zip(input_data_files, metadata, bounds):
+            layer_config = matcher.match(file_layer)
+            layer = layers.get(layer_config['name'])
+            if layer is None:
+                layer = {}
+                layer['layer_name'] = layer_config['name']
+                layer['layer_title'] = layer_config['title']
+                layer['tile_index_name'] = '{}-{}'.format(os.path.splitext(map_output_file)[0], layer_config['name'])
+                layer['tile_index'] = os.path.join(mapserver_data_dir, 'mapserver/tile-index',
+                                                   layer['tile_index_name'] + '.shp')
+                layer['records'] = []
+                layers[layer_config['name']] = layer
+                data['layers'].append(layer)
+            layer['records'].append((self.mapserver_geotiff_filename(mapserver_data_dir, file_layer, cog_files),
+                                     geotiff_timestamp.strftime('%Y-%m-%dT%H:%M:%SZ'), file_bounds))
+        for layer in data['layers']:
+            layer['records'].sort(key=lambda record: record[1])
+            times = sorted(set(record[1] for record in layer['records']))
+            layer['time_extent'] = ','.join(times)
+            layer['time_default'] = times[-1]
+            layer['extent'] = ' '.join(repr(value) for value in union_bounds([r[2] for r in layer['records']]))
         return data
 
+    def write_tile_indexes(self, tile_index_output_dir, data):
+        """Write the tile index of each layer in data from generate_time_index_render_data.
+
+        Returns the number of tile indexes written, unchanged indexes are not rewritten.
+        """
+        written = 0
+        for layer in data['layers']:
+            if write_tile_index(os.path.join(tile_index_output_dir, layer['tile_index_name']), layer['records']):
+                written += 1
+        return written
+
     def load_template(self, map_template_input_dir, map_template_file_name):
+        import jinja2
+
         try:
-            env = jinja2.Environment(loader=jinja2.FileSystemLoader(map_template_input_dir))
+            env = self.render_env.get_environment(map_template_input_dir)
         except TypeError:
             print("Could not find map template input dir. Please check this directory.")
             return None
@@ -185,8 +503,18 @@ class generate_mapserver_map_file():
         return t
 
     def write_map_file(self, map_file_output_dir, map_output_file, template, data):
-        with open(os.path.join(map_file_output_dir, map_output_file), 'w') as fh:
-            fh.write(template.render(data=data))
+        """Render and write the map file atomically. Returns False if the map file was unchanged."""
+        return write_if_changed(os.path.join(map_file_output_dir, map_output_file),
+                                template.render(data=data).encode('utf-8'))
+
+    def write_map_file_stream(self, map_file_output_dir, map_output_file, template, data, chunk_size=64 * 1024):
+        """Render and write the map file atomically in chunks of about chunk_size bytes, see write_map_file.
+
+        With data from generate_render_data_stream the map file is never in
+        memory as a whole, nor are the layers.
+        """
+        return write_chunks_if_changed(os.path.join(map_file_output_dir, map_output_file),
+                                       _encoded_chunks(template.generate(data=data), chunk_size))
 
 
 def main():  # pragma: no cover
@@ -203,17 +531,17 @@ def main():  # pragma: no cover
         fast_api = sys.argv[2]
     except IndexError:
         pass
+    layer_rules_file = None
+    try:
+        layer_rules_file = sys.argv[3]
+    except IndexError:
+        pass
     bn, netcdf_path = ewmxf.generate_uri(mmd_xml_file)
     xtree = ewmxf.open_mmd_xml_file(mmd_xml_file, ns)
     xroot = xtree.getroot()
     ewmxf.remove_wms_from_mmd_xml(xroot, ns)
-    layers_dict = {'iband': ['hr_overview', 'ir_window_channel'],
-                   'dnb': ['adaptive_dnb']}
-    layers = ['overview', 'ir_window_channel']
-    for layer in layers_dict:
-        if layer in bn:
-            layers = layers_dict[layer]
-            break
+    platform, instrument = ewmxf.get_platform_and_instrument_from_mmd_xml(xroot, ns)
+    layers = select_wms_layers(bn, load_wms_layer_rules(layer_rules_file), platform, instrument)
     ewmxf.add_wms_to_mmd_xml(xroot, os.path.join(fast_api, netcdf_path), layers)
     ewmxf.rewrite_mmd_xml(xtree, f'../{mmd_xml_file}')
 
@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2021, 2022
+
+# Author(s):
+
+#   Trygve Aspenes
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Cache of the GeoTIFF header values used to generate map files."""
+
+import os
+import time
+import threading
+import collections
+
+
+class geotiff_metadata_cache():
+    """Cache (width, height, TIFFTAG_DATETIME) per GeoTIFF file.
+
+    Entries are keyed on the absolute path and are only valid as long as the
+    file has the same mtime and size. The memory cache keeps the max_entries
+    most recently used files. With cache_file set, entries are also stored in
+    an sqlite database shared between runs, which is trimmed to
+    max_disk_entries by evict(). Changes to it are committed every
+    commit_every new or used entries and by close().
+    """
+
+    def __init__(self, max_entries=4096, cache_file=None, max_disk_entries=100000, commit_every=100):
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self.commit_every = commit_every
+        self.uncommitted = 0
+        self.cache = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.db = None
+        if cache_file:
+            import sqlite3
+
+            self.db = sqlite3.connect(cache_file, check_same_thread=False)
+            self.db.execute("CREATE TABLE IF NOT EXISTS geotiff_metadata (path TEXT PRIMARY KEY, "
+                            "mtime_ns INTEGER, size INTEGER, width INTEGER, height INTEGER, "
+                            "tiff_datetime TEXT, last_used REAL)")
+            self.db.commit()
+
+    def _stat(self, geotiff_file):
+        st = os.stat(geotiff_file)
+        return os.path.abspath(geotiff_file), st.st_mtime_ns, st.st_size
+
+    def _lookup(self, path, mtime_ns, size):
+        entry = self.cache.get(path)
+        if entry is not None and entry[0] == (mtime_ns, size):
+            self.cache.move_to_end(path)
+            return entry[1]
+        if self.db is None:
+            return None
+        row = self.db.execute("SELECT width, height, tiff_datetime FROM geotiff_metadata "
+                              "WHERE path = ? AND mtime_ns = ? AND size = ?", (path, mtime_ns, size)).fetchone()
+        if row is None:
+            return None
+        self.db.execute("UPDATE geotiff_metadata SET last_used = ? WHERE path = ?", (time.time(), path))
+        self._changed()
+        self._remember(path, mtime_ns, size, tuple(row))
+        return tuple(row)
+
+    def _changed(self):
+        self.uncommitted += 1
+        if self.uncommitted >= self.commit_every:
+            self.db.commit()
+            self.uncommitted = 0
+
+    def _remember(self, path, mtime_ns, size, metadata):
+        self.cache[path] = ((mtime_ns, size), metadata)
+        self.cache.move_to_end(path)
+        while len(self.cache) > self.max_entries:
+            self.cache.popitem(last=False)
+
+    def get(self, geotiff_file, read):
+        """Return (width, height, TIFFTAG_DATETIME) of geotiff_file.
+
+        read(geotiff_file) is called to read the header on a cache miss.
+        """
+        path, mtime_ns, size = self._stat(geotiff_file)
+        with self.lock:
+            metadata = self._lookup(path, mtime_ns, size)
+            if metadata is not None:
+                self.hits += 1
+                return metadata
+            self.misses += 1
+        metadata = tuple(read(geotiff_file))
+        with self.lock:
+            self._remember(path, mtime_ns, size, metadata)
+            if self.db is not None:
+                self.db.execute("INSERT OR REPLACE INTO geotiff_metadata VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                (path, mtime_ns, size) + metadata + (time.time(),))
+                self._changed()
+        return metadata
+
+    def evict(self):
+        """Trim the sqlite cache to the max_disk_entries most recently used files."""
+        if self.db is None:
+            return
+        with self.lock:
+            self.db.execute("DELETE FROM geotiff_metadata WHERE path NOT IN "
+                            "(SELECT path FROM geotiff_metadata ORDER BY last_used DESC LIMIT ?)",
+                            (self.max_disk_entries,))
+            self.db.commit()
+            self.uncommitted = 0
+
+    def close(self):
+        if self.db is not None:
+            self.evict()
+            self.db.close()
+            self.db = None
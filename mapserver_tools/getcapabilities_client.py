@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2021, 2022
+
+# Author(s):
+
+#   Trygve Aspenes
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Pooled and cached http client for GetCapabilities documents."""
+
+import os
+import json
+import time
+import asyncio
+import hashlib
+import threading
+import collections
+import concurrent.futures
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+class getcapabilities_client():
+    """Fetch GetCapabilities documents over one keep-alive session with a TTL/LRU cache.
+
+    Documents younger than ttl seconds are served from memory. Older ones are
+    revalidated with If-None-Match/If-Modified-Since when the server sent an
+    ETag or Last-Modified header. With cache_dir set the documents are also
+    persisted to disk, so later runs can revalidate instead of downloading.
+    """
+
+    def __init__(self, timeout=30, retries=3, backoff_factor=0.5, ttl=300, max_entries=128, cache_dir=None,
+                 pool_maxsize=10, session=None):
+        self.timeout = timeout
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.cache_dir = cache_dir
+        self.cache = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.revalidated = 0
+        self.downloads = 0
+        if session is None:
+            session = requests.Session()
+            retry = Retry(total=retries, backoff_factor=backoff_factor, status_forcelist=(500, 502, 503, 504))
+            adapter = HTTPAdapter(max_retries=retry, pool_connections=pool_maxsize, pool_maxsize=pool_maxsize)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+        self.session = session
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def _cache_file(self, resource):
+        return os.path.join(self.cache_dir, hashlib.sha256(resource.encode('utf-8')).hexdigest() + '.json')
+
+    def _load(self, resource):
+        with self.lock:
+            entry = self.cache.get(resource)
+            if entry is not None:
+                self.cache.move_to_end(resource)
+                return entry
+        if not self.cache_dir:
+            return None
+        try:
+            with open(self._cache_file(resource), 'r') as fh:
+                entry = json.load(fh)
+        except (FileNotFoundError, ValueError):
+            return None
+        if entry.get('resource') != resource:
+            return None
+        self._store(resource, entry, persist=False)
+        return entry
+
+    def _store(self, resource, entry, persist=True):
+        with self.lock:
+            self.cache[resource] = entry
+            self.cache.move_to_end(resource)
+            while len(self.cache) > self.max_entries:
+                self.cache.popitem(last=False)
+        if persist and self.cache_dir:
+            cache_file = self._cache_file(resource)
+            tmp_file = '{}.{}.tmp'.format(cache_file, os.getpid())
+            with open(tmp_file, 'w') as fh:
+                json.dump(entry, fh)
+            os.replace(tmp_file, cache_file)
+
+    def get(self, resource):
+        """Return the text of the GetCapabilities document at resource."""
+        entry = self._load(resource)
+        now = time.time()
+        if entry is not None and now - entry['fetched'] < self.ttl:
+            self.hits += 1
+            return entry['text']
+
+        headers = {}
+        if entry is not None:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+        response = self.session.get(resource, headers=headers, timeout=self.timeout)
+        if response.status_code == 304 and entry is not None:
+            self.revalidated += 1
+            entry = dict(entry, fetched=now)
+            self._store(resource, entry)
+            return entry['text']
+        response.raise_for_status()
+        self.downloads += 1
+        entry = {'resource': resource,
+                 'text': response.text,
+                 'etag': response.headers.get('ETag'),
+                 'last_modified': response.headers.get('Last-Modified'),
+                 'fetched': now}
+        self._store(resource, entry)
+        return entry['text']
+
+    def invalidate(self, resource=None):
+        """Drop resource, or everything, from the memory cache."""
+        with self.lock:
+            if resource is None:
+                self.cache.clear()
+            else:
+                self.cache.pop(resource, None)
+
+    def close(self):
+        self.session.close()
+
+
+async def read_layers_many_async(resources, read_layers, concurrency=20, per_host=4, executor=None):
+    """Run read_layers for all resources concurrently.
+
+    At most concurrency requests are in flight in total and at most per_host
+    to the same host. Returns a dict resource -> layers and a dict
+    resource -> exception for the resources that failed.
+    """
+    loop = asyncio.get_event_loop()
+    own_executor = executor is None
+    if own_executor:
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=concurrency)
+    total = asyncio.Semaphore(concurrency)
+    hosts = {}
+    layers = {}
+    errors = {}
+
+    async def fetch(resource):
+        host = hosts.setdefault(urlsplit(resource).netloc, asyncio.Semaphore(per_host))
+        async with host:
+            async with total:
+                try:
+                    layers[resource] = await loop.run_in_executor(executor, read_layers, resource)
+                except Exception as exc:
+                    errors[resource] = exc
+
+    try:
+        await asyncio.gather(*[fetch(resource) for resource in collections.OrderedDict.fromkeys(resources)])
+    finally:
+        if own_executor:
+            executor.shutdown(wait=False)
+    return layers, errors
+
+
+def read_layers_many(resources, read_layers, concurrency=20, per_host=4):
+    """Blocking wrapper around read_layers_many_async running its own event loop."""
+    loop = asyncio.new_event_loop()
+    try:
+        asyncio.set_event_loop(loop)
+        return loop.run_until_complete(read_layers_many_async(resources, read_layers, concurrency, per_host))
+    finally:
+        asyncio.set_event_loop(None)
+        loop.close()
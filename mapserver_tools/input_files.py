@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2021, 2022
+
+# Author(s):
+
+#   Trygve Aspenes
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Expand the input arguments of the scripts to lists of files."""
+
+import os
+import glob
+import fnmatch
+
+
+def collect_input_files(inputs, pattern='*'):
+    """Expand a list of files, directories and glob patterns to a list of files.
+
+    Directories are searched recursively for files matching pattern. The order
+    of the inputs is kept and duplicates are dropped.
+    """
+    input_files = []
+    for item in inputs:
+        if os.path.isdir(item):
+            found = []
+            for root, _, files in os.walk(item):
+                found.extend(os.path.join(root, f) for f in fnmatch.filter(files, pattern))
+            input_files.extend(sorted(found))
+        elif glob.has_magic(item):
+            input_files.extend(sorted(glob.glob(item, recursive=True)))
+        else:
+            input_files.append(item)
+    seen = set()
+    return [f for f in input_files if not (f in seen or seen.add(f))]
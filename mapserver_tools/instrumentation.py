@@ -0,0 +1,236 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2021, 2022
+
+# Author(s):
+
+#   Trygve Aspenes
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Per stage timing of the public methods of edit_wms_mmd_xml_files, generate_mapserver_map_file
+and mmd_document_processor.
+
+instrument() replaces the public methods of the classes with wrappers that
+count calls and errors and record the latency in a histogram, one stage per
+method, eg. edit_wms_mmd_xml_files.open_mmd_xml_file. Nothing is wrapped
+until instrument() is called, so there is no overhead when it is not used.
+Stages of methods calling each other overlap, eg. generate_render_data
+includes get_geotiff_timestamps.
+
+Only the calling process is measured, batch runs with worker processes only
+report the work done in the main process.
+"""
+
+import sys
+import time
+import types
+import threading
+import functools
+import contextlib
+
+from mapserver_tools.atomic_write import write_if_changed
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class stage_metrics():
+    """Call and error counters and latency histograms per stage."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.stages = {}
+        self.lock = threading.Lock()
+        self.patched = []
+
+    def observe(self, stage, seconds, error=False):
+        with self.lock:
+            entry = self.stages.get(stage)
+            if entry is None:
+                entry = {'count': 0, 'errors': 0, 'sum': 0.0, 'max': 0.0, 'buckets': [0] * len(self.buckets)}
+                self.stages[stage] = entry
+            entry['count'] += 1
+            entry['sum'] += seconds
+            if seconds > entry['max']:
+                entry['max'] = seconds
+            if error:
+                entry['errors'] += 1
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    entry['buckets'][i] += 1
+                    break
+
+    def summary(self):
+        """Return the stages as a dict, with cumulative bucket counts like Prometheus."""
+        with self.lock:
+            stages = {}
+            for stage, entry in sorted(self.stages.items()):
+                cumulative = []
+                total = 0
+                for count in entry['buckets']:
+                    total += count
+                    cumulative.append(total)
+                stages[stage] = {'count': entry['count'],
+                                 'errors': entry['errors'],
+                                 'sum': entry['sum'],
+                                 'mean': entry['sum'] / entry['count'],
+                                 'max': entry['max'],
+                                 'buckets': dict(zip([repr(b) for b in self.buckets], cumulative))}
+        return {'stages': stages}
+
+    def write_json(self, json_file):
+        import json
+
+        with open(json_file, 'w') as fh:
+            json.dump(self.summary(), fh, indent=2, sort_keys=True)
+
+    def prometheus_text(self, prefix='mapserver_tools'):
+        lines = ['# HELP {}_stage_seconds Time spent in each stage.'.format(prefix),
+                 '# TYPE {}_stage_seconds histogram'.format(prefix)]
+        stages = self.summary()['stages']
+        for stage, entry in stages.items():
+            for bound, count in entry['buckets'].items():
+                lines.append('{}_stage_seconds_bucket{{stage="{}",le="{}"}} {}'.format(prefix, stage, bound, count))
+            lines.append('{}_stage_seconds_bucket{{stage="{}",le="+Inf"}} {}'.format(prefix, stage, entry['count']))
+            lines.append('{}_stage_seconds_sum{{stage="{}"}} {!r}'.format(prefix, stage, entry['sum']))
+            lines.append('{}_stage_seconds_count{{stage="{}"}} {}'.format(prefix, stage, entry['count']))
+        lines.append('# HELP {}_stage_errors_total Calls of each stage that raised an exception.'.format(prefix))
+        lines.append('# TYPE {}_stage_errors_total counter'.format(prefix))
+        for stage, entry in stages.items():
+            lines.append('{}_stage_errors_total{{stage="{}"}} {}'.format(prefix, stage, entry['errors']))
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, textfile, prefix='mapserver_tools'):
+        """Write the metrics for the node exporter textfile collector, replacing the file atomically."""
+        write_if_changed(textfile, self.prometheus_text(prefix).encode('utf-8'))
+
+    def print_summary(self, file=None):
+        stages = self.summary()['stages']
+        print("{:<60} {:>8} {:>6} {:>10} {:>10} {:>10}".format('stage', 'calls', 'errors', 'total s', 'mean ms',
+                                                               'max ms'), file=file)
+        for stage, entry in sorted(stages.items(), key=lambda item: -item[1]['sum']):
+            print("{:<60} {:>8} {:>6} {:>10.3f} {:>10.3f} {:>10.3f}".format(
+                stage, entry['count'], entry['errors'], entry['sum'], entry['mean'] * 1e3, entry['max'] * 1e3),
+                file=file)
+
+
+def _timed(stage, function, metrics):
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        error = True
+        try:
+            result = function(*args, **kwargs)
+            error = False
+            return result
+        finally:
+            metrics.observe(stage, time.perf_counter() - start, error)
+    wrapper.__wrapped_stage__ = stage
+    return wrapper
+
+
+def default_classes():
+    from mapserver_tools.edit_wms_mmd_xml_files import edit_wms_mmd_xml_files
+    from mapserver_tools.edit_wms_mmd_xml_files import generate_mapserver_map_file
+    from mapserver_tools.mmd_document_processor import mmd_document_processor
+    return (edit_wms_mmd_xml_files, generate_mapserver_map_file, mmd_document_processor)
+
+
+def instrument(classes=None, metrics=None):
+    """Wrap the public methods of classes to record their timing in metrics. Returns metrics."""
+    if metrics is None:
+        metrics = stage_metrics()
+    if classes is None:
+        classes = default_classes()
+    for cls in classes:
+        for name, function in list(vars(cls).items()):
+            if name.startswith('_') or not isinstance(function, types.FunctionType):
+                continue
+            if hasattr(function, '__wrapped_stage__'):
+                continue
+            setattr(cls, name, _timed('{}.{}'.format(cls.__name__, name), function, metrics))
+            metrics.patched.append((cls, name, function))
+    return metrics
+
+
+def uninstrument(metrics):
+    """Restore the methods wrapped by instrument(metrics=metrics)."""
+    for cls, name, function in reversed(metrics.patched):
+        setattr(cls, name, function)
+    metrics.patched = []
+
+
+@contextlib.contextmanager
+def profiling(profile_file=None, tracemalloc_top=0, file=None):
+    """Run the block under cProfile, stats dumped to profile_file, and/or tracemalloc, top allocations printed."""
+    profiler = None
+    if profile_file:
+        import cProfile
+        profiler = cProfile.Profile()
+    if tracemalloc_top:
+        import tracemalloc
+        tracemalloc.start()
+    if profiler is not None:
+        profiler.enable()
+    try:
+        yield
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(profile_file)
+            print("Wrote profile to {}".format(profile_file), file=file)
+        if tracemalloc_top:
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print("Memory current {:.1f} MiB, peak {:.1f} MiB. Top allocations:".format(current / 2**20,
+                                                                                        peak / 2**20), file=file)
+            for stat in snapshot.statistics('lineno')[:tracemalloc_top]:
+                print("  {}".format(stat), file=file)
+
+
+def add_instrumentation_arguments(parser):
+    """Add the --metrics-json, --metrics-prometheus, --metrics, --profile and --tracemalloc options to parser."""
+    group = parser.add_argument_group('instrumentation')
+    group.add_argument("--metrics", action='store_true', help="Print the time spent per stage at the end.")
+    group.add_argument("--metrics-json", help="Write the time spent per stage as JSON to this file.")
+    group.add_argument("--metrics-prometheus", help="Write the time spent per stage as a Prometheus textfile.")
+    group.add_argument("--profile", help="Run under cProfile and write the stats to this file.")
+    group.add_argument("--tracemalloc", type=int, default=0, metavar='N',
+                       help="Trace memory allocations and print the N largest.")
+    return group
+
+
+@contextlib.contextmanager
+def instrumentation_from_args(cmd_args, classes=None):
+    """Instrument the block as asked for by the options of add_instrumentation_arguments.
+
+    Yields the stage_metrics, or None when no metrics were asked for.
+    """
+    metrics = None
+    if cmd_args.metrics or cmd_args.metrics_json or cmd_args.metrics_prometheus:
+        metrics = instrument(classes)
+    try:
+        with profiling(cmd_args.profile, cmd_args.tracemalloc, file=sys.stderr):
+            yield metrics
+    finally:
+        if metrics is not None:
+            uninstrument(metrics)
+            if cmd_args.metrics:
+                metrics.print_summary(file=sys.stderr)
+            if cmd_args.metrics_json:
+                metrics.write_json(cmd_args.metrics_json)
+            if cmd_args.metrics_prometheus:
+                metrics.write_prometheus(cmd_args.metrics_prometheus)
@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2021, 2022
+
+# Author(s):
+
+#   Trygve Aspenes
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Match input file names to the layers of a layer config.
+
+A layer config is the dict read by read_yaml_config_file, eg:
+
+layers:
+  - match: overview
+    name: 'Overview'
+    title: 'Overview'
+  - regex: '^natural_(with|without)_night_fog_'
+    name: natural_with_night_fog
+    title: 'Natural with night fog'
+
+Layers with match are prefixes of the file basename and the longest
+matching prefix wins. Layers with regex are tried in config order with
+re.match when no prefix matches.
+"""
+
+import os
+import re
+
+
+# id(config) -> layer_matcher, see get_layer_matcher
+_matchers = {}
+_max_matchers = 64
+
+
+class layer_config_match_error(ValueError):
+    pass
+
+
+class layer_matcher():
+    """Index of a layer config, built once and reused for any number of files."""
+
+    def __init__(self, config):
+        self.config = config
+        self.prefixes = {}
+        self.regexes = []
+        for layer in config['layers']:
+            if 'match' in layer:
+                # Keep the first layer for duplicate prefixes, like the linear scan did
+                self.prefixes.setdefault(layer['match'], layer)
+            elif 'regex' in layer:
+                self.regexes.append((re.compile(layer['regex']), layer))
+            else:
+                raise layer_config_match_error("Layer config entry without match or regex: {}".format(layer))
+        self.lengths = sorted(set(len(prefix) for prefix in self.prefixes), reverse=True)
+
+    def match(self, input_file):
+        """Return the layer config of input_file, raise layer_config_match_error if there is none."""
+        return self.split(input_file)[0]
+
+    def split(self, input_file):
+        """Return the layer config of input_file and the rest of the basename after the matched part."""
+        basename = os.path.basename(input_file)
+        for length in self.lengths:
+            if length <= len(basename):
+                layer = self.prefixes.get(basename[:length])
+                if layer is not None:
+                    return layer, basename[length:]
+        for regex, layer in self.regexes:
+            m = regex.match(basename)
+            if m:
+                return layer, basename[m.end():]
+        raise layer_config_match_error("Could not find matching layer config to the input file {}. "
+                                       "Fix your layer config.".format(basename))
+
+
+def compile_layer_config(config):
+    """Return a layer_matcher for config, which may already be a layer_matcher."""
+    if isinstance(config, layer_matcher):
+        return config
+    return layer_matcher(config)
+
+
+def get_layer_matcher(config):
+    """Return a layer_matcher for config, compiled once per config object.
+
+    Changes to config after the first call are not seen, pass a new dict or use compile_layer_config.
+    """
+    if isinstance(config, layer_matcher):
+        return config
+    matcher = _matchers.get(id(config))
+    if matcher is None or matcher.config is not config:
+        if len(_matchers) >= _max_matchers:
+            _matchers.clear()
+        matcher = layer_matcher(config)
+        _matchers[id(config)] = matcher
+    return matcher
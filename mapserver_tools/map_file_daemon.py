@@ -0,0 +1,284 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2021, 2022
+
+# Author(s):
+
+#   Trygve Aspenes
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Long running map file generator watching directories for incoming GeoTIFF files.
+
+Incoming files are matched against the layer config and grouped into
+products by the part of the file name after the layer match, eg.
+overview_20210910_123318.tif and natural_with_night_fog_20210910_123318.tif
+both belong to product 20210910_123318. A product is rendered when a file
+for every layer in the config has arrived and no new file came for settle
+seconds, or with the files it has when timeout seconds passed since its
+last file. A file arriving again for a product that was already rendered,
+eg. a reprocessed one, is rendered together with the other files of the
+product, kept in memory for recent products and taken from the catalog for
+older ones.
+"""
+
+import os
+import time
+import errno
+import struct
+import select
+import ctypes
+import ctypes.util
+import fnmatch
+import collections
+
+from mapserver_tools.cog_preprocess import optimize_geotiffs
+from mapserver_tools.layer_matcher import compile_layer_config
+from mapserver_tools.product_catalog import geotiffs_from_render_data
+from mapserver_tools.product_catalog import map_file_settings
+from mapserver_tools.layer_matcher import layer_config_match_error
+from mapserver_tools.edit_wms_mmd_xml_files import generate_mapserver_map_file
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = os.O_CLOEXEC
+
+_inotify_event = struct.Struct('iIII')
+
+
+class polling_watcher():
+    """Report new or changed files by comparing directory listings."""
+
+    def __init__(self, directories, pattern='*.tif', scan_existing=False):
+        self.directories = directories
+        self.pattern = pattern
+        self.snapshot = {} if scan_existing else self._scan()
+
+    def _scan(self):
+        snapshot = {}
+        for directory in self.directories:
+            try:
+                entries = list(os.scandir(directory))
+            except FileNotFoundError:
+                continue
+            for entry in entries:
+                if entry.is_file() and fnmatch.fnmatch(entry.name, self.pattern):
+                    st = entry.stat()
+                    snapshot[entry.path] = (st.st_mtime_ns, st.st_size)
+        return snapshot
+
+    def wait(self, timeout):
+        """Return the files that are new or changed since the last call, after sleeping timeout seconds."""
+        if timeout:
+            time.sleep(timeout)
+        snapshot = self._scan()
+        changed = sorted(path for path, stat in snapshot.items() if self.snapshot.get(path) != stat)
+        self.snapshot = snapshot
+        return changed
+
+    def close(self):
+        pass
+
+
+class inotify_watcher():
+    """Report files closed after writing or moved into the directories, using Linux inotify."""
+
+    def __init__(self, directories, pattern='*.tif', scan_existing=False):
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.pattern = pattern
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.watches = {}
+        for directory in directories:
+            wd = libc.inotify_add_watch(self.fd, os.fsencode(directory), IN_CLOSE_WRITE | IN_MOVED_TO)
+            if wd < 0:
+                err = ctypes.get_errno()
+                os.close(self.fd)
+                raise OSError(err, "inotify_add_watch failed for {}".format(directory))
+            self.watches[wd] = directory
+        self.pending = []
+        if scan_existing:
+            self.pending = polling_watcher(directories, pattern, scan_existing=True).wait(0)
+
+    def wait(self, timeout):
+        changed, self.pending = self.pending, []
+        readable, _, _ = select.select([self.fd], [], [], 0 if changed else timeout)
+        if not readable:
+            return changed
+        try:
+            buf = os.read(self.fd, 64 * 1024)
+        except OSError as exc:
+            if exc.errno == errno.EAGAIN:
+                return changed
+            raise
+        offset = 0
+        while offset < len(buf):
+            wd, _, _, length = _inotify_event.unpack_from(buf, offset)
+            offset += _inotify_event.size
+            name = os.fsdecode(buf[offset:offset + length].rstrip(b'\0'))
+            offset += length
+            if wd in self.watches and fnmatch.fnmatch(name, self.pattern):
+                changed.append(os.path.join(self.watches[wd], name))
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+
+def create_watcher(directories, pattern='*.tif', scan_existing=False, use_inotify=True):
+    """Return an inotify_watcher if possible, else a polling_watcher."""
+    if use_inotify and hasattr(os, 'O_CLOEXEC'):
+        try:
+            return inotify_watcher(directories, pattern, scan_existing)
+        except (OSError, AttributeError) as exc:
+            print("Could not use inotify, falling back to polling: {}".format(exc))
+    return polling_watcher(directories, pattern, scan_existing)
+
+
+class map_file_generator_service():
+    """Render map files for products as their GeoTIFF files arrive, from one warm process."""
+
+    def __init__(self, watcher, config, server_name, mapserver_data_dir, map_file_output_dir,
+                 map_template_input_dir, map_template_file_name, map_output_file='mapserver-{product}.map',
+                 settle=5.0, timeout=600.0, workers=1, gmmf=None, clock=time.monotonic, cog_output_dir=None,
+                 cog_workers=1, catalog=None, max_rendered_products=1000):
+        self.watcher = watcher
+        self.config = config
+        self.matcher = compile_layer_config(config)
+        self.expected_layers = set(layer['name'] for layer in config['layers'])
+        self.layer_order = {}
+        for i, layer in enumerate(config['layers']):
+            self.layer_order.setdefault(layer['name'], i)
+        self.server_name = server_name
+        self.mapserver_data_dir = mapserver_data_dir
+        self.map_file_output_dir = map_file_output_dir
+        self.map_template_input_dir = map_template_input_dir
+        self.map_template_file_name = map_template_file_name
+        self.map_output_file = map_output_file
+        self.settle = settle
+        self.timeout = timeout
+        self.workers = workers
+        self.gmmf = gmmf if gmmf is not None else generate_mapserver_map_file()
+        self.clock = clock
+        # Directory for the optimized GeoTIFFs, see cog_preprocess. None to use the files as they are
+        self.cog_output_dir = cog_output_dir
+        self.cog_workers = cog_workers
+        # Optional product_catalog recording the map files and their GeoTIFF files
+        self.catalog = catalog
+        # product -> {'files': {layer name: geotiff file}, 'last_seen': clock time}
+        self.products = {}
+        self.rendered = []
+        # product -> {layer name: geotiff file} of the last rendering, for files that arrive again later.
+        # Older products are looked up in the catalog
+        self.rendered_files = collections.OrderedDict()
+        self.max_rendered_products = max_rendered_products
+
+    def product_of(self, geotiff_file):
+        layer, rest = self.matcher.split(geotiff_file)
+        product, _ = os.path.splitext(rest)
+        return layer, product.strip('_-.')
+
+    def add_file(self, geotiff_file):
+        try:
+            layer, product = self.product_of(geotiff_file)
+        except layer_config_match_error as exc:
+            print("Ignoring {}: {}".format(geotiff_file, exc))
+            return
+        entry = self.products.get(product)
+        if entry is None:
+            # A file of a product that was rendered before joins the files it was rendered with
+            entry = self.products[product] = {'files': self.previous_files(product), 'last_seen': None}
+        entry['files'][layer['name']] = geotiff_file
+        entry['last_seen'] = self.clock()
+
+    def previous_files(self, product):
+        """Return {layer name: geotiff file} of the last map file of product that still exist."""
+        files = self.rendered_files.get(product)
+        if files is None and self.catalog is not None:
+            files = {}
+            map_file = os.path.join(self.map_file_output_dir, self.map_output_file.format(product=product))
+            for row in self.catalog.query_map_file(map_file):
+                try:
+                    layer, _ = self.product_of(row['path'])
+                except layer_config_match_error:
+                    continue
+                files[layer['name']] = row['path']
+        return dict((name, f) for name, f in (files or {}).items() if os.path.exists(f))
+
+    def due_products(self):
+        now = self.clock()
+        due = []
+        for product, entry in self.products.items():
+            idle = now - entry['last_seen']
+            complete = self.expected_layers.issubset(entry['files'])
+            if (complete and idle >= self.settle) or idle >= self.timeout:
+                due.append(product)
+        return sorted(due)
+
+    def render_product(self, product):
+        entry = self.products.pop(product)
+        input_data_files = sorted(entry['files'].values(),
+                                  key=lambda f: self.layer_order[self.matcher.match(f)['name']])
+        map_output_file = self.map_output_file.format(product=product)
+        template = self.gmmf.load_template(self.map_template_input_dir, self.map_template_file_name)
+        if template is None:
+            return None
+        cog_files = None
+        if self.cog_output_dir:
+            cog_files, _ = optimize_geotiffs(input_data_files, self.cog_output_dir, workers=self.cog_workers)
+        data = self.gmmf.generate_render_data(self.server_name, self.mapserver_data_dir, map_output_file,
+                                              input_data_files, self.matcher, workers=self.workers,
+                                              cog_files=cog_files)
+        if self.gmmf.write_map_file(self.map_file_output_dir, map_output_file, template, data):
+            print("Wrote map file {}".format(map_output_file))
+        else:
+            print("Map file {} unchanged".format(map_output_file))
+        if self.catalog is not None:
+            settings = map_file_settings(self.server_name, self.mapserver_data_dir,
+                                         os.path.join(self.map_template_input_dir, self.map_template_file_name),
+                                         self.config, self.cog_output_dir)
+            self.catalog.record_map_file(os.path.join(self.map_file_output_dir, map_output_file),
+                                         geotiffs_from_render_data(input_data_files, data), settings)
+        self.rendered_files[product] = dict(entry['files'])
+        self.rendered_files.move_to_end(product)
+        while len(self.rendered_files) > self.max_rendered_products:
+            self.rendered_files.popitem(last=False)
+        self.rendered.append(map_output_file)
+        return map_output_file
+
+    def run_once(self, wait=1.0):
+        """Collect new files, waiting up to wait seconds, and render the products that are due."""
+        for geotiff_file in self.watcher.wait(wait):
+            self.add_file(geotiff_file)
+        rendered = []
+        for product in self.due_products():
+            try:
+                map_output_file = self.render_product(product)
+            except Exception as exc:
+                print("Failed to render map file for product {}: {}".format(product, exc))
+                continue
+            if map_output_file:
+                rendered.append(map_output_file)
+        return rendered
+
+    def run(self, stop=None, wait=1.0):
+        """Run until stop() returns True."""
+        try:
+            while stop is None or not stop():
+                self.run_once(wait)
+        finally:
+            self.watcher.close()
@@ -0,0 +1,201 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2021, 2022
+
+# Author(s):
+
+#   Trygve Aspenes
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Generate mapcache.xml and a seeding plan from map file render data.
+
+The render data is what generate_render_data or
+generate_time_index_render_data return. Every layer becomes a mapcache
+source pointing at its map file and a tileset with a TIME dimension holding
+the times of the layer.
+
+The seeding plan lists one mapcache_seed run per tileset, grid, zoom level
+and time, newest times and lowest zoom levels first, so the tiles users look
+at first are cached first. run_seeding_plan runs it with a bounded number of
+mapcache_seed processes.
+"""
+
+import os
+import time
+import subprocess
+import concurrent.futures
+import xml.etree.ElementTree as et
+
+from mapserver_tools.atomic_write import write_if_changed
+
+
+def _indent(elem, level=0):
+    pad = '\n' + level * '  '
+    if len(elem):
+        if not elem.text or not elem.text.strip():
+            elem.text = pad + '  '
+        for child in elem:
+            _indent(child, level + 1)
+        if not child.tail or not child.tail.strip():
+            child.tail = pad
+    if level and (not elem.tail or not elem.tail.strip()):
+        elem.tail = pad
+
+
+def layer_times(layer):
+    """Return the sorted times of a layer in render data."""
+    if 'time_extent' in layer:
+        return sorted(layer['time_extent'].split(','))
+    return [layer['geotiff_timestamp']]
+
+
+def collect_tilesets(render_data, tileset_name='{layer_name}'):
+    """Return tileset descriptions for the layers in a list of render data.
+
+    tileset_name is formatted with layer_name and map_file, the map file name
+    without directory and extension. Layers of different map files with the
+    same tileset name are merged when they point at the same map file, else a
+    ValueError is raised.
+    """
+    tilesets = {}
+    for data in render_data:
+        map_file = os.path.splitext(os.path.basename(data['map_file_name']))[0]
+        for layer in data['layers']:
+            name = tileset_name.format(layer_name=layer['layer_name'], map_file=map_file)
+            tileset = tilesets.get(name)
+            if tileset is None:
+                tilesets[name] = {'name': name,
+                                  'layer_name': layer['layer_name'],
+                                  'title': layer['layer_title'],
+                                  'map_file_name': data['map_file_name'],
+                                  'times': layer_times(layer)}
+            elif tileset['map_file_name'] != data['map_file_name']:
+                raise ValueError("Tileset {} is in both {} and {}, use a tileset_name with map_file".format(
+                    name, tileset['map_file_name'], data['map_file_name']))
+            else:
+                tileset['times'] = sorted(set(tileset['times']) | set(layer_times(layer)))
+    return [tilesets[name] for name in sorted(tilesets)]
+
+
+def generate_mapcache_config(tilesets, mapserver_url, mapcache_url=None, title='Satellite data',
+                             cache_base='/data/mapcache', grids=('WGS84', 'GoogleMapsCompatible'),
+                             image_format='mixed'):
+    """Return the mapcache config for tilesets from collect_tilesets as an ElementTree Element."""
+    mapcache = et.Element('mapcache')
+    metadata = et.SubElement(mapcache, 'metadata')
+    et.SubElement(metadata, 'title').text = title
+    if mapcache_url:
+        et.SubElement(metadata, 'url').text = mapcache_url
+
+    # The template element is only used by disk caches with the template layout
+    cache = et.SubElement(mapcache, 'cache', name='disk', type='disk', layout='template')
+    et.SubElement(cache, 'base').text = cache_base
+    et.SubElement(cache, 'template').text = os.path.join(cache_base, '{tileset}#{grid}#{dim}/{z}/{x}/{y}.{ext}')
+
+    for tileset in tilesets:
+        source = et.SubElement(mapcache, 'source', name=tileset['name'], type='wms')
+        http = et.SubElement(source, 'http')
+        et.SubElement(http, 'url').text = mapserver_url
+        params = et.SubElement(et.SubElement(source, 'getmap'), 'params')
+        et.SubElement(params, 'FORMAT').text = 'image/png'
+        et.SubElement(params, 'LAYERS').text = tileset['layer_name']
+        et.SubElement(params, 'MAP').text = tileset['map_file_name']
+
+    for tileset in tilesets:
+        ts = et.SubElement(mapcache, 'tileset', name=tileset['name'])
+        et.SubElement(et.SubElement(ts, 'metadata'), 'title').text = tileset['title']
+        et.SubElement(ts, 'source').text = tileset['name']
+        et.SubElement(ts, 'cache').text = 'disk'
+        et.SubElement(ts, 'format').text = image_format
+        for grid in grids:
+            et.SubElement(ts, 'grid').text = grid
+        dimension = et.SubElement(et.SubElement(ts, 'dimensions'), 'dimension',
+                                  type='values', name='TIME', default=tileset['times'][-1])
+        for value in tileset['times']:
+            et.SubElement(dimension, 'value').text = value
+
+    et.SubElement(mapcache, 'service', type='wms', enabled='true')
+    et.SubElement(mapcache, 'service', type='wmts', enabled='true')
+    et.SubElement(mapcache, 'log_level').text = 'warn'
+    _indent(mapcache)
+    return mapcache
+
+
+def write_mapcache_config(mapcache_xml, mapcache):
+    """Write the mapcache config atomically. Returns False if the file was unchanged."""
+    content = b'<?xml version="1.0" encoding="UTF-8"?>\n' + et.tostring(mapcache, encoding='UTF-8') + b'\n'
+    return write_if_changed(mapcache_xml, content)
+
+
+def seeding_plan(tilesets, zoom_levels=range(0, 6), grids=('WGS84', 'GoogleMapsCompatible'), max_times=None):
+    """Return the seeding jobs for tilesets, most important first.
+
+    Newest times come first, then lower zoom levels, so the tiles most users
+    ask for are cached first. With max_times only the newest max_times times
+    of each tileset are seeded. Each job is a dict with tileset, grid, zoom,
+    time and priority, a running number starting at 0.
+    """
+    jobs = []
+    for tileset in tilesets:
+        times = sorted(tileset['times'], reverse=True)
+        if max_times is not None:
+            times = times[:max_times]
+        for time_rank, value in enumerate(times):
+            for zoom in zoom_levels:
+                for grid_rank, grid in enumerate(grids):
+                    jobs.append((time_rank, zoom, tileset['name'], grid_rank, grid, value))
+    jobs.sort()
+    return [{'tileset': tileset, 'grid': grid, 'zoom': zoom, 'time': value, 'priority': priority}
+            for priority, (_, zoom, tileset, _, grid, value) in enumerate(jobs)]
+
+
+def seed_command(job, mapcache_xml, threads=2, mapcache_seed='mapcache_seed'):
+    """Return the mapcache_seed command line for a seeding job."""
+    return [mapcache_seed, '-c', mapcache_xml, '-t', job['tileset'], '-g', job['grid'],
+            '-z', '{0},{0}'.format(job['zoom']), '-D', 'TIME={}'.format(job['time']),
+            '-n', str(threads), '-m', 'seed']
+
+
+def run_seeding_plan(plan, mapcache_xml, jobs=4, threads=2, dry_run=False, mapcache_seed='mapcache_seed',
+                     run=subprocess.run):
+    """Run the seeding plan with at most jobs mapcache_seed processes at a time.
+
+    Jobs are started in plan order. Returns a list of (job, returncode,
+    seconds) in plan order, with returncode None for a dry run, which only
+    prints the commands.
+    """
+    commands = [seed_command(job, mapcache_xml, threads, mapcache_seed) for job in plan]
+    if dry_run:
+        for command in commands:
+            print(' '.join(command))
+        return [(job, None, 0.0) for job in plan]
+
+    def _run(command):
+        start = time.perf_counter()
+        try:
+            returncode = run(command).returncode
+        except OSError as exc:
+            print("Could not run {}: {}".format(command[0], exc))
+            returncode = -1
+        return returncode, time.perf_counter() - start
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+        results = list(executor.map(_run, commands))
+    for job, (returncode, _) in zip(plan, results):
+        if returncode != 0:
+            print("Seeding {} {} zoom {} time {} failed with {}".format(
+                job['tileset'], job['grid'], job['zoom'], job['time'], returncode))
+    return [(job, returncode, seconds) for job, (returncode, seconds) in zip(plan, results)]
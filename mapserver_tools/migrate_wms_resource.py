@@ -0,0 +1,335 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2021, 2022
+
+# Author(s):
+
+#   Trygve Aspenes
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Re-point the OGC WMS resource of a whole mmd archive to a new server.
+
+Only the start of the mmd:resource of the OGC WMS data_access made by
+add_wms_to_mmd_xml is replaced, old_prefix by new_prefix. The document is
+parsed to find the resources to change, and the prefix is then replaced in
+the bytes of the file, so everything else, the xml declaration, comments and
+namespace declarations included, is kept as it is. Files without old_prefix
+in them are skipped without being parsed.
+
+Optionally the wms_layers are selected again with the layer rules. That
+rewrites the whole document through the xml backend, which drops the xml
+declaration, comments and unused namespace declarations.
+
+The files are migrated by a pool of worker processes. With a checkpoint file
+every finished file is appended to it, and files already in it are skipped
+when the migration is run again, so an interrupted migration resumes where
+it stopped. The first line of the checkpoint holds the prefixes, a
+checkpoint of another migration is refused. With dry_run nothing is written
+and the diffs of the first files are returned.
+"""
+
+import io
+import os
+import re
+import sys
+import time
+import difflib
+
+from mapserver_tools.atomic_write import write_if_changed
+from mapserver_tools.mmd_document_processor import MMD_NS
+from mapserver_tools.mmd_document_processor import get_mmd_document_processor
+from mapserver_tools.edit_wms_mmd_xml_files import select_wms_layers
+from mapserver_tools.stream_wms_mmd_xml_files import escape
+from mapserver_tools.wms_layer_rules import load_wms_layer_rules
+
+MIGRATED = 'migrated'
+NO_MATCH = 'no match'
+FAILED = 'failed'
+
+RELAYER_NOTE = ("--relayer rewrites the whole files: the xml declaration, comments and unused namespace "
+                "declarations are not kept")
+
+# Start tags of resource elements of any namespace prefix, see _replace_resource_prefixes
+_resource_start_re = re.compile(br'<(?:[A-Za-z_][\w.-]*:)?resource(?:\s[^>]*)?>')
+
+
+class migration_checkpoint_error(ValueError):
+    pass
+
+
+class migration_error(ValueError):
+    pass
+
+
+def _replace_resource_prefixes(processor, xroot, content, old_prefix, new_prefix):
+    """Return content with old_prefix replaced by new_prefix in the OGC WMS resources of the parsed xroot.
+
+    Only the bytes of the prefix are replaced, None is returned if no resource
+    starts with old_prefix. The resource elements of the document are matched
+    in order with the resource start tags in content, migration_error is
+    raised if that or the prefix bytes do not line up.
+    """
+    wms_resources = set()
+    for data_access in processor.wms_data_accesses(xroot):
+        resource = data_access.find(processor.resource_tag)
+        if resource is not None and resource.text and resource.text.startswith(old_prefix):
+            wms_resources.add(resource)
+    if not wms_resources:
+        return None
+    resources = [elem for elem in xroot.iter()
+                 if isinstance(elem.tag, str) and elem.tag.rsplit('}', 1)[-1] == 'resource']
+    start_tags = list(_resource_start_re.finditer(content))
+    if len(start_tags) != len(resources):
+        raise migration_error("Found {} resource start tags for {} resource elements, can not replace the prefix "
+                              "in place".format(len(start_tags), len(resources)))
+    old_forms = [old_prefix.encode('utf-8'), escape(old_prefix).encode('utf-8')]
+    new_bytes = escape(new_prefix).encode('utf-8')
+    parts = []
+    position = 0
+    for resource, start_tag in zip(resources, start_tags):
+        if resource not in wms_resources:
+            continue
+        for old_bytes in old_forms:
+            if content.startswith(old_bytes, start_tag.end()):
+                break
+        else:
+            raise migration_error("The resource {} is not written in a form that can be replaced in place".format(
+                resource.text))
+        parts.extend([content[position:start_tag.end()], new_bytes])
+        position = start_tag.end() + len(old_bytes)
+    parts.append(content[position:])
+    return b''.join(parts)
+
+
+def migrate_document(processor, xtree, mmd_xml_file, old_prefix, new_prefix, relayer=False):
+    """Replace old_prefix of the OGC WMS resources in xtree, and the layers if relayer. Returns True if changed.
+
+    Used for --relayer, the tree is written back as a whole.
+    """
+    xroot = xtree.getroot()
+    changed = False
+    layers = None
+    for data_access in processor.wms_data_accesses(xroot):
+        resource = data_access.find(processor.resource_tag)
+        if resource is not None and resource.text and resource.text.startswith(old_prefix):
+            resource.text = new_prefix + resource.text[len(old_prefix):]
+            changed = True
+        if relayer:
+            wms_layers = data_access.find(processor.wms_layers_tag)
+            if wms_layers is None:
+                continue
+            if layers is None:
+                bn, _ = processor.ewmxf.generate_uri(mmd_xml_file)
+                platform, instrument = processor.platform_and_instrument(xroot)
+                layers = select_wms_layers(bn, processor.layer_rules, platform, instrument)
+            if [layer.text for layer in wms_layers] != layers:
+                for layer in list(wms_layers):
+                    wms_layers.remove(layer)
+                for layer in layers:
+                    processor.xml.SubElement(wms_layers, 'mmd:wms_layer').text = layer
+                changed = True
+    return changed
+
+
+def _diff(mmd_xml_file, old, new, context=0):
+    diff = difflib.unified_diff(old.decode('utf-8').splitlines(), new.decode('utf-8').splitlines(),
+                                mmd_xml_file, mmd_xml_file, n=context, lineterm='')
+    return '\n'.join(diff)
+
+
+def migrate_mmd_xml_file(mmd_xml_file, old_prefix, new_prefix, relayer=False, layer_rules=None, dry_run=False,
+                         want_diff=False, backend=None):
+    """Migrate one mmd xml file. Returns (status, diff), diff is None unless want_diff.
+
+    Without relayer only the bytes of the prefix are replaced, with relayer
+    the document is written back through the xml backend.
+    """
+    with open(mmd_xml_file, 'rb') as fh:
+        content = fh.read()
+    if not relayer:
+        raw_prefix = old_prefix.encode('utf-8')
+        if raw_prefix not in content and escape(old_prefix).encode('utf-8') not in content:
+            return NO_MATCH, None
+    processor = get_mmd_document_processor(MMD_NS, layer_rules, backend)
+    xtree = processor.parse(io.BytesIO(content))
+    if relayer:
+        if not migrate_document(processor, xtree, mmd_xml_file, old_prefix, new_prefix, relayer):
+            return NO_MATCH, None
+        new_content = processor.serialize(xtree)
+    else:
+        new_content = _replace_resource_prefixes(processor, xtree.getroot(), content, old_prefix, new_prefix)
+        if new_content is None:
+            return NO_MATCH, None
+    if not dry_run:
+        write_if_changed(mmd_xml_file, new_content)
+    return MIGRATED, _diff(mmd_xml_file, content, new_content) if want_diff else None
+
+
+def _migrate_worker(args):
+    mmd_xml_file, old_prefix, new_prefix, relayer, layer_rules_file, dry_run, want_diff, backend = args
+    start = time.perf_counter()
+    try:
+        status, diff = migrate_mmd_xml_file(mmd_xml_file, old_prefix, new_prefix, relayer,
+                                            load_wms_layer_rules(layer_rules_file), dry_run, want_diff, backend)
+    except Exception as exc:
+        return mmd_xml_file, FAILED, "{}: {}".format(type(exc).__name__, exc), None, time.perf_counter() - start
+    return mmd_xml_file, status, None, diff, time.perf_counter() - start
+
+
+def _checkpoint_header(old_prefix, new_prefix, relayer):
+    return '# {} -> {}{}\n'.format(old_prefix, new_prefix, ' relayer' if relayer else '')
+
+
+def read_checkpoint(checkpoint_file, old_prefix, new_prefix, relayer=False):
+    """Return the set of files finished by an earlier run of the same migration."""
+    done = set()
+    if not checkpoint_file or not os.path.exists(checkpoint_file):
+        return done
+    with open(checkpoint_file, 'r') as fh:
+        header = fh.readline()
+        if header and header != _checkpoint_header(old_prefix, new_prefix, relayer):
+            raise migration_checkpoint_error("Checkpoint {} is of another migration: {}".format(checkpoint_file,
+                                                                                                header.strip()))
+        for line in fh:
+            if line.endswith('\n'):
+                done.add(line[:-1].split('\t', 1)[1])
+    return done
+
+
+def migrate_wms_resources(mmd_xml_files, old_prefix, new_prefix, relayer=False, layer_rules_file=None,
+                          workers=None, chunksize=64, checkpoint_file=None, dry_run=False, max_diffs=10,
+                          backend=None):
+    """Migrate mmd_xml_files, see the module documentation.
+
+    Returns a dict with the counts per status, the number of files skipped
+    from the checkpoint, the failed files with their error, and the diffs of
+    the first max_diffs migrated files in dry run mode. The checkpoint is
+    not written in dry run mode.
+    """
+    if old_prefix == new_prefix and not relayer:
+        raise ValueError("old_prefix and new_prefix are the same")
+    done = read_checkpoint(checkpoint_file, old_prefix, new_prefix, relayer)
+    todo = [f for f in mmd_xml_files if f not in done]
+    want_diff = dry_run and max_diffs > 0
+    jobs = [(f, old_prefix, new_prefix, relayer, layer_rules_file, dry_run, want_diff, backend) for f in todo]
+    summary = {'counts': {MIGRATED: 0, NO_MATCH: 0, FAILED: 0}, 'checkpoint_skipped': len(mmd_xml_files) - len(todo),
+               'failed': [], 'diffs': []}
+
+    checkpoint = None
+    if checkpoint_file and not dry_run:
+        new_file = not os.path.exists(checkpoint_file) or os.path.getsize(checkpoint_file) == 0
+        checkpoint = open(checkpoint_file, 'a')
+        if new_file:
+            checkpoint.write(_checkpoint_header(old_prefix, new_prefix, relayer))
+    executor = None
+    try:
+        if workers is None:
+            workers = os.cpu_count() or 1
+        if workers <= 1 or len(jobs) <= 1:
+            results = map(_migrate_worker, jobs)
+        else:
+            import concurrent.futures
+
+            executor = concurrent.futures.ProcessPoolExecutor(max_workers=workers)
+            results = executor.map(_migrate_worker, jobs, chunksize=chunksize)
+        for mmd_xml_file, status, error, diff, _ in results:
+            summary['counts'][status] += 1
+            if status == FAILED:
+                summary['failed'].append((mmd_xml_file, error))
+            elif checkpoint is not None:
+                checkpoint.write('{}\t{}\n'.format(status, mmd_xml_file))
+                checkpoint.flush()
+            if diff and len(summary['diffs']) < max_diffs:
+                summary['diffs'].append(diff)
+    finally:
+        if executor is not None:
+            # Do not wait for the queued files when interrupted, they are not in the checkpoint
+            if sys.version_info >= (3, 9):
+                executor.shutdown(cancel_futures=True)
+            else:
+                executor.shutdown()
+        if checkpoint is not None:
+            checkpoint.close()
+    return summary
+
+
+def print_migration_summary(summary, elapsed, dry_run=False, relayer=False, file=None):
+    """Print the diffs, failed files and counts. Returns the number of failed files."""
+    if relayer and dry_run:
+        print("Note: " + RELAYER_NOTE, file=file)
+    for diff in summary['diffs']:
+        print(diff, file=file)
+    for mmd_xml_file, error in summary['failed']:
+        print("FAILED  {}: {}".format(mmd_xml_file, error), file=file)
+    counts = summary['counts']
+    total = sum(counts.values())
+    rate = total / elapsed if elapsed > 0 else float('inf')
+    print("{} {} files, {} without the old prefix, {} failed, {} done before (checkpoint), "
+          "in {:.2f}s ({:.1f} files/s)".format('Would migrate' if dry_run else 'Migrated', counts[MIGRATED],
+                                               counts[NO_MATCH], counts[FAILED], summary['checkpoint_skipped'],
+                                               elapsed, rate), file=file)
+    return counts[FAILED]
+
+
+def build_parser():
+    import argparse
+
+    from mapserver_tools.xml_backend import XML_BACKENDS
+
+    parser = argparse.ArgumentParser(
+        prog='mapserver-migrate-wms-resource',
+        description="Replace the start of the OGC WMS resource URL in many mmd xml files, eg. after a server move.")
+    parser.add_argument("--old-prefix", required=True,
+                        help="Start of the resource to replace, eg. https://fastapi-dev.s-enda.k8s.met.no/api/")
+    parser.add_argument("--new-prefix", required=True, help="Replacement, eg. https://fastapi.s-enda.k8s.met.no/api/")
+    parser.add_argument("-i", "--input", nargs='+', default=[], help="mmd xml files, directories or glob patterns.")
+    parser.add_argument("-l", "--file-list", help="File with one mmd xml file per line, '-' to read from stdin.")
+    parser.add_argument("-p", "--pattern", default='*.xml',
+                        help="File name pattern used when searching directories. Default: *.xml")
+    parser.add_argument("--relayer", action='store_true',
+                        help="Also select the WMS layers again with the rules. Note: " + RELAYER_NOTE + ".")
+    parser.add_argument("-r", "--layer-rules", help="YAML file with the WMS layer rules. Default: built in rules")
+    parser.add_argument("-w", "--workers", type=int, default=None,
+                        help="Number of worker processes. Default: number of cpus")
+    parser.add_argument("--checkpoint", help="Checkpoint file, to resume an interrupted migration.")
+    parser.add_argument("-n", "--dry-run", action='store_true', help="Only count the files and show diffs.")
+    parser.add_argument("--max-diffs", type=int, default=10, help="Diffs to show in dry run mode. Default: 10")
+    parser.add_argument("-x", "--xml-backend", choices=XML_BACKENDS, default='auto',
+                        help="xml library used to parse and write the mmd files. Default: auto")
+    return parser
+
+
+def main(argv=None):
+    from mapserver_tools.batch_edit_wms_mmd_xml_files import collect_mmd_xml_files
+    from mapserver_tools.batch_edit_wms_mmd_xml_files import read_file_list
+
+    cmd_args = build_parser().parse_args(argv)
+    inputs = list(cmd_args.input)
+    if cmd_args.file_list:
+        inputs.extend(read_file_list(cmd_args.file_list))
+    mmd_xml_files = collect_mmd_xml_files(inputs, cmd_args.pattern)
+    start = time.perf_counter()
+    try:
+        summary = migrate_wms_resources(mmd_xml_files, cmd_args.old_prefix, cmd_args.new_prefix,
+                                        relayer=cmd_args.relayer, layer_rules_file=cmd_args.layer_rules,
+                                        workers=cmd_args.workers, checkpoint_file=cmd_args.checkpoint,
+                                        dry_run=cmd_args.dry_run, max_diffs=cmd_args.max_diffs,
+                                        backend=cmd_args.xml_backend)
+    except ValueError as exc:
+        print(exc)
+        return 1
+    failed = print_migration_summary(summary, time.perf_counter() - start, cmd_args.dry_run, cmd_args.relayer)
+    return 1 if failed else 0
@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2021, 2022
+
+# Author(s):
+
+#   Trygve Aspenes
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Apply the edit_wms_mmd_xml_files operations to many mmd documents.
+
+The methods of edit_wms_mmd_xml_files register the namespaces on every open
+and give prefixed paths and the ns dict to find/findall, which sends every
+lookup through the python ElementPath code. mmd_document_processor registers
+the namespaces once per process and resolves all tags to Clark notation when
+it is made. Lookups of a single Clark tag without namespaces are done by the C
+accelerator of ElementTree, so the paths are walked one step at a time.
+The output is the same as with the edit_wms_mmd_xml_files methods, with
+either xml backend, see xml_backend.
+"""
+
+import os
+import xml.etree.ElementTree as et
+
+from mapserver_tools.atomic_write import write_if_changed
+from mapserver_tools.edit_wms_mmd_xml_files import edit_wms_mmd_xml_files
+from mapserver_tools.edit_wms_mmd_xml_files import select_wms_layers
+from mapserver_tools.xml_backend import get_xml_backend
+
+MMD_NS = {'mmd': 'http://www.met.no/schema/mmd',
+          'gml': 'http://www.opengis.net/gml'}
+
+WMS_NS = 'http://www.opengis.net/wms'
+
+_registered = set()
+
+
+def register_namespaces(ns):
+    """Register the prefixes of ns with ElementTree, once per process."""
+    for prefix, uri in ns.items():
+        if (prefix, uri) not in _registered:
+            et.register_namespace(prefix, uri)
+            _registered.add((prefix, uri))
+
+
+class mmd_document_processor():
+    """Namespaces and tags set up once, reused for any number of mmd documents."""
+
+    def __init__(self, ns=MMD_NS, layer_rules=None, capabilities_client=None, backend=None):
+        self.ns = ns
+        self.layer_rules = layer_rules
+        self.capabilities_client = capabilities_client
+        register_namespaces(ns)
+        mmd = '{' + ns['mmd'] + '}'
+        self.data_access_tag = mmd + 'data_access'
+        self.type_tag = mmd + 'type'
+        self.resource_tag = mmd + 'resource'
+        self.wms_layers_tag = mmd + 'wms_layers'
+        self.metadata_identifier_tag = mmd + 'metadata_identifier'
+        self.platform_tag = mmd + 'platform'
+        self.instrument_tag = mmd + 'instrument'
+        self.short_name_tag = mmd + 'short_name'
+        wms = '{' + WMS_NS + '}'
+        self.capability_tag = wms + 'Capability'
+        self.layer_tag = wms + 'Layer'
+        self.name_tag = wms + 'Name'
+        self.ewmxf = edit_wms_mmd_xml_files(backend=backend)
+        self.xml = self.ewmxf.xml
+
+    def parse(self, source):
+        """Parse an mmd xml file or file object, raises FileNotFoundError for missing files."""
+        return self.xml.parse(source)
+
+    def wms_data_accesses(self, xroot):
+        """Return the OGC WMS data_access elements of xroot"""
+        wms_data_accesses = []
+        for data_access in xroot.findall(self.data_access_tag):
+            access_type = data_access.find(self.type_tag)
+            if access_type is not None and access_type.text == 'OGC WMS':
+                wms_data_accesses.append(data_access)
+        return wms_data_accesses
+
+    def remove_wms(self, xroot):
+        for data_access in self.wms_data_accesses(xroot):
+            xroot.remove(data_access)
+
+    def metadata_identifier(self, xroot, mi=None):
+        metadata_identifier = xroot.find(self.metadata_identifier_tag)
+        if mi:
+            metadata_identifier.text = str(mi)
+        return metadata_identifier.text
+
+    def platform_and_instrument(self, xroot):
+        """Return the platform and instrument short names, None for those not in the document"""
+        platform = xroot.find(self.platform_tag)
+        if platform is None:
+            return None, None
+        instrument = platform.find(self.instrument_tag)
+        if instrument is not None:
+            instrument = instrument.findtext(self.short_name_tag)
+        return platform.findtext(self.short_name_tag), instrument
+
+    def add_wms(self, xroot, fast_api_netcdf_path, layers):
+        self.ewmxf.add_wms_to_mmd_xml(xroot, fast_api_netcdf_path, layers)
+
+    def serialize(self, xtree):
+        return self.xml.tostring(xtree)
+
+    def replace_wms(self, xtree, server_name, mmd_xml_file, info=None):
+        """Replace the OGC WMS data_access of the parsed document xtree of mmd_xml_file.
+
+        info, if given, is filled with the metadata_identifier, basename, netcdf_path and layers.
+        """
+        bn, netcdf_path = self.ewmxf.generate_uri(mmd_xml_file)
+        xroot = xtree.getroot()
+        self.remove_wms(xroot)
+        platform, instrument = self.platform_and_instrument(xroot)
+        layers = select_wms_layers(bn, self.layer_rules, platform, instrument)
+        self.add_wms(xroot, os.path.join(server_name, netcdf_path), layers)
+        if info is not None:
+            metadata_identifier = xroot.find(self.metadata_identifier_tag)
+            info.update(metadata_identifier=metadata_identifier.text if metadata_identifier is not None else None,
+                        basename=bn, netcdf_path=netcdf_path, layers=layers)
+        return xtree
+
+    def edit_mmd_xml_file(self, mmd_xml_file, server_name, info=None):
+        """Replace the OGC WMS data_access of mmd_xml_file in place.
+
+        Returns True if the file was written, False if it already had the new content.
+        """
+        xtree = self.replace_wms(self.parse(mmd_xml_file), server_name, mmd_xml_file, info)
+        return write_if_changed(mmd_xml_file, self.serialize(xtree))
+
+    def read_layers_from_getcapabilities(self, resource):
+        "Read and parse layer names from getcapabilities document"
+        if self.capabilities_client is not None:
+            gcd = self.capabilities_client.get(resource)
+        else:
+            import requests
+
+            gcd = requests.get(resource).text
+        return self.parse_layers_from_getcapabilities(gcd)
+
+    def parse_layers_from_getcapabilities(self, gcd):
+        "Parse the names of the second level layers from the text of a getcapabilities document"
+        layers = []
+        for capability in self.xml.fromstring(gcd).iter(self.capability_tag):
+            for top_layer in capability.findall(self.layer_tag):
+                for layer in top_layer.findall(self.layer_tag):
+                    for name in layer.findall(self.name_tag):
+                        layers.append(name.text)
+        return layers
+
+
+_processors = {}
+
+
+def get_mmd_document_processor(ns=MMD_NS, layer_rules=None, backend=None):
+    """Return a processor for ns, layer_rules and the xml backend, made once per process."""
+    # Resolve the default backend now, so a changed MAPSERVER_TOOLS_XML_BACKEND gets its own processor
+    backend = get_xml_backend(backend)
+    key = (tuple(sorted(ns.items())), id(layer_rules), backend.name)
+    processor = _processors.get(key)
+    if processor is None or processor.layer_rules is not layer_rules:
+        processor = mmd_document_processor(ns, layer_rules, backend=backend)
+        _processors[key] = processor
+    return processor
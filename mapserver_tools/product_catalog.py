@@ -0,0 +1,335 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2021, 2022
+
+# Author(s):
+
+#   Trygve Aspenes
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Local sqlite catalog of the processed mmd files, map files and GeoTIFF files.
+
+For each mmd file the catalog keeps the metadata_identifier, the basename
+and netcdf path from generate_uri, the time span from the basename, the WMS
+layers, the sha256 of the written file and the settings it was written with.
+For each map file it keeps its sha256, the settings it was written with and
+the GeoTIFF files it serves, with their layer, timestamp and the path
+mapserver reads them from.
+
+Batch tools use mmd_unchanged and map_file_unchanged to skip inputs that
+were processed before, and query_time_range and query_layer answer which
+files belong to a time range or use a layer, see scripts/mapserver-catalog.py.
+Times are stored as YYYY-MM-DDTHH:MM:SSZ strings.
+"""
+
+import os
+import json
+import time
+import hashlib
+import datetime
+import threading
+
+from mapserver_tools.atomic_write import file_digest
+
+_schema = [
+    "CREATE TABLE IF NOT EXISTS mmd_files (path TEXT PRIMARY KEY, mtime_ns INTEGER, size INTEGER, "
+    "sha256 TEXT, settings TEXT, metadata_identifier TEXT, basename TEXT, netcdf_path TEXT, "
+    "start_time TEXT, end_time TEXT, updated REAL)",
+    "CREATE TABLE IF NOT EXISTS mmd_layers (path TEXT, layer TEXT, PRIMARY KEY (path, layer))",
+    "CREATE TABLE IF NOT EXISTS map_files (path TEXT PRIMARY KEY, sha256 TEXT, updated REAL, settings TEXT)",
+    "CREATE TABLE IF NOT EXISTS geotiffs (path TEXT, map_file TEXT, mtime_ns INTEGER, size INTEGER, "
+    "layer TEXT, timestamp TEXT, mapserver_path TEXT, PRIMARY KEY (path, map_file))",
+    "CREATE INDEX IF NOT EXISTS mmd_files_metadata_identifier ON mmd_files (metadata_identifier)",
+    "CREATE INDEX IF NOT EXISTS mmd_files_time ON mmd_files (start_time, end_time)",
+    "CREATE INDEX IF NOT EXISTS mmd_layers_layer ON mmd_layers (layer)",
+    "CREATE INDEX IF NOT EXISTS geotiffs_layer ON geotiffs (layer)",
+    "CREATE INDEX IF NOT EXISTS geotiffs_timestamp ON geotiffs (timestamp)",
+]
+
+TIME_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+
+
+def parse_time(text):
+    """Parse 2021-09-01T07:02:30Z, 2021-09-01 07:02:30, 2021-09-01 or 20210901070230 to a datetime."""
+    text = text.strip().rstrip('Z')
+    for fmt in ('%Y-%m-%dT%H:%M:%S', '%Y-%m-%d %H:%M:%S', '%Y-%m-%dT%H:%M', '%Y-%m-%d', '%Y%m%d%H%M%S', '%Y%m%d'):
+        try:
+            return datetime.datetime.strptime(text, fmt)
+        except ValueError:
+            pass
+    raise ValueError("Could not parse time {}".format(text))
+
+
+def format_time(value):
+    return value.strftime(TIME_FORMAT)
+
+
+def time_span_from_basename(bn):
+    """Return the start and end time of an mmd basename like noaa19-avhrr-20210901070230-20210901071648."""
+    parts = bn.split('-')
+    try:
+        return (format_time(datetime.datetime.strptime(parts[-2], '%Y%m%d%H%M%S')),
+                format_time(datetime.datetime.strptime(parts[-1], '%Y%m%d%H%M%S')))
+    except (IndexError, ValueError):
+        return None, None
+
+
+def edit_settings(server_name, layer_rules_file=None):
+    """Describe the settings an mmd file is edited with, files edited with other settings are not skipped."""
+    rules = file_digest(layer_rules_file) if layer_rules_file else 'built-in'
+    return '{}|{}'.format(server_name, rules)
+
+
+def map_file_settings(server_name, mapserver_data_dir, template_file, config, cog_output_dir=None):
+    """Describe the settings a map file is written with, map files written with other settings are not skipped.
+
+    template_file is the path of the map file template and config the layer config it is rendered with.
+    """
+    template = file_digest(template_file)
+    layers = hashlib.sha256(json.dumps(config, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+    return '|'.join([server_name, mapserver_data_dir, template.hex() if template else 'missing', layers,
+                     cog_output_dir or ''])
+
+
+def geotiffs_from_render_data(input_data_files, data):
+    """Return (input file, layer, timestamp, mapserver path) of the GeoTIFF files in render data.
+
+    data is from generate_render_data or generate_time_index_render_data.
+    """
+    by_basename = dict((os.path.basename(f), f) for f in input_data_files)
+    geotiffs = []
+    for layer in data['layers']:
+        if 'records' in layer:
+            entries = [(location, timestamp) for location, timestamp, _ in layer['records']]
+        else:
+            entries = [(layer['geotiff_filename'], layer['geotiff_timestamp'])]
+        for mapserver_path, timestamp in entries:
+            input_file = by_basename.get(os.path.basename(mapserver_path), mapserver_path)
+            geotiffs.append((input_file, layer['layer_name'], timestamp, mapserver_path))
+    return geotiffs
+
+
+class product_catalog():
+    """sqlite catalog of processed files, safe to share between threads of one process."""
+
+    def __init__(self, catalog_file):
+        import sqlite3
+
+        self.catalog_file = catalog_file
+        self.db = sqlite3.connect(catalog_file, check_same_thread=False, timeout=60)
+        self.db.row_factory = sqlite3.Row
+        self.lock = threading.Lock()
+        with self.lock:
+            for statement in _schema:
+                self.db.execute(statement)
+            # Catalogs made before map file settings were recorded
+            columns = [row['name'] for row in self.db.execute("PRAGMA table_info(map_files)")]
+            if 'settings' not in columns:
+                self.db.execute("ALTER TABLE map_files ADD COLUMN settings TEXT")
+            self.db.commit()
+
+    def _stat(self, path):
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return None, None
+        return st.st_mtime_ns, st.st_size
+
+    def mmd_unchanged(self, mmd_xml_file, settings):
+        """Return True if mmd_xml_file was written with settings and has not changed since.
+
+        Files with a new mtime but the recorded content are also unchanged.
+        """
+        path = os.path.abspath(mmd_xml_file)
+        with self.lock:
+            row = self.db.execute("SELECT mtime_ns, size, sha256, settings FROM mmd_files WHERE path = ?",
+                                  (path,)).fetchone()
+        if row is None or row['settings'] != settings:
+            return False
+        mtime_ns, size = self._stat(mmd_xml_file)
+        if mtime_ns is None or size != row['size']:
+            return False
+        if mtime_ns == row['mtime_ns']:
+            return True
+        if file_digest(mmd_xml_file) != row['sha256']:
+            return False
+        with self.lock:
+            self.db.execute("UPDATE mmd_files SET mtime_ns = ? WHERE path = ?", (mtime_ns, path))
+            self.db.commit()
+        return True
+
+    def record_mmd(self, mmd_xml_file, settings, metadata_identifier, bn, netcdf_path, layers, commit=True):
+        """Record the current state of mmd_xml_file after it was edited."""
+        path = os.path.abspath(mmd_xml_file)
+        mtime_ns, size = self._stat(mmd_xml_file)
+        start_time, end_time = time_span_from_basename(bn)
+        with self.lock:
+            self.db.execute("INSERT OR REPLACE INTO mmd_files VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                            (path, mtime_ns, size, file_digest(mmd_xml_file), settings, metadata_identifier, bn,
+                             netcdf_path, start_time, end_time, time.time()))
+            self.db.execute("DELETE FROM mmd_layers WHERE path = ?", (path,))
+            self.db.executemany("INSERT OR IGNORE INTO mmd_layers VALUES (?, ?)",
+                                [(path, layer) for layer in layers])
+            if commit:
+                self.db.commit()
+
+    def map_file_unchanged(self, map_file, input_data_files, settings):
+        """Return True if map_file has the recorded content and was made with settings from exactly
+        input_data_files as they are.
+        """
+        path = os.path.abspath(map_file)
+        with self.lock:
+            row = self.db.execute("SELECT sha256, settings FROM map_files WHERE path = ?", (path,)).fetchone()
+            recorded = dict((r['path'], (r['mtime_ns'], r['size'])) for r in self.db.execute(
+                "SELECT path, mtime_ns, size FROM geotiffs WHERE map_file = ?", (path,)))
+        if row is None or row['settings'] != settings or file_digest(map_file) != row['sha256']:
+            return False
+        current = dict((os.path.abspath(f), self._stat(f)) for f in input_data_files)
+        return current == recorded
+
+    def record_map_file(self, map_file, geotiffs, settings):
+        """Record map_file, written with settings, and the GeoTIFF files it serves, from geotiffs_from_render_data."""
+        path = os.path.abspath(map_file)
+        rows = []
+        for input_file, layer, timestamp, mapserver_path in geotiffs:
+            mtime_ns, size = self._stat(input_file)
+            rows.append((os.path.abspath(input_file), path, mtime_ns, size, layer, timestamp, mapserver_path))
+        with self.lock:
+            self.db.execute("INSERT OR REPLACE INTO map_files VALUES (?, ?, ?, ?)",
+                            (path, file_digest(map_file), time.time(), settings))
+            self.db.execute("DELETE FROM geotiffs WHERE map_file = ?", (path,))
+            self.db.executemany("INSERT OR REPLACE INTO geotiffs VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+            self.db.commit()
+
+    def commit(self):
+        with self.lock:
+            self.db.commit()
+
+    def _mmd_rows(self, where, args):
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT path, metadata_identifier, basename, netcdf_path, start_time, end_time FROM mmd_files "
+                "WHERE " + where + " ORDER BY start_time, path", args).fetchall()
+            layers = {}
+            for row in rows:
+                layers[row['path']] = [r['layer'] for r in self.db.execute(
+                    "SELECT layer FROM mmd_layers WHERE path = ? ORDER BY rowid", (row['path'],))]
+        return [dict(row, kind='mmd', layers=layers[row['path']]) for row in rows]
+
+    def _geotiff_rows(self, where, args):
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT path, map_file, layer, timestamp, mapserver_path FROM geotiffs "
+                "WHERE " + where + " ORDER BY timestamp, path", args).fetchall()
+        return [dict(row, kind='geotiff') for row in rows]
+
+    def query_time_range(self, start, end):
+        """Return the mmd files overlapping start - end and the GeoTIFF files with a timestamp in it.
+
+        start and end are datetimes or strings understood by parse_time.
+        """
+        if not isinstance(start, datetime.datetime):
+            start = parse_time(start)
+        if not isinstance(end, datetime.datetime):
+            end = parse_time(end)
+        start, end = format_time(start), format_time(end)
+        rows = self._mmd_rows("start_time <= ? AND end_time >= ?", (end, start))
+        rows.extend(self._geotiff_rows("timestamp >= ? AND timestamp <= ?", (start, end)))
+        return rows
+
+    def query_layer(self, layer):
+        """Return the mmd files with layer in their WMS layers and the GeoTIFF files served as layer."""
+        rows = self._mmd_rows("path IN (SELECT path FROM mmd_layers WHERE layer = ?)", (layer,))
+        rows.extend(self._geotiff_rows("layer = ?", (layer,)))
+        return rows
+
+    def query_map_file(self, map_file):
+        """Return the GeoTIFF files recorded for map_file."""
+        return self._geotiff_rows("map_file = ?", (os.path.abspath(map_file),))
+
+    def query_metadata_identifier(self, metadata_identifier):
+        return self._mmd_rows("metadata_identifier = ?", (metadata_identifier,))
+
+    def stats(self):
+        with self.lock:
+            return dict((table, self.db.execute("SELECT COUNT(*) FROM " + table).fetchone()[0])
+                        for table in ('mmd_files', 'map_files', 'geotiffs'))
+
+    def close(self):
+        if self.db is not None:
+            with self.lock:
+                self.db.commit()
+                self.db.close()
+            self.db = None
+
+
+def print_rows(rows, file=None):
+    """Print query rows tab separated, mmd files and GeoTIFF files in their own columns."""
+    for row in rows:
+        if row['kind'] == 'mmd':
+            print('\t'.join(['mmd', row['path'], row['metadata_identifier'] or '', row['start_time'] or '',
+                             row['end_time'] or '', ','.join(row['layers']), row['netcdf_path'] or '']), file=file)
+        else:
+            print('\t'.join(['geotiff', row['path'], row['layer'] or '', row['timestamp'] or '',
+                             row['map_file'] or '', row['mapserver_path'] or '']), file=file)
+
+
+def build_parser():
+    import argparse
+
+    parser = argparse.ArgumentParser(prog='mapserver-catalog', description="Query the product catalog.")
+    parser.add_argument("-c", "--catalog", required=True, help="sqlite product catalog file.")
+    commands = parser.add_subparsers(dest='command')
+    time_range = commands.add_parser('time-range', help="mmd files overlapping and GeoTIFF files in a time range.")
+    time_range.add_argument("start", help="eg. 2021-09-01T07:00:00Z, 2021-09-01 or 20210901070000")
+    time_range.add_argument("end")
+    layer = commands.add_parser('layer', help="mmd files and GeoTIFF files using a WMS layer.")
+    layer.add_argument("layer")
+    metadata_identifier = commands.add_parser('metadata-identifier', help="mmd files with a metadata_identifier.")
+    metadata_identifier.add_argument("metadata_identifier")
+    commands.add_parser('stats', help="Number of files in the catalog.")
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    cmd_args = parser.parse_args(argv)
+    if not cmd_args.command:
+        parser.print_help()
+        return 1
+    if not os.path.exists(cmd_args.catalog):
+        print("Could not find the catalog {}".format(cmd_args.catalog))
+        return 1
+    catalog = product_catalog(cmd_args.catalog)
+    try:
+        if cmd_args.command == 'time-range':
+            try:
+                rows = catalog.query_time_range(cmd_args.start, cmd_args.end)
+            except ValueError as exc:
+                print(exc)
+                return 1
+        elif cmd_args.command == 'layer':
+            rows = catalog.query_layer(cmd_args.layer)
+        elif cmd_args.command == 'metadata-identifier':
+            rows = catalog.query_metadata_identifier(cmd_args.metadata_identifier)
+        else:
+            for table, count in catalog.stats().items():
+                print("{}\t{}".format(table, count))
+            return 0
+        print_rows(rows)
+    finally:
+        catalog.close()
+    return 0
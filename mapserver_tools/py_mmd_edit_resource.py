@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2021, 2022
+
+# Author(s):
+
+#   Trygve Aspenes
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Command line interface of py-mmd-edit-resource.
+
+Only what the single file MMD edit needs is imported up front, the batch
+modules are imported when batch mode is used. Installed as the
+py-mmd-edit-resource console script, and used by scripts/py-mmd-edit-resource.py.
+"""
+
+import os
+import sys
+import time
+import argparse
+
+from mapserver_tools.edit_wms_mmd_xml_files import edit_wms_mmd_xml_files
+from mapserver_tools.edit_wms_mmd_xml_files import check_arguments
+from mapserver_tools.edit_wms_mmd_xml_files import select_wms_layers
+from mapserver_tools.wms_layer_rules import load_wms_layer_rules
+from mapserver_tools.xml_backend import XML_BACKENDS
+from mapserver_tools.instrumentation import add_instrumentation_arguments
+from mapserver_tools.instrumentation import instrumentation_from_args
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='py-mmd-edit-resource')
+
+    parser.add_argument("-m", "--input-mmd-xml-file",
+                        help="The mmd xml file to be edited.")
+    parser.add_argument("-s", "--server-name",
+                        help="Hostname of the fastapi service, eg: https://s-enda-ogc-dev.k8s.met.no/")
+    parser.add_argument("-r", "--layer-rules",
+                        help="YAML file with the rules selecting the WMS layers, eg. etc/wms-layer-rules.yaml. "
+                             "Default: built in rules")
+    parser.add_argument("-x", "--xml-backend", choices=XML_BACKENDS, default='auto',
+                        help="xml library used to parse and write the mmd files, auto uses lxml if it is installed. "
+                             "The output is the same with all. Default: auto")
+    parser.add_argument("-i", "--input", nargs='+', default=[],
+                        help="Batch mode: mmd xml files, directories or glob patterns to be edited.")
+    parser.add_argument("-l", "--file-list",
+                        help="Batch mode: file with one mmd xml file per line, '-' to read from stdin.")
+    parser.add_argument("-p", "--pattern", default='*.xml',
+                        help="Batch mode: file name pattern used when searching directories. Default: *.xml")
+    parser.add_argument("-w", "--workers", type=int, default=None,
+                        help="Batch mode: number of worker processes. Default: number of cpus")
+    parser.add_argument("--stream", action='store_true',
+                        help="Batch mode: rewrite the files in a single streaming pass without building the xml tree.")
+    parser.add_argument("--catalog",
+                        help="Batch mode: sqlite product catalog. Files recorded as edited with the same server name "
+                             "and layer rules, and unchanged since, are skipped. Edited files are recorded.")
+    parser.add_argument("-q", "--quiet", action='store_true',
+                        help="Batch mode: only print failed files and the summary.")
+    add_instrumentation_arguments(parser)
+    return parser
+
+
+def run_batch(cmd_args):
+    from mapserver_tools.batch_edit_wms_mmd_xml_files import read_file_list
+    from mapserver_tools.batch_edit_wms_mmd_xml_files import collect_mmd_xml_files
+    from mapserver_tools.batch_edit_wms_mmd_xml_files import batch_edit_mmd_xml_files
+    from mapserver_tools.batch_edit_wms_mmd_xml_files import print_batch_summary
+
+    inputs = list(cmd_args.input)
+    if cmd_args.file_list:
+        inputs.extend(read_file_list(cmd_args.file_list))
+    mmd_xml_files = collect_mmd_xml_files(inputs, cmd_args.pattern)
+    if (cmd_args.metrics or cmd_args.metrics_json or cmd_args.metrics_prometheus) and cmd_args.workers != 1:
+        print("Metrics only cover the main process, use --workers 1 to measure the edits.", file=sys.stderr)
+    catalog = None
+    if cmd_args.catalog:
+        from mapserver_tools.product_catalog import product_catalog
+        catalog = product_catalog(cmd_args.catalog)
+    start = time.perf_counter()
+    try:
+        results = batch_edit_mmd_xml_files(mmd_xml_files, cmd_args.server_name, workers=cmd_args.workers,
+                                           stream=cmd_args.stream, layer_rules_file=cmd_args.layer_rules,
+                                           backend=cmd_args.xml_backend, catalog=catalog)
+    finally:
+        if catalog is not None:
+            catalog.close()
+    failed = print_batch_summary(results, time.perf_counter() - start, verbose=not cmd_args.quiet)
+    return 1 if failed else 0
+
+
+def run_single(cmd_args):
+    ewmxf = edit_wms_mmd_xml_files(backend=cmd_args.xml_backend)
+
+    ns = {'mmd': 'http://www.met.no/schema/mmd',
+          'gml': 'http://www.opengis.net/gml'}
+
+    bn, netcdf_path = ewmxf.generate_uri(cmd_args.input_mmd_xml_file)
+    xtree = ewmxf.open_mmd_xml_file(cmd_args.input_mmd_xml_file, ns)
+    if xtree is None:
+        return 1
+    xroot = xtree.getroot()
+    ewmxf.remove_wms_from_mmd_xml(xroot, ns)
+    platform, instrument = ewmxf.get_platform_and_instrument_from_mmd_xml(xroot, ns)
+    layers = select_wms_layers(bn, load_wms_layer_rules(cmd_args.layer_rules), platform, instrument)
+
+    ewmxf.add_wms_to_mmd_xml(xroot, os.path.join(cmd_args.server_name, netcdf_path), layers)
+    ewmxf.rewrite_mmd_xml(xtree, cmd_args.input_mmd_xml_file)
+    return 0
+
+
+def main(argv=None):
+    parser = build_parser()
+    cmd_args = parser.parse_args(argv)
+
+    if not check_arguments(cmd_args):
+        print("Failed to find mandatory arguments. Please check your arguments and try again.")
+        parser.print_help()
+        return 1
+
+    with instrumentation_from_args(cmd_args):
+        if cmd_args.input or cmd_args.file_list:
+            return run_batch(cmd_args)
+        return run_single(cmd_args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2021, 2022
+
+# Author(s):
+
+#   Trygve Aspenes
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Long lived jinja2 environments for rendering map file templates."""
+
+import os
+
+
+class render_environment():
+    """One jinja2 environment per template directory, kept for the lifetime of the object.
+
+    Compiled templates are kept in memory by the environment and are only
+    reloaded when the template file mtime changes. With bytecode_cache_dir set,
+    the compiled bytecode is also stored on disk, so new processes skip the
+    template compilation.
+    """
+
+    def __init__(self, bytecode_cache_dir=None, cache_size=400):
+        self.bytecode_cache_dir = bytecode_cache_dir
+        self.cache_size = cache_size
+        self.environments = {}
+
+    def get_environment(self, map_template_input_dir):
+        env = self.environments.get(map_template_input_dir)
+        if env is None:
+            import jinja2
+
+            bytecode_cache = None
+            if self.bytecode_cache_dir:
+                os.makedirs(self.bytecode_cache_dir, exist_ok=True)
+                bytecode_cache = jinja2.FileSystemBytecodeCache(self.bytecode_cache_dir)
+            env = jinja2.Environment(loader=jinja2.FileSystemLoader(map_template_input_dir),
+                                     bytecode_cache=bytecode_cache, auto_reload=True, cache_size=self.cache_size)
+            self.environments[map_template_input_dir] = env
+        return env
+
+    def get_template(self, map_template_input_dir, map_template_file_name):
+        return self.get_environment(map_template_input_dir).get_template(map_template_file_name)
@@ -0,0 +1,383 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2021, 2022
+
+# Author(s):
+
+#   Trygve Aspenes
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Streaming replacement of the OGC WMS data_access in mmd xml files.
+
+The documents are parsed with expat and written straight to the output, so
+only one top level child of the mmd root is held in memory at a time. The
+output is the same as open_mmd_xml_file -> remove_wms_from_mmd_xml ->
+add_wms_to_mmd_xml -> rewrite_mmd_xml gives with xml.etree.ElementTree:
+comments and processing instructions are dropped, empty elements are written
+as <tag />, and only the namespaces in use are declared on the root element.
+"""
+
+import os
+import shutil
+import tempfile
+import xml.parsers.expat
+import xml.etree.ElementTree as et
+
+from mapserver_tools.atomic_write import atomic_file_writer
+from mapserver_tools.edit_wms_mmd_xml_files import edit_wms_mmd_xml_files
+from mapserver_tools.edit_wms_mmd_xml_files import select_wms_layers
+
+XML_NS = 'http://www.w3.org/XML/1998/namespace'
+
+_window_size = 64 * 1024
+
+_attrib_entities = {'"': '&quot;', '\r': '&#13;', '\n': '&#10;', '\t': '&#09;'}
+
+
+def escape(data, entities=None):
+    # Same as xml.sax.saxutils.escape, which imports urllib and http.client
+    data = data.replace('&', '&amp;').replace('>', '&gt;').replace('<', '&lt;')
+    if entities:
+        for key, value in entities.items():
+            data = data.replace(key, value)
+    return data
+
+
+def _has_content(elem):
+    # Comments and processing instructions only count with a tail, as only that is kept
+    if elem.text:
+        return True
+    for child in elem:
+        if isinstance(child.tag, str) or child.tail:
+            return True
+    return False
+
+
+def default_prefixes(ns=None):
+    """Return the uri -> prefix map ElementTree uses: its registered namespaces, updated with ns."""
+    prefixes = dict(et._namespace_map)
+    prefixes[XML_NS] = 'xml'
+    for prefix, uri in (ns or {}).items():
+        prefixes[uri] = prefix
+    return prefixes
+
+
+class et_compatible_serializer():
+    """Serialize elements with Clark notation tags the way ElementTree.write(encoding='UTF-8') does.
+
+    Used for the streamed documents and for trees of other xml backends, eg.
+    lxml. Comments and processing instructions are left out, keeping their
+    tail, like the ElementTree parser drops them.
+    """
+
+    def __init__(self, prefixes):
+        self.prefixes = prefixes
+        self.namespaces = {}
+        self.qnames = {}
+
+    def qname(self, tag):
+        try:
+            return self.qnames[tag]
+        except KeyError:
+            pass
+        if tag[:1] == '{':
+            uri, local = tag[1:].rsplit('}', 1)
+            prefix = self.namespaces.get(uri)
+            if prefix is None:
+                prefix = self.prefixes.get(uri)
+                if prefix is None:
+                    prefix = 'ns%d' % len(self.namespaces)
+                if prefix != 'xml':
+                    self.namespaces[uri] = prefix
+            qname = '%s:%s' % (prefix, local) if prefix else local
+        else:
+            qname = tag
+        self.qnames[tag] = qname
+        return qname
+
+    def start_root(self, tag, attrib):
+        """Resolve the root names first to number unknown namespaces like ElementTree does."""
+        self.qname(tag)
+        for key in attrib:
+            self.qname(key)
+
+    def serialize(self, write, elem):
+        if not isinstance(elem.tag, str):
+            if elem.tail:
+                write(escape(elem.tail))
+            return
+        tag = self.qname(elem.tag)
+        write('<' + tag)
+        for key, value in elem.attrib.items():
+            write(' %s="%s"' % (self.qname(key), escape(value, _attrib_entities)))
+        if _has_content(elem):
+            write('>')
+            if elem.text:
+                write(escape(elem.text))
+            for child in elem:
+                self.serialize(write, child)
+            write('</' + tag + '>')
+        else:
+            write(' />')
+        if elem.tail:
+            write(escape(elem.tail))
+
+    def root_start_tag(self, tag, attrib, text):
+        """Return the root start tag with the declarations of all namespaces used, and the root text."""
+        head = ['<' + self.qname(tag)]
+        for uri, prefix in sorted(self.namespaces.items(), key=lambda x: x[1]):
+            head.append(' xmlns%s="%s"' % (':' + prefix if prefix else '', escape(uri, _attrib_entities)))
+        for key, value in attrib.items():
+            head.append(' %s="%s"' % (self.qname(key), escape(value, _attrib_entities)))
+        head.append('>')
+        if text:
+            head.append(escape(text))
+        return ''.join(head)
+
+    def tostring(self, root):
+        """Return the UTF-8 bytes of the document with root element root."""
+        self.start_root(root.tag, root.attrib)
+        out = []
+        for child in root:
+            self.serialize(out.append, child)
+        head = self.root_start_tag(root.tag, root.attrib, root.text)
+        if not _has_content(root):
+            return (head[:-1] + ' />').encode('utf-8', 'xmlcharrefreplace')
+        return (head + ''.join(out) + '</' + self.qname(root.tag) + '>').encode('utf-8', 'xmlcharrefreplace')
+
+
+class _document_end(Exception):
+    pass
+
+
+class _wms_document_filter():
+    """Expat handlers for one mmd document, writing everything below the root to a spool file."""
+
+    def __init__(self, ns, prefixes, wms, spool):
+        self.ns = ns
+        self.serializer = et_compatible_serializer(prefixes)
+        self.wms = wms
+        self.spool = spool
+        self.depth = 0
+        self.root_tag = None
+        self.root_attrib = None
+        self.root_text = None
+        self.builder = None
+        self.pending = None
+        self.seen_child = False
+        self.data = []
+        self.info = {}
+        self.mmd = '{' + ns['mmd'] + '}'
+        self.end_index = None
+
+    def attach(self, parser):
+        parser.buffer_text = True
+        parser.ordered_attributes = True
+        parser.StartElementHandler = self.start
+        parser.EndElementHandler = self.end
+        parser.CharacterDataHandler = self.chardata
+        self.parser = parser
+
+    def fixname(self, name):
+        if '}' in name:
+            return '{' + name
+        return name
+
+    def start(self, name, attrs):
+        tag = self.fixname(name)
+        attrib = {}
+        for i in range(0, len(attrs), 2):
+            attrib[self.fixname(attrs[i])] = attrs[i + 1]
+        if self.depth == 0:
+            self.root_tag = tag
+            self.root_attrib = attrib
+            self.serializer.start_root(tag, attrib)
+        elif self.depth == 1:
+            self.flush_data()
+            self.builder = et.TreeBuilder()
+            self.builder.start(tag, attrib)
+        else:
+            self.builder.start(tag, attrib)
+        self.depth += 1
+
+    def chardata(self, data):
+        if self.depth > 1:
+            self.builder.data(data)
+        elif self.depth == 1:
+            self.data.append(data)
+
+    def end(self, name):
+        self.depth -= 1
+        if self.depth > 1:
+            self.builder.end(self.fixname(name))
+        elif self.depth == 1:
+            self.builder.end(self.fixname(name))
+            self.pending = self.builder.close()
+            self.builder = None
+            self.seen_child = True
+        else:
+            self.flush_data()
+            self.flush_pending()
+            fast_api_netcdf_path, layers = self.wms(self.info) if callable(self.wms) else self.wms
+            parent = et.Element('parent')
+            edit_wms_mmd_xml_files(backend='etree').add_wms_to_mmd_xml(parent, fast_api_netcdf_path, layers)
+            self.write(parent[0])
+            self.end_index = self.parser.CurrentByteIndex
+            raise _document_end()
+
+    def flush_data(self):
+        text = ''.join(self.data)
+        self.data = []
+        if not self.seen_child:
+            self.root_text = text
+        else:
+            self.pending.tail = text
+            self.flush_pending()
+
+    def flush_pending(self):
+        elem = self.pending
+        if elem is None:
+            return
+        self.pending = None
+        if elem.tag == self.mmd + 'metadata_identifier':
+            self.info['metadata_identifier'] = elem.text
+        elif elem.tag == self.mmd + 'storage_information':
+            file_name = elem.find(self.mmd + 'file_name')
+            if file_name is not None:
+                self.info['file_name'] = file_name.text
+        elif elem.tag == self.mmd + 'platform':
+            self.info['platform'] = elem.findtext(self.mmd + 'short_name')
+            self.info['instrument'] = elem.findtext(self.mmd + 'instrument/' + self.mmd + 'short_name')
+        elif elem.tag == self.mmd + 'data_access':
+            access_type = elem.find(self.mmd + 'type')
+            if access_type is not None and access_type.text == 'OGC WMS':
+                return
+        self.write(elem)
+
+    def write(self, elem):
+        out = []
+        self.serializer.serialize(out.append, elem)
+        self.spool.write(''.join(out).encode('utf-8', 'xmlcharrefreplace'))
+
+    def write_document(self, output_fh):
+        """Write the root element around the spooled children."""
+        head = self.serializer.root_start_tag(self.root_tag, self.root_attrib, self.root_text)
+        output_fh.write(head.encode('utf-8', 'xmlcharrefreplace'))
+        self.spool.seek(0)
+        shutil.copyfileobj(self.spool, output_fh)
+        output_fh.write(('</' + self.serializer.qname(self.root_tag) + '>').encode('utf-8'))
+
+
+class stream_edit_wms_mmd_xml_files():
+    """Replace the OGC WMS data_access of mmd xml files in a single streaming pass.
+
+    wms arguments are either a (fast_api_netcdf_path, layers) tuple or a
+    callable taking a dict with the metadata_identifier, the
+    storage_information file_name and the platform and instrument short names
+    of the document and returning such a tuple.
+    """
+
+    def __init__(self, ns, chunk_size=64 * 1024, spool_size=4 * 1024 * 1024):
+        self.ns = ns
+        self.chunk_size = chunk_size
+        self.spool_size = spool_size
+        self.prefixes = default_prefixes(ns)
+
+    def _rewrite_document(self, input_fh, output_fh, wms, data, separator=b''):
+        """Rewrite the next document of input_fh, starting with the already read bytes in data.
+
+        separator is written before the document. Returns the bytes read after
+        the end of the document, or None if there was no document left.
+        """
+        data = data.lstrip()
+        while not data:
+            data = input_fh.read(self.chunk_size)
+            if not data:
+                return None
+            data = data.lstrip()
+
+        parser = xml.parsers.expat.ParserCreate(None, '}')
+        with tempfile.SpooledTemporaryFile(max_size=self.spool_size) as spool:
+            document = _wms_document_filter(self.ns, self.prefixes, wms, spool)
+            document.attach(parser)
+            # Keep the last bytes given to the parser to find the end of the root end tag.
+            window = b''
+            window_start = 0
+            try:
+                while data:
+                    window += data
+                    parser.Parse(data, False)
+                    if len(window) > 2 * _window_size:
+                        window_start += len(window) - _window_size
+                        window = window[-_window_size:]
+                    data = input_fh.read(self.chunk_size)
+                parser.Parse(b'', True)
+            except _document_end:
+                pass
+            except xml.parsers.expat.ExpatError as exc:
+                raise et.ParseError(str(exc))
+            if document.end_index is None:
+                raise et.ParseError("no element found")
+            output_fh.write(separator)
+            document.write_document(output_fh)
+
+        # end_index is the start of the root end tag, or the first byte after the
+        # root element if it was written as an empty element tag.
+        data = window
+        index = document.end_index - window_start
+        if data[index:index + 2] == b'</':
+            index = data.index(b'>', index) + 1
+        return data[index:]
+
+    def rewrite_mmd_xml_stream(self, input_fh, output_fh, wms):
+        """Rewrite one mmd document from binary file object input_fh to output_fh."""
+        rest = self._rewrite_document(input_fh, output_fh, wms, b'')
+        if rest is None:
+            raise et.ParseError("no element found")
+        if rest.strip() or input_fh.read(self.chunk_size).strip():
+            raise et.ParseError("junk after document element")
+
+    def rewrite_mmd_xml_dump(self, input_fh, output_fh, wms):
+        """Rewrite a stream of concatenated mmd documents, returns the number of documents."""
+        count = 0
+        rest = self._rewrite_document(input_fh, output_fh, wms, b'')
+        while rest is not None:
+            count += 1
+            rest = self._rewrite_document(input_fh, output_fh, wms, rest, separator=b'\n')
+        return count
+
+    def rewrite_mmd_xml_file(self, input_mmd_xml_file, wms, output_mmd_xml_file=None):
+        """Rewrite an mmd xml file, in place if output_mmd_xml_file is None.
+
+        Returns True if the output file was written, False if it already had the new content.
+        """
+        if output_mmd_xml_file is None:
+            output_mmd_xml_file = input_mmd_xml_file
+        with open(input_mmd_xml_file, 'rb') as input_fh:
+            with atomic_file_writer(output_mmd_xml_file) as output_fh:
+                self.rewrite_mmd_xml_stream(input_fh, output_fh, wms)
+        return output_fh.written
+
+
+def wms_from_storage_file_name(server_name, layer_rules=None):
+    """Return a wms callable for dumps, building the resource from the storage_information file_name."""
+    ewmxf = edit_wms_mmd_xml_files()
+
+    def wms(info):
+        bn, netcdf_path = ewmxf.generate_uri(info['file_name'])
+        layers = select_wms_layers(bn, layer_rules, info.get('platform'), info.get('instrument'))
+        return os.path.join(server_name, netcdf_path), layers
+    return wms
@@ -0,0 +1,26 @@
+"""Shared fixtures for the mapserver_tools tests
+"""
+
+import os
+
+import pytest
+
+
+@pytest.fixture
+def make_geotiff(tmp_path):
+    """Return a function writing a small 4 band GeoTIFF with a TIFFTAG_DATETIME to tmp_path."""
+    def _make_geotiff(name, width=240, height=275, tiff_datetime='2021:09:10 12:33:18', **profile):
+        import numpy
+        import rasterio
+        from rasterio.transform import from_origin
+
+        geotiff_file = os.path.join(str(tmp_path), name)
+        kwargs = dict(driver='GTiff', width=width, height=height, count=4, dtype='uint8',
+                      crs='EPSG:25833', transform=from_origin(-1000000, 8500000, 1000, 1000))
+        kwargs.update(profile)
+        with rasterio.open(geotiff_file, 'w', **kwargs) as dst:
+            dst.write(numpy.full((4, height, width), 7, dtype='uint8'))
+            if tiff_datetime:
+                dst.update_tags(TIFFTAG_DATETIME=tiff_datetime)
+        return geotiff_file
+    return _make_geotiff
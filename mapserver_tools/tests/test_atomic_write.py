@@ -0,0 +1,53 @@
+import os
+import stat
+
+import pytest
+
+
+def test_write_if_changed(tmp_path):
+    from mapserver_tools.atomic_write import write_if_changed
+    path = str(tmp_path / 'mapserver.map')
+
+    assert write_if_changed(path, b'MAP\nEND\n')
+    with open(path, 'rb') as fh:
+        assert fh.read() == b'MAP\nEND\n'
+    os.chmod(path, 0o640)
+    os.utime(path, ns=(1, 1))
+
+    assert not write_if_changed(path, b'MAP\nEND\n')
+    assert os.stat(path).st_mtime_ns == 1
+
+    assert write_if_changed(path, b'MAP\nNAME "x"\nEND\n')
+    with open(path, 'rb') as fh:
+        assert fh.read() == b'MAP\nNAME "x"\nEND\n'
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o640
+    assert os.listdir(str(tmp_path)) == ['mapserver.map']
+
+
+def test_write_chunks_if_changed(tmp_path):
+    from mapserver_tools.atomic_write import write_chunks_if_changed
+    path = str(tmp_path / 'mapserver.map')
+
+    assert write_chunks_if_changed(path, [b'MAP\n', b'END\n'])
+    assert not write_chunks_if_changed(path, iter([b'MA', b'P\nEND\n']))
+    assert write_chunks_if_changed(path, [b'MAP\n'])
+    with open(path, 'rb') as fh:
+        assert fh.read() == b'MAP\n'
+    assert os.listdir(str(tmp_path)) == ['mapserver.map']
+
+
+def test_write_chunks_if_changed_error_keeps_old_file(tmp_path):
+    from mapserver_tools.atomic_write import write_chunks_if_changed
+    path = str(tmp_path / 'mapserver.map')
+    with open(path, 'wb') as fh:
+        fh.write(b'old')
+
+    def chunks():
+        yield b'partial'
+        raise RuntimeError("render failed")
+
+    with pytest.raises(RuntimeError):
+        write_chunks_if_changed(path, chunks())
+    with open(path, 'rb') as fh:
+        assert fh.read() == b'old'
+    assert os.listdir(str(tmp_path)) == ['mapserver.map']
@@ -0,0 +1,104 @@
+"""Test batch mode of py-mmd-edit-resource
+"""
+
+import os
+import shutil
+
+TESTDATA = 'mapserver_tools/tests/testdata/noaa19-avhrr-20210901070230-20210901071648.xml'
+FAST_API = 'https://fastapi-dev.s-enda.k8s.met.no/api/get_mapserv'
+
+
+def _make_corpus(directory, count):
+    files = []
+    for i in range(count):
+        mmd_xml_file = os.path.join(directory, 'noaa19-avhrr-2021090107{:04d}-20210901071648.xml'.format(i))
+        shutil.copy(TESTDATA, mmd_xml_file)
+        files.append(mmd_xml_file)
+    return files
+
+
+def test_collect_mmd_xml_files(tmp_path):
+    from mapserver_tools.batch_edit_wms_mmd_xml_files import collect_mmd_xml_files
+    sub = tmp_path / 'sub'
+    sub.mkdir()
+    files = _make_corpus(str(sub), 3)
+    (sub / 'not-mmd.txt').write_text('x')
+
+    assert collect_mmd_xml_files([str(tmp_path)]) == sorted(files)
+    assert collect_mmd_xml_files([os.path.join(str(sub), '*.xml'), files[0]]) == sorted(files)
+    assert collect_mmd_xml_files([files[1], files[0]]) == [files[1], files[0]]
+
+
+def test_read_file_list(tmp_path, mocker):
+    import io
+    from mapserver_tools.batch_edit_wms_mmd_xml_files import read_file_list
+    file_list = tmp_path / 'list.txt'
+    file_list.write_text('a.xml\n\n  b.xml \n')
+    assert read_file_list(str(file_list)) == ['a.xml', 'b.xml']
+
+    mocker.patch('sys.stdin', io.StringIO('c.xml\n'))
+    assert read_file_list('-') == ['c.xml']
+
+
+def test_batch_edit_mmd_xml_files(tmp_path, capsys):
+    from mapserver_tools.edit_wms_mmd_xml_files import edit_wms_mmd_xml_files
+    from mapserver_tools.batch_edit_wms_mmd_xml_files import MMD_NS
+    from mapserver_tools.batch_edit_wms_mmd_xml_files import batch_edit_mmd_xml_files
+    from mapserver_tools.batch_edit_wms_mmd_xml_files import print_batch_summary
+
+    files = _make_corpus(str(tmp_path), 4)
+    missing = os.path.join(str(tmp_path), 'noaa19-avhrr-20210901070230-20210901071649.xml')
+    results = batch_edit_mmd_xml_files(files + [missing], FAST_API, workers=2, chunksize=1)
+
+    assert [r[0] for r in results] == files + [missing]
+    assert [r[1] for r in results] == [True, True, True, True, False]
+    assert 'FileNotFoundError' in results[-1][2]
+
+    ewmxf = edit_wms_mmd_xml_files()
+    for mmd_xml_file in files:
+        xroot = ewmxf.open_mmd_xml_file(mmd_xml_file, MMD_NS).getroot()
+        resources = [da.find('mmd:resource', MMD_NS) for da in xroot.findall('mmd:data_access', MMD_NS)]
+        assert not any('thredds/wms' in r.text for r in resources if r is not None)
+        bn, netcdf_path = ewmxf.generate_uri(mmd_xml_file)
+        wms = xroot.findall('mmd:data_access', MMD_NS)[-1]
+        assert wms.find('mmd:resource', MMD_NS).text.startswith(os.path.join(FAST_API, netcdf_path))
+
+    failed = print_batch_summary(results, 1.0, verbose=False)
+    captured = capsys.readouterr()
+    assert failed == 1
+    assert 'FAILED  {}'.format(missing) in captured.out
+    assert 'Processed 5 files in 1.00s (5.0 files/s): 4 ok, 0 skipped unchanged, 1 failed' in captured.out
+
+    # A second run has nothing to change
+    mtimes = [os.stat(f).st_mtime_ns for f in files]
+    results = batch_edit_mmd_xml_files(files, FAST_API, workers=1)
+    assert [r[1] for r in results] == [True, True, True, True]
+    assert [r[4] for r in results] == [False, False, False, False]
+    assert [os.stat(f).st_mtime_ns for f in files] == mtimes
+    print_batch_summary(results, 1.0)
+    captured = capsys.readouterr()
+    assert 'SKIPPED {} unchanged'.format(files[0]) in captured.out
+    assert '0 ok, 4 skipped unchanged, 0 failed' in captured.out
+
+
+def test_batch_edit_mmd_xml_files_stream(tmp_path):
+    from mapserver_tools.batch_edit_wms_mmd_xml_files import batch_edit_mmd_xml_files
+    tree_dir = tmp_path / 'tree'
+    stream_dir = tmp_path / 'stream'
+    tree_dir.mkdir()
+    stream_dir.mkdir()
+    tree_files = _make_corpus(str(tree_dir), 2)
+    stream_files = _make_corpus(str(stream_dir), 2)
+    assert all(r[1] for r in batch_edit_mmd_xml_files(tree_files, FAST_API, workers=1))
+    assert all(r[1] for r in batch_edit_mmd_xml_files(stream_files, FAST_API, workers=1, stream=True))
+    for tree_file, stream_file in zip(tree_files, stream_files):
+        with open(tree_file, 'rb') as tree_fh, open(stream_file, 'rb') as stream_fh:
+            assert tree_fh.read() == stream_fh.read()
+
+
+def test_select_wms_layers():
+    from mapserver_tools.edit_wms_mmd_xml_files import select_wms_layers
+    iband = 'noaa20-viirs-iband-20220517115900-20220517121313'
+    assert select_wms_layers(iband) == ['hr_overview', 'ir_window_channel']
+    assert select_wms_layers('noaa20-viirs-dnb-20220517115900-20220517121313') == ['adaptive_dnb']
+    assert select_wms_layers('noaa19-avhrr-20210901070230-20210901071648') == ['overview', 'ir_window_channel']
@@ -0,0 +1,49 @@
+"""Test rewriting GeoTIFF files as Cloud Optimized GeoTIFFs
+"""
+
+import os
+
+
+def test_optimize_geotiffs(tmp_path, make_geotiff):
+    from mapserver_tools.cog_preprocess import geotiff_layout
+    from mapserver_tools.cog_preprocess import optimize_geotiffs
+    from mapserver_tools.tiff_header import read_tiff_header
+
+    strip = make_geotiff('overview_20210910_123318.tif', width=1200, height=1100)
+    tiled = make_geotiff('natural_with_night_fog_20210910_123318.tif', width=256, height=256, tiled=True,
+                         blockxsize=128, blockysize=128, compress='deflate')
+    missing = os.path.join(str(tmp_path), 'overview_20210910_000000.tif')
+    cog_dir = str(tmp_path / 'cog')
+
+    layout = geotiff_layout(strip)
+    assert not layout['tiled'] and not layout['overviews'] and not layout['compress']
+
+    cog_files, results = optimize_geotiffs([strip, tiled, missing], cog_dir, workers=2)
+    assert [r[2] for r in results] == ['optimized', 'not needed', 'failed']
+    assert results[0][3] == 'not tiled, no overviews, not compressed'
+    assert cog_files == {strip: os.path.join(cog_dir, os.path.basename(strip))}
+
+    layout = geotiff_layout(cog_files[strip])
+    assert layout['tiled'] and layout['overviews'] and layout['compress'] == 'DEFLATE'
+    assert read_tiff_header(cog_files[strip]) == read_tiff_header(strip)
+    assert os.listdir(cog_dir) == [os.path.basename(strip)]
+
+    cog_files, results = optimize_geotiffs([strip], cog_dir, workers=1)
+    assert results[0][2] == 'up to date'
+    assert cog_files == {strip: os.path.join(cog_dir, os.path.basename(strip))}
+
+
+def test_generate_render_data_with_cog_files(make_geotiff):
+    from mapserver_tools.edit_wms_mmd_xml_files import generate_mapserver_map_file
+
+    config = {'layers': [{'match': 'overview', 'name': 'Overview', 'title': 'Overview'},
+                         {'match': 'natural_with_night_fog', 'name': 'natural_with_night_fog',
+                          'title': 'Natural with night fog'}]}
+    overview = make_geotiff('overview_20210910_123318.tif')
+    natural = make_geotiff('natural_with_night_fog_20210910_123318.tif')
+    cog_files = {overview: '/local/cog/overview_20210910_123318.tif'}
+
+    data = generate_mapserver_map_file().generate_render_data('https://server', '/data', 'a.map',
+                                                              [overview, natural], config, cog_files=cog_files)
+    assert [layer['geotiff_filename'] for layer in data['layers']] == [
+        '/data/mapserver/cog/overview_20210910_123318.tif', '/data/natural_with_night_fog_20210910_123318.tif']
@@ -0,0 +1,133 @@
+"""Test the GeoTIFF header metadata cache
+"""
+
+import os
+
+
+def test_geotiff_metadata_cache(make_geotiff):
+    from mapserver_tools.geotiff_metadata_cache import geotiff_metadata_cache
+    geotiff_file = make_geotiff('overview_20210910_123318.tif')
+    reads = []
+
+    def read(f):
+        reads.append(f)
+        return 10, 20, '2021:09:10 12:33:18'
+
+    cache = geotiff_metadata_cache()
+    assert cache.get(geotiff_file, read) == (10, 20, '2021:09:10 12:33:18')
+    assert cache.get(geotiff_file, read) == (10, 20, '2021:09:10 12:33:18')
+    assert reads == [geotiff_file]
+
+    # A changed file is read again
+    st = os.stat(geotiff_file)
+    os.utime(geotiff_file, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    cache.get(geotiff_file, read)
+    assert len(reads) == 2
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_geotiff_metadata_cache_lru(make_geotiff):
+    from mapserver_tools.geotiff_metadata_cache import geotiff_metadata_cache
+    files = [make_geotiff('f{}.tif'.format(i), width=8, height=8) for i in range(3)]
+    reads = []
+
+    def read(f):
+        reads.append(os.path.basename(f))
+        return 8, 8, '2021:09:10 12:33:18'
+
+    cache = geotiff_metadata_cache(max_entries=2)
+    for f in (files[0], files[1], files[0], files[2], files[0], files[1]):
+        cache.get(f, read)
+    assert reads == ['f0.tif', 'f1.tif', 'f2.tif', 'f1.tif']
+
+
+def test_geotiff_metadata_cache_sqlite(make_geotiff, tmp_path):
+    from mapserver_tools.geotiff_metadata_cache import geotiff_metadata_cache
+    files = [make_geotiff('f{}.tif'.format(i), width=8, height=8) for i in range(3)]
+    cache_file = str(tmp_path / 'cache.sqlite')
+
+    def read(f):
+        return 8, 8, '2021:09:10 12:33:18'
+
+    cache = geotiff_metadata_cache(cache_file=cache_file, max_disk_entries=2)
+    for f in files:
+        cache.get(f, read)
+    cache.close()
+
+    def fail(f):
+        raise AssertionError("should come from the sqlite cache")
+
+    cache = geotiff_metadata_cache(cache_file=cache_file)
+    assert cache.get(files[2], fail) == (8, 8, '2021:09:10 12:33:18')
+    assert cache.get(files[1], fail) == (8, 8, '2021:09:10 12:33:18')
+    assert cache.db.execute("SELECT COUNT(*) FROM geotiff_metadata").fetchone()[0] == 2
+    cache.close()
+
+
+def test_geotiff_metadata_cache_sqlite_commits(make_geotiff, tmp_path):
+    import sqlite3
+
+    from mapserver_tools.geotiff_metadata_cache import geotiff_metadata_cache
+    files = [make_geotiff('f{}.tif'.format(i), width=8, height=8) for i in range(3)]
+    cache_file = str(tmp_path / 'cache.sqlite')
+
+    def read(f):
+        return 8, 8, '2021:09:10 12:33:18'
+
+    def stored():
+        db = sqlite3.connect(cache_file)
+        try:
+            return db.execute("SELECT COUNT(*) FROM geotiff_metadata").fetchone()[0]
+        finally:
+            db.close()
+
+    # Entries are visible to other processes in batches, without waiting for close()
+    cache = geotiff_metadata_cache(cache_file=cache_file, commit_every=2)
+    cache.get(files[0], read)
+    assert stored() == 0
+    cache.get(files[1], read)
+    assert stored() == 2
+    cache.get(files[2], read)
+    assert stored() == 2
+    cache.close()
+    assert stored() == 3
+
+
+def test_generate_render_data_opens_each_geotiff_once(make_geotiff, mocker):
+    from mapserver_tools.edit_wms_mmd_xml_files import generate_mapserver_map_file
+
+    config = {'layers': [{'match': 'overview',
+                          'name': 'Overview',
+                          'title': 'Overview'},
+                         {'match': 'natural_with_night_fog',
+                          'name': 'natural_with_night_fog',
+                          'title': 'Natural with night fog'}]}
+    input_data_files = [make_geotiff('overview_20210910_123318.tif', width=2400, height=2750),
+                        make_geotiff('natural_with_night_fog_20210910_123318.tif', width=2400, height=2750)]
+    gmmf = generate_mapserver_map_file()
+    read_geotiff_metadata = mocker.spy(gmmf, 'read_geotiff_metadata')
+    data = gmmf.generate_render_data('https://test.server.lo/', 'dir', 'test.map', input_data_files, config)
+    data = gmmf.generate_render_data('https://test.server.lo/', 'dir', 'test.map', input_data_files, config)
+    assert read_geotiff_metadata.call_count == 2
+    assert (data['xsize'], data['ysize']) == (2400, 2750)
+    assert [layer['geotiff_timestamp'] for layer in data['layers']] == ['2021-09-10T12:33:18Z'] * 2
+    assert [layer['layer_name'] for layer in data['layers']] == ['Overview', 'natural_with_night_fog']
+
+
+def test_generate_render_data_workers(make_geotiff, capsys):
+    from mapserver_tools.edit_wms_mmd_xml_files import generate_mapserver_map_file
+
+    config = {'layers': [{'match': 'layer{}_'.format(i), 'name': 'name{}'.format(i), 'title': 'Title {}'.format(i)}
+                         for i in range(8)]}
+    input_data_files = [make_geotiff('layer{}_20210910_1233{:02d}.tif'.format(i, i), width=16, height=16,
+                                     tiff_datetime='2021:09:10 12:33:{:02d}'.format(i))
+                        for i in range(8)]
+    gmmf = generate_mapserver_map_file()
+    data = gmmf.generate_render_data('https://test.server.lo/', 'dir', 'test.map', input_data_files, config,
+                                     workers=4, debug=True)
+    assert [layer['layer_name'] for layer in data['layers']] == ['name{}'.format(i) for i in range(8)]
+    timestamps = ['2021-09-10T12:33:{:02d}Z'.format(i) for i in range(8)]
+    assert [layer['geotiff_timestamp'] for layer in data['layers']] == timestamps
+    assert [f for f, _ in gmmf.geotiff_timings] == input_data_files
+    captured = capsys.readouterr()
+    assert 'Read geotiff metadata from {} in '.format(input_data_files[0]) in captured.out
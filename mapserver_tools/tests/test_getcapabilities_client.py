@@ -0,0 +1,195 @@
+"""Test the pooled and cached getcapabilities client against a local stub server
+"""
+
+import time
+import threading
+import http.server
+import socketserver
+
+import pytest
+
+GETCAPABILITIES = 'mapserver_tools/tests/testdata/getcapabilities.xml'
+LAYERS = ['hr_overview', 'ir_window_channel']
+
+
+class _stub_server(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+
+
+class _stub_handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests.append((self.path, dict(self.headers)))
+            count = len([p for p, _ in server.requests if p == self.path])
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+        try:
+            self._respond(server, count)
+        finally:
+            with server.lock:
+                server.in_flight -= 1
+
+    def _respond(self, server, count):
+        if self.path.startswith('/slow'):
+            time.sleep(0.1)
+        if self.path.startswith('/flaky') and count == 1:
+            self._send(503, b'try again')
+        elif self.path.startswith('/missing'):
+            self._send(404, b'not found')
+        elif self.headers.get('If-None-Match') == '"v1"' and not self.path.startswith('/changed'):
+            self._send(304, b'')
+        else:
+            self._send(200, server.body, {'ETag': '"v1"', 'Last-Modified': 'Wed, 18 May 2022 10:00:00 GMT'})
+
+    def _send(self, status, body, headers=None):
+        self.send_response(status)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        if status != 304:
+            self.send_header('Content-Type', 'text/xml; charset=UTF-8')
+            self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if status != 304:
+            self.wfile.write(body)
+
+
+@pytest.fixture
+def stub_server():
+    server = _stub_server(('127.0.0.1', 0), _stub_handler)
+    server.lock = threading.Lock()
+    server.requests = []
+    server.in_flight = 0
+    server.max_in_flight = 0
+    with open(GETCAPABILITIES, 'rb') as fh:
+        server.body = fh.read()
+    thread = threading.Thread(target=server.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True)
+    thread.start()
+    server.url = 'http://127.0.0.1:{}'.format(server.server_address[1])
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_getcapabilities_client_cache(stub_server):
+    from mapserver_tools.getcapabilities_client import getcapabilities_client
+    from mapserver_tools.edit_wms_mmd_xml_files import edit_wms_mmd_xml_files
+
+    client = getcapabilities_client(ttl=300)
+    ewmxf = edit_wms_mmd_xml_files(capabilities_client=client)
+    resource = stub_server.url + '/a?request=GetCapabilities'
+    for _ in range(5):
+        assert ewmxf.read_layers_from_getcapabilities(resource) == LAYERS
+    assert len(stub_server.requests) == 1
+    assert (client.downloads, client.hits) == (1, 4)
+    client.close()
+
+
+def test_getcapabilities_client_revalidate(stub_server):
+    from mapserver_tools.getcapabilities_client import getcapabilities_client
+
+    client = getcapabilities_client(ttl=0)
+    resource = stub_server.url + '/a'
+    text = client.get(resource)
+    assert client.get(resource) == text
+    assert client.revalidated == 1
+    assert stub_server.requests[1][1]['If-None-Match'] == '"v1"'
+    assert stub_server.requests[1][1]['If-Modified-Since'] == 'Wed, 18 May 2022 10:00:00 GMT'
+
+
+def test_getcapabilities_client_lru(stub_server):
+    from mapserver_tools.getcapabilities_client import getcapabilities_client
+
+    client = getcapabilities_client(max_entries=2)
+    for path in ('/a', '/b', '/a', '/c', '/a', '/b'):
+        client.get(stub_server.url + path)
+    # /b was the least recently used entry when /c was added
+    assert [p for p, _ in stub_server.requests] == ['/a', '/b', '/c', '/b']
+
+
+def test_getcapabilities_client_disk_cache(stub_server, tmp_path):
+    from mapserver_tools.getcapabilities_client import getcapabilities_client
+
+    resource = stub_server.url + '/a'
+    getcapabilities_client(cache_dir=str(tmp_path)).get(resource)
+    assert len(list(tmp_path.iterdir())) == 1
+
+    fresh = getcapabilities_client(cache_dir=str(tmp_path))
+    fresh.get(resource)
+    assert len(stub_server.requests) == 1
+
+    stale = getcapabilities_client(cache_dir=str(tmp_path), ttl=0)
+    stale.get(resource)
+    assert stale.revalidated == 1
+    assert stub_server.requests[-1][1]['If-None-Match'] == '"v1"'
+
+
+def test_getcapabilities_client_retry_and_errors(stub_server):
+    import requests
+    from mapserver_tools.getcapabilities_client import getcapabilities_client
+
+    client = getcapabilities_client(retries=2, backoff_factor=0)
+    assert client.get(stub_server.url + '/flaky').startswith('<?xml')
+    assert [p for p, _ in stub_server.requests] == ['/flaky', '/flaky']
+
+    with pytest.raises(requests.HTTPError):
+        client.get(stub_server.url + '/missing')
+
+
+def test_read_layers_from_getcapabilities_many(stub_server):
+    import requests
+    from mapserver_tools.edit_wms_mmd_xml_files import edit_wms_mmd_xml_files
+
+    resources = [stub_server.url + '/slow?n={}'.format(i) for i in range(9)]
+    missing = stub_server.url + '/missing'
+    ewmxf = edit_wms_mmd_xml_files()
+    start = time.perf_counter()
+    layers, errors = ewmxf.read_layers_from_getcapabilities_many(resources + [missing, resources[0]],
+                                                                 concurrency=10, per_host=3)
+    elapsed = time.perf_counter() - start
+
+    assert layers == {resource: LAYERS for resource in resources}
+    assert list(errors) == [missing]
+    assert isinstance(errors[missing], requests.HTTPError)
+    assert stub_server.max_in_flight == 3
+    # 9 slow requests of 0.1s, 3 at a time
+    assert elapsed < 0.9
+    # The client made for the call is not kept, the instance still reads without one
+    assert ewmxf.capabilities_client is None
+
+
+def test_iter_layers_from_getcapabilities(stub_server):
+    from mapserver_tools.getcapabilities_client import getcapabilities_client
+    from mapserver_tools.edit_wms_mmd_xml_files import edit_wms_mmd_xml_files
+
+    resource = stub_server.url + '/a'
+    assert list(edit_wms_mmd_xml_files().iter_layers_from_getcapabilities(resource, chunk_size=100)) == LAYERS
+    ewmxf = edit_wms_mmd_xml_files(capabilities_client=getcapabilities_client())
+    assert list(ewmxf.iter_layers_from_getcapabilities(resource)) == LAYERS
+
+
+def test_iter_layers_from_getcapabilities_chunks():
+    from mapserver_tools.edit_wms_mmd_xml_files import edit_wms_mmd_xml_files
+
+    with open(GETCAPABILITIES, 'rb') as fh:
+        document = fh.read()
+    # Repeat the layers, so the document is large and the first layers come early
+    start = document.index(b'<Layer queryable="0"')
+    end = document.index(b'</Layer>\n  </Layer>') + len(b'</Layer>\n')
+    document = document[:end] + document[start:end] * 2000 + document[end:]
+    consumed = []
+
+    def chunks():
+        for i in range(0, len(document), 4096):
+            consumed.append(i)
+            yield document[i:i + 4096]
+
+    layers = edit_wms_mmd_xml_files().iter_layers_from_getcapabilities_chunks(chunks())
+    assert next(layers) == 'hr_overview'
+    assert len(consumed) < 10
+    assert list(layers) == ['ir_window_channel'] + LAYERS * 2000
@@ -0,0 +1,41 @@
+"""Keep the MMD edit path of py-mmd-edit-resource free of the heavy map file dependencies
+"""
+
+import os
+import sys
+import json
+import shutil
+import subprocess
+
+TESTDATA = 'mapserver_tools/tests/testdata/noaa19-avhrr-20210901070230-20210901071648.xml'
+HEAVY_MODULES = ['rasterio', 'jinja2', 'requests', 'yaml', 'numpy', 'sqlite3', 'concurrent.futures']
+# Seconds, generous as CI machines vary. Loading rasterio, jinja2 and requests alone takes longer.
+IMPORT_BUDGET = float(os.environ.get('MAPSERVER_TOOLS_IMPORT_BUDGET', '0.5'))
+
+_probe = """
+import sys, time, json
+start = time.perf_counter()
+from mapserver_tools.py_mmd_edit_resource import main
+import_seconds = time.perf_counter() - start
+code = main(['-m', sys.argv[1], '-s', 'https://fastapi-dev.s-enda.k8s.met.no/api/get_mapserv'])
+print(json.dumps({'import_seconds': import_seconds, 'code': code,
+                  'modules': [m for m in sys.argv[2:] if m in sys.modules]}))
+"""
+
+
+def test_mmd_edit_import_time(tmp_path):
+    mmd_xml_file = str(tmp_path / os.path.basename(TESTDATA))
+    shutil.copy(TESTDATA, mmd_xml_file)
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join([os.getcwd()] + [p for p in [env.get('PYTHONPATH')] if p])
+    # Best of three, the first run may pay for cold disk caches
+    results = []
+    for _ in range(3):
+        output = subprocess.check_output([sys.executable, '-c', _probe, mmd_xml_file] + HEAVY_MODULES, env=env,
+                                         universal_newlines=True)
+        results.append(json.loads(output.strip().splitlines()[-1]))
+    assert all(result['code'] == 0 for result in results)
+    assert results[0]['modules'] == []
+    assert min(result['import_seconds'] for result in results) < IMPORT_BUDGET
+    with open(mmd_xml_file) as fh:
+        assert 'get_mapserv/satellite-thredds/polar-swath/2021/09/01/' in fh.read()
@@ -0,0 +1,20 @@
+"""Test expanding the input arguments of the scripts
+"""
+
+import os
+
+
+def test_collect_input_files(tmp_path):
+    from mapserver_tools.input_files import collect_input_files
+    sub = tmp_path / 'sub'
+    sub.mkdir()
+    geotiffs = []
+    for name in ['overview_20210910_123318.tif', 'natural_with_night_fog_20210910_123318.tif']:
+        (sub / name).write_bytes(b'')
+        geotiffs.append(str(sub / name))
+    (sub / 'overview_20210910_123318.tif.aux.xml').write_text('x')
+
+    assert collect_input_files([str(tmp_path)], pattern='*.tif') == sorted(geotiffs)
+    assert len(collect_input_files([str(tmp_path)])) == 3
+    assert collect_input_files([os.path.join(str(tmp_path), '**', '*.tif'), geotiffs[0]]) == sorted(geotiffs)
+    assert collect_input_files([geotiffs[1], geotiffs[0], geotiffs[1]]) == [geotiffs[1], geotiffs[0]]
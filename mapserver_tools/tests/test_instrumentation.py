@@ -0,0 +1,85 @@
+"""Test the per stage instrumentation
+"""
+
+import json
+import argparse
+
+import pytest
+
+TESTDATA = 'mapserver_tools/tests/testdata/noaa19-avhrr-20210901070230-20210901071648.xml'
+NS = {'mmd': 'http://www.met.no/schema/mmd',
+      'gml': 'http://www.opengis.net/gml'}
+
+
+def test_instrument_and_uninstrument(tmp_path):
+    from mapserver_tools.edit_wms_mmd_xml_files import edit_wms_mmd_xml_files
+    from mapserver_tools.instrumentation import instrument
+    from mapserver_tools.instrumentation import uninstrument
+
+    original = edit_wms_mmd_xml_files.open_mmd_xml_file
+    metrics = instrument()
+    try:
+        assert edit_wms_mmd_xml_files.open_mmd_xml_file is not original
+        # A second instrument() does not wrap the wrappers
+        assert instrument(metrics=metrics).patched == metrics.patched
+        ewmxf = edit_wms_mmd_xml_files()
+        xtree = ewmxf.open_mmd_xml_file(TESTDATA, NS)
+        ewmxf.rewrite_mmd_xml(xtree, str(tmp_path / 'out.xml'))
+        with pytest.raises(ValueError):
+            ewmxf.generate_uri('no-time-in-this-name.xml')
+    finally:
+        uninstrument(metrics)
+    assert edit_wms_mmd_xml_files.open_mmd_xml_file is original
+
+    stages = metrics.summary()['stages']
+    assert stages['edit_wms_mmd_xml_files.open_mmd_xml_file']['count'] == 1
+    assert stages['edit_wms_mmd_xml_files.rewrite_mmd_xml']['count'] == 1
+    assert stages['edit_wms_mmd_xml_files.generate_uri']['errors'] == 1
+    assert stages['edit_wms_mmd_xml_files.open_mmd_xml_file']['buckets']['10.0'] == 1
+
+
+def test_histogram_and_exports(tmp_path):
+    from mapserver_tools.instrumentation import stage_metrics
+
+    metrics = stage_metrics(buckets=(0.01, 0.1))
+    metrics.observe('a', 0.005)
+    metrics.observe('a', 0.05)
+    metrics.observe('a', 5.0, error=True)
+    summary = metrics.summary()['stages']['a']
+    assert summary['buckets'] == {'0.01': 1, '0.1': 2}
+    assert (summary['count'], summary['errors'], summary['max']) == (3, 1, 5.0)
+
+    json_file = tmp_path / 'metrics.json'
+    metrics.write_json(str(json_file))
+    assert json.loads(json_file.read_text())['stages']['a']['count'] == 3
+
+    prom_file = tmp_path / 'metrics.prom'
+    metrics.write_prometheus(str(prom_file))
+    text = prom_file.read_text()
+    assert '# TYPE mapserver_tools_stage_seconds histogram' in text
+    assert 'mapserver_tools_stage_seconds_bucket{stage="a",le="0.1"} 2' in text
+    assert 'mapserver_tools_stage_seconds_bucket{stage="a",le="+Inf"} 3' in text
+    assert 'mapserver_tools_stage_seconds_count{stage="a"} 3' in text
+    assert 'mapserver_tools_stage_errors_total{stage="a"} 1' in text
+
+
+def test_instrumentation_from_args(tmp_path, capsys):
+    from mapserver_tools.edit_wms_mmd_xml_files import edit_wms_mmd_xml_files
+    from mapserver_tools.instrumentation import add_instrumentation_arguments
+    from mapserver_tools.instrumentation import instrumentation_from_args
+
+    parser = argparse.ArgumentParser()
+    add_instrumentation_arguments(parser)
+    cmd_args = parser.parse_args(['--metrics', '--metrics-json', str(tmp_path / 'm.json'),
+                                  '--profile', str(tmp_path / 'run.prof'), '--tracemalloc', '3'])
+    with instrumentation_from_args(cmd_args) as metrics:
+        edit_wms_mmd_xml_files().open_mmd_xml_file(TESTDATA, NS)
+    assert metrics.patched == []
+    assert (tmp_path / 'm.json').exists()
+    assert (tmp_path / 'run.prof').exists()
+    err = capsys.readouterr().err
+    assert 'edit_wms_mmd_xml_files.open_mmd_xml_file' in err
+    assert 'Top allocations' in err
+
+    with instrumentation_from_args(parser.parse_args([])) as metrics:
+        assert metrics is None
@@ -0,0 +1,72 @@
+"""Test the compiled layer config matcher
+"""
+
+import pytest
+
+CONFIG = {'layers': [{'match': 'overview',
+                      'name': 'Overview',
+                      'title': 'Overview'},
+                     {'match': 'overview_hr',
+                      'name': 'hr_overview',
+                      'title': 'High resolution overview'},
+                     {'match': 'overview',
+                      'name': 'Duplicate',
+                      'title': 'Duplicate'},
+                     {'regex': '^natural_(with|without)_night_fog_',
+                      'name': 'natural_with_night_fog',
+                      'title': 'Natural with night fog'}]}
+
+
+def test_layer_matcher():
+    from mapserver_tools.layer_matcher import compile_layer_config
+    matcher = compile_layer_config(CONFIG)
+    assert compile_layer_config(matcher) is matcher
+    assert matcher.match('/data/overview_20210910_123318.tif')['name'] == 'Overview'
+    assert matcher.match('/data/overview_hr_20210910_123318.tif')['name'] == 'hr_overview'
+    assert matcher.match('natural_without_night_fog_20210910_123318.tif')['name'] == 'natural_with_night_fog'
+
+
+def test_layer_matcher_errors():
+    from mapserver_tools.layer_matcher import layer_matcher
+    from mapserver_tools.layer_matcher import layer_config_match_error
+    with pytest.raises(layer_config_match_error, match='ir_window_20210910_123318.tif'):
+        layer_matcher(CONFIG).match('/data/ir_window_20210910_123318.tif')
+    with pytest.raises(layer_config_match_error):
+        layer_matcher({'layers': [{'name': 'x', 'title': 'x'}]})
+
+
+def test_generate_render_data_unmatched_file(make_geotiff):
+    from mapserver_tools.layer_matcher import layer_config_match_error
+    from mapserver_tools.edit_wms_mmd_xml_files import generate_mapserver_map_file
+    input_data_files = [make_geotiff('ir_window_20210910_123318.tif', width=8, height=8)]
+    with pytest.raises(layer_config_match_error):
+        generate_mapserver_map_file().generate_render_data('https://test.server.lo/', 'dir', 'test.map',
+                                                           input_data_files, CONFIG)
+
+
+def test_match_input_file_with_layer_config_matcher():
+    from mapserver_tools.layer_matcher import compile_layer_config
+    from mapserver_tools.edit_wms_mmd_xml_files import match_input_file_with_layer_config
+    matcher = compile_layer_config(CONFIG)
+    assert match_input_file_with_layer_config('overview_hr_1.tif', matcher)['name'] == 'hr_overview'
+    assert match_input_file_with_layer_config('overview_hr_1.tif', CONFIG)['name'] == 'hr_overview'
+
+
+def test_get_layer_matcher(mocker):
+    import copy
+
+    from mapserver_tools import layer_matcher
+    from mapserver_tools.edit_wms_mmd_xml_files import match_input_file_with_layer_config
+    matcher = layer_matcher.get_layer_matcher(CONFIG)
+    assert layer_matcher.get_layer_matcher(CONFIG) is matcher
+    assert layer_matcher.get_layer_matcher(matcher) is matcher
+    other = copy.deepcopy(CONFIG)
+    assert layer_matcher.get_layer_matcher(other) is not matcher
+
+    compile = mocker.spy(layer_matcher.layer_matcher, '__init__')
+    for name in ['overview_hr_1.tif', 'overview_2.tif']:
+        match_input_file_with_layer_config(name, CONFIG)
+        match_input_file_with_layer_config(name, other)
+    assert compile.call_count == 0
+    match_input_file_with_layer_config('overview_2.tif', copy.deepcopy(CONFIG))
+    assert compile.call_count == 1
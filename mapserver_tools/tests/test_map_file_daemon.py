@@ -0,0 +1,163 @@
+"""Test the map file generator service
+"""
+
+import os
+import sys
+
+import pytest
+
+CONFIG = {'layers': [{'match': 'overview',
+                      'name': 'Overview',
+                      'title': 'Overview'},
+                     {'match': 'natural_with_night_fog',
+                      'name': 'natural_with_night_fog',
+                      'title': 'Natural with night fog'}]}
+
+
+class _fake_watcher():
+    def __init__(self):
+        self.queue = []
+
+    def wait(self, timeout):
+        files, self.queue = self.queue, []
+        return files
+
+    def close(self):
+        pass
+
+
+class _fake_clock():
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def _layer_names(map_file):
+    return [name for name in ('Overview', 'natural_with_night_fog')
+            if 'NAME "{}"'.format(name) in map_file.read_text()]
+
+
+def _service(tmp_path, watcher, clock, cog_output_dir=None, catalog=None):
+    from mapserver_tools.map_file_daemon import map_file_generator_service
+    output_dir = tmp_path / 'map-files'
+    output_dir.mkdir(exist_ok=True)
+    return map_file_generator_service(watcher, CONFIG, 'https://test.server.lo', '/data', str(output_dir),
+                                      'templates/', 'map-file-template-okd-satellite.map',
+                                      settle=5, timeout=60, clock=clock, cog_output_dir=cog_output_dir,
+                                      catalog=catalog)
+
+
+def test_map_file_generator_service(tmp_path, make_geotiff, capsys):
+    watcher = _fake_watcher()
+    clock = _fake_clock()
+    service = _service(tmp_path, watcher, clock)
+
+    watcher.queue = [make_geotiff('natural_with_night_fog_20210910_123318.tif', width=8, height=8),
+                     make_geotiff('overview_20210910_130000.tif', width=8, height=8),
+                     make_geotiff('ir_window_20210910_123318.tif', width=8, height=8)]
+    assert service.run_once(0) == []
+    assert sorted(service.products) == ['20210910_123318', '20210910_130000']
+
+    clock.now = 3
+    watcher.queue = [make_geotiff('overview_20210910_123318.tif', width=8, height=8)]
+    assert service.run_once(0) == []
+    # Complete, but not settled yet
+    clock.now = 7
+    assert service.run_once(0) == []
+    clock.now = 8
+    assert service.run_once(0) == ['mapserver-20210910_123318.map']
+
+    map_file = tmp_path / 'map-files' / 'mapserver-20210910_123318.map'
+    content = map_file.read_text()
+    assert content.index('NAME "Overview"') < content.index('NAME "natural_with_night_fog"')
+    assert 'DATA /data/overview_20210910_123318.tif' in content
+
+    # The incomplete product is rendered after the timeout
+    clock.now = 60
+    assert service.run_once(0) == ['mapserver-20210910_130000.map']
+    assert service.products == {}
+    captured = capsys.readouterr()
+    assert 'Ignoring {}'.format(str(tmp_path / 'ir_window_20210910_123318.tif')) in captured.out
+
+
+def test_map_file_generator_service_late_file(tmp_path, make_geotiff):
+    from mapserver_tools.product_catalog import product_catalog
+
+    watcher = _fake_watcher()
+    clock = _fake_clock()
+    catalog = product_catalog(str(tmp_path / 'catalog.db'))
+    service = _service(tmp_path, watcher, clock, catalog=catalog)
+    overview = make_geotiff('overview_20210910_123318.tif', width=8, height=8)
+    watcher.queue = [make_geotiff('natural_with_night_fog_20210910_123318.tif', width=8, height=8), overview]
+    service.run_once(0)
+    clock.now = 10
+    assert service.run_once(0) == ['mapserver-20210910_123318.map']
+    map_file = tmp_path / 'map-files' / 'mapserver-20210910_123318.map'
+    assert _layer_names(map_file) == ['Overview', 'natural_with_night_fog']
+
+    # The overview is delivered again, the product is complete with the natural file it had and is rendered
+    # after settle seconds instead of as an incomplete product after the timeout
+    clock.now = 100
+    watcher.queue = [overview]
+    service.run_once(0)
+    assert sorted(service.products['20210910_123318']['files']) == ['Overview', 'natural_with_night_fog']
+    clock.now = 105
+    assert service.run_once(0) == ['mapserver-20210910_123318.map']
+    assert _layer_names(map_file) == ['Overview', 'natural_with_night_fog']
+
+    # A restarted daemon takes the files of the product from the catalog
+    service = _service(tmp_path, watcher, clock, catalog=catalog)
+    watcher.queue = [overview]
+    service.run_once(0)
+    clock.now = 110
+    assert service.run_once(0) == ['mapserver-20210910_123318.map']
+    assert _layer_names(map_file) == ['Overview', 'natural_with_night_fog']
+    catalog.close()
+
+
+def test_map_file_generator_service_cog(tmp_path, make_geotiff):
+    watcher = _fake_watcher()
+    clock = _fake_clock()
+    cog_output_dir = tmp_path / 'cog'
+    service = _service(tmp_path, watcher, clock, cog_output_dir=str(cog_output_dir))
+
+    watcher.queue = [make_geotiff('natural_with_night_fog_20210910_123318.tif', width=600, height=600),
+                     make_geotiff('overview_20210910_123318.tif', width=600, height=600)]
+    service.run_once(0)
+    clock.now = 10
+    assert service.run_once(0) == ['mapserver-20210910_123318.map']
+    content = (tmp_path / 'map-files' / 'mapserver-20210910_123318.map').read_text()
+    assert 'DATA /data/mapserver/cog/overview_20210910_123318.tif' in content
+    assert (cog_output_dir / 'overview_20210910_123318.tif').exists()
+
+
+def test_polling_watcher(tmp_path, make_geotiff):
+    from mapserver_tools.map_file_daemon import polling_watcher
+    existing = make_geotiff('overview_1.tif', width=8, height=8)
+    assert polling_watcher([str(tmp_path)], scan_existing=True).wait(0) == [existing]
+
+    watcher = polling_watcher([str(tmp_path)])
+    assert watcher.wait(0) == []
+    new = make_geotiff('overview_2.tif', width=8, height=8)
+    (tmp_path / 'other.txt').write_text('x')
+    assert watcher.wait(0) == [new]
+    assert watcher.wait(0) == []
+
+
+@pytest.mark.skipif(not sys.platform.startswith('linux'), reason="inotify is Linux only")
+def test_inotify_watcher(tmp_path, make_geotiff):
+    from mapserver_tools.map_file_daemon import create_watcher
+    from mapserver_tools.map_file_daemon import inotify_watcher
+    watcher = create_watcher([str(tmp_path)])
+    assert isinstance(watcher, inotify_watcher)
+    new = make_geotiff('overview_2.tif', width=8, height=8)
+    os.rename(new, new + '.moved.tif')
+    changed = []
+    for _ in range(20):
+        changed.extend(watcher.wait(0.1))
+        if new + '.moved.tif' in changed:
+            break
+    watcher.close()
+    assert changed == [new, new + '.moved.tif']
@@ -0,0 +1,114 @@
+"""Test the mapcache config generator and the seeding plan
+"""
+
+import threading
+import subprocess
+import xml.etree.ElementTree as et
+
+import pytest
+
+RENDER_DATA = {'map_file_name': '/data/mapserver/map-files/mapserver-okd.map',
+               'layers': [{'layer_name': 'Overview',
+                           'layer_title': 'Overview',
+                           'time_extent': '2021-09-10T12:33:18Z,2021-09-10T14:00:00Z'},
+                          {'layer_name': 'natural_with_night_fog',
+                           'layer_title': 'Natural with night fog',
+                           'time_extent': '2021-09-10T12:33:18Z'}]}
+
+PRODUCT_DATA = {'map_file_name': '/data/mapserver/map-files/mapserver-20210910_123318.map',
+                'layers': [{'layer_name': 'Overview',
+                            'layer_title': 'Overview',
+                            'geotiff_timestamp': '2021-09-10T12:33:18Z'}]}
+
+
+def test_generate_mapcache_config(tmp_path):
+    from mapserver_tools.mapcache_config import collect_tilesets
+    from mapserver_tools.mapcache_config import generate_mapcache_config
+    from mapserver_tools.mapcache_config import write_mapcache_config
+
+    tilesets = collect_tilesets([RENDER_DATA])
+    assert [tileset['name'] for tileset in tilesets] == ['Overview', 'natural_with_night_fog']
+    mapcache_xml = str(tmp_path / 'mapcache.xml')
+    mapcache = generate_mapcache_config(tilesets, 'http://localhost/cgi-bin/mapserv?')
+    assert write_mapcache_config(mapcache_xml, mapcache)
+    assert not write_mapcache_config(mapcache_xml, generate_mapcache_config(tilesets,
+                                                                            'http://localhost/cgi-bin/mapserv?'))
+
+    root = et.parse(mapcache_xml).getroot()
+    cache = root.find("cache[@name='disk']")
+    assert cache.get('type') == 'disk' and cache.get('layout') == 'template'
+    assert cache.find('template').text.endswith('{tileset}#{grid}#{dim}/{z}/{x}/{y}.{ext}')
+    source = root.find("source[@name='Overview']")
+    assert source.find('getmap/params/MAP').text == '/data/mapserver/map-files/mapserver-okd.map'
+    assert source.find('getmap/params/LAYERS').text == 'Overview'
+    tileset = root.find("tileset[@name='Overview']")
+    assert tileset.find('source').text == 'Overview'
+    assert [grid.text for grid in tileset.findall('grid')] == ['WGS84', 'GoogleMapsCompatible']
+    dimension = tileset.find("dimensions/dimension[@name='TIME']")
+    assert dimension.get('default') == '2021-09-10T14:00:00Z'
+    assert [value.text for value in dimension.findall('value')] == ['2021-09-10T12:33:18Z', '2021-09-10T14:00:00Z']
+
+
+def test_collect_tilesets_per_product():
+    from mapserver_tools.mapcache_config import collect_tilesets
+
+    with pytest.raises(ValueError):
+        collect_tilesets([RENDER_DATA, PRODUCT_DATA])
+    tilesets = collect_tilesets([RENDER_DATA, PRODUCT_DATA], tileset_name='{map_file}-{layer_name}')
+    assert [tileset['name'] for tileset in tilesets] == ['mapserver-20210910_123318-Overview',
+                                                         'mapserver-okd-Overview',
+                                                         'mapserver-okd-natural_with_night_fog']
+    assert collect_tilesets([RENDER_DATA, RENDER_DATA])[0]['times'] == ['2021-09-10T12:33:18Z',
+                                                                        '2021-09-10T14:00:00Z']
+
+
+def test_seeding_plan():
+    from mapserver_tools.mapcache_config import collect_tilesets
+    from mapserver_tools.mapcache_config import seeding_plan
+    from mapserver_tools.mapcache_config import seed_command
+
+    tilesets = collect_tilesets([RENDER_DATA])
+    plan = seeding_plan(tilesets, zoom_levels=range(0, 2), grids=('WGS84',))
+    assert [(job['time'], job['zoom'], job['tileset']) for job in plan] == [
+        ('2021-09-10T14:00:00Z', 0, 'Overview'),
+        ('2021-09-10T12:33:18Z', 0, 'natural_with_night_fog'),
+        ('2021-09-10T14:00:00Z', 1, 'Overview'),
+        ('2021-09-10T12:33:18Z', 1, 'natural_with_night_fog'),
+        ('2021-09-10T12:33:18Z', 0, 'Overview'),
+        ('2021-09-10T12:33:18Z', 1, 'Overview')]
+    assert [job['priority'] for job in plan] == list(range(6))
+    assert len(seeding_plan(tilesets, zoom_levels=range(0, 2), max_times=1)) == 8
+    assert seed_command(plan[0], 'mapcache.xml') == ['mapcache_seed', '-c', 'mapcache.xml', '-t', 'Overview',
+                                                     '-g', 'WGS84', '-z', '0,0', '-D', 'TIME=2021-09-10T14:00:00Z',
+                                                     '-n', '2', '-m', 'seed']
+
+
+def test_run_seeding_plan(capsys):
+    from mapserver_tools.mapcache_config import collect_tilesets
+    from mapserver_tools.mapcache_config import seeding_plan
+    from mapserver_tools.mapcache_config import run_seeding_plan
+
+    plan = seeding_plan(collect_tilesets([RENDER_DATA]), zoom_levels=range(0, 3))
+    lock = threading.Lock()
+    state = {'running': 0, 'max_running': 0, 'commands': []}
+
+    def run(command):
+        with lock:
+            state['running'] += 1
+            state['max_running'] = max(state['max_running'], state['running'])
+            state['commands'].append(command)
+        threading.Event().wait(0.01)
+        with lock:
+            state['running'] -= 1
+        return subprocess.CompletedProcess(command, 1 if command[4] == 'natural_with_night_fog' else 0)
+
+    results = run_seeding_plan(plan, 'mapcache.xml', jobs=3, run=run)
+    assert [job for job, _, _ in results] == plan
+    assert len(state['commands']) == len(plan)
+    assert 1 < state['max_running'] <= 3
+    assert sum(1 for _, returncode, _ in results if returncode) == 6
+    assert 'Seeding natural_with_night_fog' in capsys.readouterr().out
+
+    results = run_seeding_plan(plan, 'mapcache.xml', dry_run=True, run=None)
+    assert all(returncode is None for _, returncode, _ in results)
+    assert capsys.readouterr().out.count('mapcache_seed -c mapcache.xml') == len(plan)
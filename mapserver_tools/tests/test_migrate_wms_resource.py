@@ -0,0 +1,125 @@
+"""Test moving the OGC WMS resource of mmd xml files to another server
+"""
+
+import os
+import shutil
+
+import pytest
+
+TESTDATA = 'mapserver_tools/tests/testdata/noaa19-avhrr-20210901070230-20210901071648.xml'
+OLD = 'https://fastapi-dev.s-enda.k8s.met.no/api/get_mapserv'
+NEW = 'https://fastapi.s-enda.k8s.met.no/api/get_mapserv'
+
+
+def _edited_copies(tmp_path, server_name, names):
+    from mapserver_tools.batch_edit_wms_mmd_xml_files import batch_edit_mmd_xml_files
+
+    mmd_xml_files = []
+    for name in names:
+        mmd_xml_file = str(tmp_path / name)
+        shutil.copy(TESTDATA, mmd_xml_file)
+        mmd_xml_files.append(mmd_xml_file)
+    batch_edit_mmd_xml_files(mmd_xml_files, server_name, workers=1)
+    return mmd_xml_files
+
+
+def test_migrate_wms_resources(tmp_path):
+    from mapserver_tools.migrate_wms_resource import migrate_wms_resources
+
+    names = ['noaa19-avhrr-20210901070230-20210901071648.xml', 'noaa19-avhrr-20210901090230-20210901091648.xml']
+    mmd_xml_files = _edited_copies(tmp_path, OLD, names)
+    (tmp_path / 'expected').mkdir()
+    expected = _edited_copies(tmp_path / 'expected', NEW, names)
+    other = str(tmp_path / 'other.xml')
+    shutil.copy(TESTDATA, other)
+    before = [open(f, 'rb').read() for f in mmd_xml_files]
+
+    summary = migrate_wms_resources(mmd_xml_files + [other], OLD, NEW, workers=1, dry_run=True)
+    assert summary['counts'] == {'migrated': 2, 'no match': 1, 'failed': 0}
+    assert [open(f, 'rb').read() for f in mmd_xml_files] == before
+    assert len(summary['diffs']) == 2
+    diff_lines = [line for line in summary['diffs'][0].splitlines() if line[:1] in '+-']
+    assert len(diff_lines) == 4
+    assert OLD in diff_lines[2] and NEW in diff_lines[3]
+
+    summary = migrate_wms_resources(mmd_xml_files + [other], OLD, NEW, workers=2, chunksize=1)
+    assert summary['counts'] == {'migrated': 2, 'no match': 1, 'failed': 0}
+    assert summary['diffs'] == []
+    assert [open(f, 'rb').read() for f in mmd_xml_files] == [open(f, 'rb').read() for f in expected]
+
+    summary = migrate_wms_resources(mmd_xml_files, OLD, NEW, workers=1)
+    assert summary['counts'] == {'migrated': 0, 'no match': 2, 'failed': 0}
+
+
+def test_migrate_wms_resources_checkpoint(tmp_path):
+    from mapserver_tools.migrate_wms_resource import migrate_wms_resources
+    from mapserver_tools.migrate_wms_resource import migration_checkpoint_error
+
+    names = ['noaa19-avhrr-20210901070230-20210901071648.xml', 'noaa19-avhrr-20210901090230-20210901091648.xml']
+    mmd_xml_files = _edited_copies(tmp_path, OLD, names)
+    broken = str(tmp_path / 'broken.xml')
+    with open(broken, 'w') as fh:
+        fh.write('<mmd:mmd xmlns:mmd="http://www.met.no/schema/mmd">' + OLD)
+    checkpoint = str(tmp_path / 'checkpoint')
+
+    # Interrupted after the first file
+    summary = migrate_wms_resources(mmd_xml_files[:1] + [broken], OLD, NEW, workers=1, checkpoint_file=checkpoint)
+    assert summary['counts'] == {'migrated': 1, 'no match': 0, 'failed': 1}
+    assert summary['failed'][0][0] == broken
+
+    summary = migrate_wms_resources(mmd_xml_files + [broken], OLD, NEW, workers=1, checkpoint_file=checkpoint)
+    assert summary['checkpoint_skipped'] == 1
+    assert summary['counts'] == {'migrated': 1, 'no match': 0, 'failed': 1}
+    with open(checkpoint) as fh:
+        assert fh.read().splitlines() == ['# {} -> {}'.format(OLD, NEW)] + ['migrated\t' + f for f in mmd_xml_files]
+
+    with pytest.raises(migration_checkpoint_error):
+        migrate_wms_resources(mmd_xml_files, NEW, OLD, workers=1, checkpoint_file=checkpoint)
+
+
+def test_migrate_wms_resources_relayer(tmp_path):
+    from mapserver_tools.migrate_wms_resource import main
+
+    mmd_xml_file = _edited_copies(tmp_path, OLD, [os.path.basename(TESTDATA)])[0]
+    rules = tmp_path / 'rules.yaml'
+    rules.write_text("default: [overview]\n")
+
+    assert main(['--old-prefix', OLD, '--new-prefix', NEW, '-i', str(tmp_path), '--relayer', '-r', str(rules),
+                 '-w', '1']) == 0
+    with open(mmd_xml_file) as fh:
+        content = fh.read()
+    assert NEW in content and OLD not in content
+    assert '<mmd:wms_layers><mmd:wms_layer>overview</mmd:wms_layer></mmd:wms_layers>' in content
+
+
+def test_migrate_keeps_unedited_document(tmp_path):
+    from mapserver_tools.migrate_wms_resource import migrate_wms_resources
+
+    with open(TESTDATA, 'rb') as fh:
+        body = fh.read()
+    body = body.replace(b'<mmd:mmd xmlns:mmd', b'<mmd:mmd xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" '
+                                               b'xmlns:mmd', 1)
+    original = b'<?xml version="1.0" encoding="UTF-8"?>\n<!-- Harvested record -->\n' + body
+    mmd_xml_file = tmp_path / os.path.basename(TESTDATA)
+    mmd_xml_file.write_bytes(original)
+    old = 'https://thredds.met.no/thredds/'
+    new = 'https://thredds-new.met.no/thredds/'
+
+    summary = migrate_wms_resources([str(mmd_xml_file)], old, new, workers=1, dry_run=True)
+    diff_lines = summary['diffs'][0].splitlines()[3:]
+    assert [line[0] for line in diff_lines] == ['-', '+']
+    assert diff_lines[1] == ('+    <mmd:resource>https://thredds-new.met.no/thredds/wms/remotesensingsatellite/'
+                             'polar-swath/2021/09/01/noaa19-avhrr-20210901070230-20210901071648.nc'
+                             '?service=WMS&amp;version=1.3.0&amp;request=GetCapabilities</mmd:resource>')
+
+    summary = migrate_wms_resources([str(mmd_xml_file)], old, new, workers=1)
+    assert summary['counts']['migrated'] == 1
+    # Only the OGC WMS resource is changed, the OPeNDAP and HTTP resources with the same prefix are not
+    assert mmd_xml_file.read_bytes() == original.replace(old.encode() + b'wms/', new.encode() + b'wms/')
+
+    # A resource start tag in a comment does not line up with the document, the file is left alone
+    confusing = original.replace(b'<!-- Harvested record -->', b'<!-- <mmd:resource> -->')
+    mmd_xml_file.write_bytes(confusing)
+    summary = migrate_wms_resources([str(mmd_xml_file)], old, new, workers=1)
+    assert summary['counts']['failed'] == 1
+    assert mmd_xml_file.read_bytes() == confusing
@@ -0,0 +1,87 @@
+"""Test the reusable mmd document processor
+"""
+
+import os
+import shutil
+
+TESTDATA = 'mapserver_tools/tests/testdata/noaa19-avhrr-20210901070230-20210901071648.xml'
+GETCAPABILITIES = 'mapserver_tools/tests/testdata/getcapabilities.xml'
+FAST_API = 'https://fastapi-dev.s-enda.k8s.met.no/api/get_mapserv'
+
+
+def test_edit_mmd_xml_file_same_as_methods(tmp_path):
+    from mapserver_tools.edit_wms_mmd_xml_files import edit_wms_mmd_xml_files
+    from mapserver_tools.edit_wms_mmd_xml_files import select_wms_layers
+    from mapserver_tools.mmd_document_processor import MMD_NS
+    from mapserver_tools.mmd_document_processor import mmd_document_processor
+
+    expected = str(tmp_path / 'expected' / os.path.basename(TESTDATA))
+    actual = str(tmp_path / 'actual' / os.path.basename(TESTDATA))
+    os.mkdir(os.path.dirname(expected))
+    os.mkdir(os.path.dirname(actual))
+    shutil.copy(TESTDATA, expected)
+    shutil.copy(TESTDATA, actual)
+
+    ewmxf = edit_wms_mmd_xml_files()
+    bn, netcdf_path = ewmxf.generate_uri(expected)
+    xtree = ewmxf.open_mmd_xml_file(expected, MMD_NS)
+    xroot = xtree.getroot()
+    ewmxf.remove_wms_from_mmd_xml(xroot, MMD_NS)
+    ewmxf.add_wms_to_mmd_xml(xroot, os.path.join(FAST_API, netcdf_path), select_wms_layers(bn))
+    ewmxf.rewrite_mmd_xml(xtree, expected)
+
+    processor = mmd_document_processor()
+    assert processor.edit_mmd_xml_file(actual, FAST_API) is True
+    with open(expected, 'rb') as fh_expected, open(actual, 'rb') as fh_actual:
+        assert fh_actual.read() == fh_expected.read()
+    assert processor.edit_mmd_xml_file(actual, FAST_API) is False
+
+
+def test_lookups():
+    from mapserver_tools.edit_wms_mmd_xml_files import edit_wms_mmd_xml_files
+    from mapserver_tools.mmd_document_processor import MMD_NS
+    from mapserver_tools.mmd_document_processor import mmd_document_processor
+
+    processor = mmd_document_processor()
+    xroot = processor.parse(TESTDATA).getroot()
+    ewmxf = edit_wms_mmd_xml_files()
+    expected = ewmxf.get_platform_and_instrument_from_mmd_xml(xroot, MMD_NS)
+    assert processor.platform_and_instrument(xroot) == expected
+    assert processor.metadata_identifier(xroot) == '4f0946c4-3a0b-42b8-9094-69287d16fa64'
+    assert processor.metadata_identifier(xroot, 'abc') == 'abc'
+
+    processor.remove_wms(xroot)
+    for data_access in xroot.findall('mmd:data_access', MMD_NS):
+        assert data_access.find('mmd:type', MMD_NS).text != 'OGC WMS'
+
+
+def test_parse_layers_from_getcapabilities():
+    from mapserver_tools.edit_wms_mmd_xml_files import edit_wms_mmd_xml_files
+    from mapserver_tools.mmd_document_processor import mmd_document_processor
+
+    with open(GETCAPABILITIES, 'r') as fh:
+        gcd = fh.read()
+    layers = mmd_document_processor().parse_layers_from_getcapabilities(gcd)
+    assert layers
+    assert layers == edit_wms_mmd_xml_files().parse_layers_from_getcapabilities(gcd)
+
+
+def test_get_mmd_document_processor(monkeypatch):
+    import pytest
+
+    from mapserver_tools.mmd_document_processor import get_mmd_document_processor
+    from mapserver_tools.wms_layer_rules import load_wms_layer_rules
+
+    monkeypatch.delenv('MAPSERVER_TOOLS_XML_BACKEND', raising=False)
+    rules = load_wms_layer_rules()
+    processor = get_mmd_document_processor(layer_rules=rules)
+    assert get_mmd_document_processor(layer_rules=rules) is processor
+    assert get_mmd_document_processor(layer_rules=rules, backend='etree') is processor
+    assert get_mmd_document_processor() is not processor
+
+    pytest.importorskip('lxml')
+    monkeypatch.setenv('MAPSERVER_TOOLS_XML_BACKEND', 'lxml')
+    lxml_processor = get_mmd_document_processor(layer_rules=rules)
+    assert lxml_processor is not processor
+    assert lxml_processor.ewmxf.xml.name == 'lxml'
+    assert get_mmd_document_processor(layer_rules=rules, backend='lxml') is lxml_processor
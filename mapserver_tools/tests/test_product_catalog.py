@@ -0,0 +1,109 @@
+"""Test the sqlite product catalog
+"""
+
+import os
+import shutil
+
+TESTDATA = 'mapserver_tools/tests/testdata/noaa19-avhrr-20210901070230-20210901071648.xml'
+FAST_API = 'https://fastapi-dev.s-enda.k8s.met.no/api/get_mapserv'
+CONFIG = {'layers': [{'match': 'overview', 'name': 'Overview', 'title': 'Overview'},
+                     {'match': 'natural_with_night_fog', 'name': 'natural_with_night_fog',
+                      'title': 'Natural with night fog'}]}
+
+
+def test_batch_edit_with_catalog(tmp_path):
+    from mapserver_tools.batch_edit_wms_mmd_xml_files import batch_edit_mmd_xml_files
+    from mapserver_tools.product_catalog import product_catalog
+
+    mmd_xml_file = str(tmp_path / os.path.basename(TESTDATA))
+    shutil.copy(TESTDATA, mmd_xml_file)
+    catalog = product_catalog(str(tmp_path / 'catalog.db'))
+
+    results = batch_edit_mmd_xml_files([mmd_xml_file], FAST_API, workers=1, catalog=catalog)
+    assert results[0][1] is True and results[0][4] is True
+    assert catalog.stats()['mmd_files'] == 1
+
+    # Recorded and unchanged: skipped without being read
+    results = batch_edit_mmd_xml_files([mmd_xml_file], FAST_API, workers=1, catalog=catalog)
+    assert results == [(mmd_xml_file, True, None, 0.0, False)]
+
+    # Touched with the same content: still skipped
+    os.utime(mmd_xml_file, ns=(1, 1))
+    assert catalog.mmd_unchanged(mmd_xml_file, '{}|built-in'.format(FAST_API))
+
+    # Another server name is edited again
+    assert not catalog.mmd_unchanged(mmd_xml_file, 'https://other|built-in')
+    results = batch_edit_mmd_xml_files([mmd_xml_file], 'https://other', workers=1, stream=True, catalog=catalog)
+    assert results[0][4] is True
+
+    rows = catalog.query_time_range('2021-09-01T07:10:00Z', '2021-09-01T08:00:00Z')
+    assert [row['path'] for row in rows] == [os.path.abspath(mmd_xml_file)]
+    assert rows[0]['metadata_identifier'] == '4f0946c4-3a0b-42b8-9094-69287d16fa64'
+    assert rows[0]['start_time'] == '2021-09-01T07:02:30Z'
+    assert rows[0]['netcdf_path'].endswith('2021/09/01/noaa19-avhrr-20210901070230-20210901071648.nc')
+    assert catalog.query_time_range('2021-09-02', '2021-09-03') == []
+    assert [row['path'] for row in catalog.query_layer('ir_window_channel')] == [os.path.abspath(mmd_xml_file)]
+    assert catalog.query_layer('adaptive_dnb') == []
+    catalog.close()
+
+
+def test_map_files_in_catalog(tmp_path, make_geotiff, capsys):
+    from mapserver_tools.edit_wms_mmd_xml_files import generate_mapserver_map_file
+    from mapserver_tools.product_catalog import geotiffs_from_render_data
+    from mapserver_tools.product_catalog import main
+    from mapserver_tools.product_catalog import map_file_settings
+    from mapserver_tools.product_catalog import product_catalog
+
+    overview = make_geotiff('overview_20210910_123318.tif')
+    natural = make_geotiff('natural_with_night_fog_20210910_123318.tif')
+    gmmf = generate_mapserver_map_file()
+    data = gmmf.generate_render_data('https://server', '/data', 'a.map', [overview, natural], CONFIG)
+    template = gmmf.load_template('templates/', 'map-file-template-okd-satellite.map')
+    gmmf.write_map_file(str(tmp_path), 'a.map', template, data)
+    map_file = str(tmp_path / 'a.map')
+
+    catalog_file = str(tmp_path / 'catalog.db')
+    catalog = product_catalog(catalog_file)
+    settings = map_file_settings('https://server', '/data', 'templates/map-file-template-okd-satellite.map', CONFIG)
+    assert not catalog.map_file_unchanged(map_file, [overview, natural], settings)
+    catalog.record_map_file(map_file, geotiffs_from_render_data([overview, natural], data), settings)
+    assert catalog.map_file_unchanged(map_file, [overview, natural], settings)
+    assert not catalog.map_file_unchanged(map_file, [overview], settings)
+    rows = catalog.query_layer('Overview')
+    assert [(row['path'], row['map_file'], row['mapserver_path']) for row in rows] == [
+        (overview, map_file, '/data/overview_20210910_123318.tif')]
+    catalog.close()
+
+    assert main(['-c', catalog_file, 'time-range', '2021-09-10', '20210911']) == 0
+    out = capsys.readouterr().out.splitlines()
+    assert len(out) == 2
+    assert out[0].split('\t')[:4] == ['geotiff', natural, 'natural_with_night_fog', '2021-09-10T12:33:18Z']
+    assert main(['-c', catalog_file, 'time-range', 'yesterday', 'today']) == 1
+
+
+def test_map_file_rewritten_for_new_settings(tmp_path, make_geotiff):
+    import subprocess
+    import sys
+
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join([os.getcwd()] + [p for p in [env.get('PYTHONPATH')] if p])
+    overview = make_geotiff('overview_20210910_123318.tif')
+    config = tmp_path / 'layers.yaml'
+    config.write_text("layers:\n  - match: overview\n    name: Overview\n    title: Overview\n")
+    map_file = tmp_path / 'map-files' / 'time.map'
+    map_file.parent.mkdir()
+    (tmp_path / 'tile-index').mkdir()
+
+    def run(server_name):
+        return subprocess.run(
+            [sys.executable, 'scripts/mapserver-time-index-map-file.py', '-c', str(config), '-i', overview,
+             '-o', str(map_file.parent), '-x', str(tmp_path / 'tile-index'), '-s', server_name,
+             '--map-output-file', map_file.name, '--catalog', str(tmp_path / 'catalog.db')],
+            env=env, stdout=subprocess.PIPE, universal_newlines=True, check=True).stdout
+
+    assert 'Wrote map file' in run('https://server')
+    assert 'is up to date' in run('https://server')
+    out = run('https://other-server')
+    assert 'is up to date' not in out and 'Wrote map file' in out
+    assert 'https://other-server' in map_file.read_text()
+    assert 'is up to date' in run('https://other-server')
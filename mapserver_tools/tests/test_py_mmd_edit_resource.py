@@ -296,6 +296,58 @@ def test_write_map_file():
     os.remove(os.path.join(map_file_output_dir, map_output_file))
 
 
+def test_write_map_file_stream(make_geotiff, tmp_path):
+    from mapserver_tools.edit_wms_mmd_xml_files import generate_mapserver_map_file
+    config = {'layers': [{'match': 'overview', 'name': 'Overview', 'title': 'Overview'},
+                         {'match': 'natural_with_night_fog', 'name': 'natural_with_night_fog',
+                          'title': 'Natural with night fog'}]}
+    input_data_files = [make_geotiff('overview_20210910_123318.tif'),
+                        make_geotiff('natural_with_night_fog_20210910_123318.tif')]
+    gmmf = generate_mapserver_map_file()
+    template = gmmf.load_template('templates/', 'map-file-template-okd-satellite.map')
+
+    data = gmmf.generate_render_data('http://localhost', '/data', 'a.map', input_data_files, config)
+    gmmf.write_map_file(str(tmp_path), 'a.map', template, data)
+    for workers in (1, 2):
+        data = gmmf.generate_render_data_stream('http://localhost', '/data', 'b.map', input_data_files, config,
+                                                workers=workers, chunk_size=1)
+        data['map_file_name'] = '/data/mapserver/map-files/a.map'
+        assert gmmf.write_map_file_stream(str(tmp_path), 'b.map', template, data, chunk_size=100) is (workers == 1)
+        assert (tmp_path / 'b.map').read_bytes() == (tmp_path / 'a.map').read_bytes()
+
+
+def test_write_map_file_stream_memory(tmp_path):
+    import tracemalloc
+    from mapserver_tools.edit_wms_mmd_xml_files import generate_mapserver_map_file
+
+    class fixed_metadata():
+        def get(self, geotiff_file, reader):
+            return 240, 275, '2021:09:10 12:33:18'
+
+    config = {'layers': [{'match': 'overview', 'name': 'Overview', 'title': 'Overview'}]}
+    gmmf = generate_mapserver_map_file(metadata_cache=fixed_metadata())
+    template = gmmf.load_template('templates/', 'map-file-template-okd-satellite.map')
+
+    def peak(layers):
+        # A new map file each time, rewriting an existing file adds the block read by file_digest
+        input_data_files = ['/incoming/overview_{:06d}.tif'.format(i) for i in range(layers)]
+        map_output_file = '{}.map'.format(layers)
+        tracemalloc.start()
+        try:
+            data = gmmf.generate_render_data_stream('http://localhost', '/data', map_output_file, input_data_files,
+                                                    config)
+            gmmf.write_map_file_stream(str(tmp_path), map_output_file, template, data)
+            return tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    peak(10)
+    small = peak(1000)
+    large = peak(10000)
+    assert (tmp_path / '10000.map').read_text().count('LAYER\n') == 10000
+    assert large < 1.5 * small
+
+
 # This method will be used by the mock to replace requests.get
 def mocked_requests_get(*args, **kwargs):
     class MockResponse:
@@ -0,0 +1,45 @@
+"""Test the long lived jinja2 render environment
+"""
+
+import os
+import shutil
+
+
+def test_load_template_is_compiled_once(tmp_path, mocker):
+    import jinja2
+    from mapserver_tools.edit_wms_mmd_xml_files import generate_mapserver_map_file
+
+    template_dir = tmp_path / 'templates'
+    template_dir.mkdir()
+    shutil.copy('templates/map-file-template-okd-satellite.map', str(template_dir))
+    compile_spy = mocker.spy(jinja2.Environment, 'compile')
+
+    gmmf = generate_mapserver_map_file()
+    first = gmmf.load_template(str(template_dir), 'map-file-template-okd-satellite.map')
+    second = gmmf.load_template(str(template_dir), 'map-file-template-okd-satellite.map')
+    assert first is second
+    assert compile_spy.call_count == 1
+
+    # A changed template is reloaded
+    template_file = template_dir / 'map-file-template-okd-satellite.map'
+    template_file.write_text('changed {{ data["xsize"] }}')
+    st = os.stat(str(template_file))
+    os.utime(str(template_file), ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    third = gmmf.load_template(str(template_dir), 'map-file-template-okd-satellite.map')
+    assert third.render(data={'xsize': 1}) == 'changed 1'
+
+
+def test_render_environment_bytecode_cache(tmp_path, mocker):
+    import jinja2
+    from mapserver_tools.render_environment import render_environment
+
+    bytecode_cache_dir = str(tmp_path / 'bytecode')
+    template = render_environment(bytecode_cache_dir).get_template('templates/',
+                                                                   'map-file-template-okd-satellite.map')
+    assert len(os.listdir(bytecode_cache_dir)) == 1
+
+    compile_spy = mocker.spy(jinja2.Environment, 'compile')
+    cached = render_environment(bytecode_cache_dir).get_template('templates/', 'map-file-template-okd-satellite.map')
+    assert compile_spy.call_count == 0
+    data = {'xsize': 10, 'ysize': 20, 'server_name': 's', 'map_file_name': 'm', 'layers': []}
+    assert cached.render(data=data) == template.render(data=data)
@@ -0,0 +1,105 @@
+"""Test the streaming mmd xml rewrite
+"""
+
+import io
+import os
+import pytest
+
+TESTDATA = 'mapserver_tools/tests/testdata/noaa19-avhrr-20210901070230-20210901071648.xml'
+FAST_API = 'https://fastapi-dev.s-enda.k8s.met.no/api/get_mapserv'
+NS = {'mmd': 'http://www.met.no/schema/mmd',
+      'gml': 'http://www.opengis.net/gml'}
+LAYERS = ['overview', 'ir_window_channel']
+
+SYNTHETIC = b"""<?xml version="1.0" encoding="UTF-8"?>
+<!-- leading comment -->
+<mmd:mmd xmlns:mmd="http://www.met.no/schema/mmd" xmlns:gml="http://www.opengis.net/gml"
+         xmlns:x="http://example.com/x" x:flag="a&quot;b&#10;c">
+  <mmd:metadata_identifier>id-&lt;1&gt;</mmd:metadata_identifier>
+  <!-- inner comment -->
+  <mmd:data_access>
+    <mmd:type>OGC WMS</mmd:type>
+    <mmd:resource>old</mmd:resource>
+  </mmd:data_access>
+  <x:extra attr="1"><gml:Point/><y xmlns="http://example.com/y">\xc3\xa6\xc3\xb8\xc3\xa5</y></x:extra>
+  <mmd:empty></mmd:empty>
+</mmd:mmd>
+"""
+
+
+def _tree_rewrite(source, tmp_path):
+    from mapserver_tools.edit_wms_mmd_xml_files import edit_wms_mmd_xml_files
+    input_file = os.path.join(str(tmp_path), 'tree-in.xml')
+    output_file = os.path.join(str(tmp_path), 'tree-out.xml')
+    with open(input_file, 'wb') as fh:
+        fh.write(source)
+    ewmxf = edit_wms_mmd_xml_files()
+    xtree = ewmxf.open_mmd_xml_file(input_file, NS)
+    xroot = xtree.getroot()
+    ewmxf.remove_wms_from_mmd_xml(xroot, NS)
+    ewmxf.add_wms_to_mmd_xml(xroot, FAST_API, LAYERS)
+    ewmxf.rewrite_mmd_xml(xtree, output_file)
+    with open(output_file, 'rb') as fh:
+        return fh.read()
+
+
+@pytest.mark.parametrize('chunk_size', [1, 13, 64 * 1024])
+def test_rewrite_mmd_xml_stream_equals_tree(tmp_path, chunk_size):
+    from mapserver_tools.stream_wms_mmd_xml_files import stream_edit_wms_mmd_xml_files
+    with open(TESTDATA, 'rb') as fh:
+        source = fh.read()
+    for doc in (source, SYNTHETIC):
+        output = io.BytesIO()
+        sewmxf = stream_edit_wms_mmd_xml_files(NS, chunk_size=chunk_size, spool_size=256)
+        sewmxf.rewrite_mmd_xml_stream(io.BytesIO(doc), output, (FAST_API, LAYERS))
+        assert output.getvalue() == _tree_rewrite(doc, tmp_path)
+
+
+def test_rewrite_mmd_xml_dump(tmp_path):
+    from mapserver_tools.stream_wms_mmd_xml_files import stream_edit_wms_mmd_xml_files
+    from mapserver_tools.stream_wms_mmd_xml_files import wms_from_storage_file_name
+    with open(TESTDATA, 'rb') as fh:
+        source = fh.read()
+    dump = source + b'\n' + SYNTHETIC + source + b'\n\n'
+    output = io.BytesIO()
+    seen = []
+
+    def wms(info):
+        seen.append(info['metadata_identifier'])
+        return FAST_API, LAYERS
+
+    sewmxf = stream_edit_wms_mmd_xml_files(NS, chunk_size=100)
+    assert sewmxf.rewrite_mmd_xml_dump(io.BytesIO(dump), output, wms) == 3
+    expected = _tree_rewrite(source, tmp_path)
+    assert output.getvalue() == b'\n'.join([expected, _tree_rewrite(SYNTHETIC, tmp_path), expected])
+    assert seen == ['4f0946c4-3a0b-42b8-9094-69287d16fa64', 'id-<1>', '4f0946c4-3a0b-42b8-9094-69287d16fa64']
+
+    output = io.BytesIO()
+    sewmxf.rewrite_mmd_xml_dump(io.BytesIO(source), output, wms_from_storage_file_name(FAST_API))
+    assert (b'get_mapserv/satellite-thredds/polar-swath/2021/09/01/noaa19-avhrr-20210901070230-20210901071648.nc?'
+            in output.getvalue())
+
+
+def test_rewrite_mmd_xml_file(tmp_path):
+    from mapserver_tools.stream_wms_mmd_xml_files import stream_edit_wms_mmd_xml_files
+    with open(TESTDATA, 'rb') as fh:
+        source = fh.read()
+    mmd_xml_file = tmp_path / 'mmd.xml'
+    mmd_xml_file.write_bytes(source)
+    stream_edit_wms_mmd_xml_files(NS).rewrite_mmd_xml_file(str(mmd_xml_file), (FAST_API, LAYERS))
+    assert mmd_xml_file.read_bytes() == _tree_rewrite(source, tmp_path)
+    assert sorted(os.listdir(str(tmp_path))) == ['mmd.xml', 'tree-in.xml', 'tree-out.xml']
+
+
+def test_rewrite_mmd_xml_file_parse_error(tmp_path):
+    import xml.etree.ElementTree as et
+    from mapserver_tools.stream_wms_mmd_xml_files import stream_edit_wms_mmd_xml_files
+    mmd_xml_file = tmp_path / 'broken.xml'
+    mmd_xml_file.write_bytes(b'<mmd:mmd xmlns:mmd="http://www.met.no/schema/mmd"><mmd:title>')
+    with pytest.raises(et.ParseError):
+        stream_edit_wms_mmd_xml_files(NS).rewrite_mmd_xml_file(str(mmd_xml_file), (FAST_API, LAYERS))
+    assert os.listdir(str(tmp_path)) == ['broken.xml']
+
+    with pytest.raises(et.ParseError):
+        stream_edit_wms_mmd_xml_files(NS).rewrite_mmd_xml_stream(io.BytesIO(b'<a/><b/>'), io.BytesIO(),
+                                                                 (FAST_API, LAYERS))
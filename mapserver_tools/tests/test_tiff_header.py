@@ -0,0 +1,49 @@
+"""Test the lightweight TIFF header reader
+"""
+
+import pytest
+
+
+@pytest.mark.parametrize('profile', [{}, {'BIGTIFF': 'YES'}, {'ENDIANNESS': 'BIG'},
+                                     {'tiled': True, 'blockxsize': 256, 'blockysize': 256, 'compress': 'deflate'}])
+def test_read_tiff_header(make_geotiff, profile):
+    from mapserver_tools.tiff_header import read_tiff_header
+    from mapserver_tools.edit_wms_mmd_xml_files import generate_mapserver_map_file
+
+    geotiff_file = make_geotiff('overview_20210910_123318.tif', width=2400, height=275, **profile)
+    header = read_tiff_header(geotiff_file)
+    assert header == generate_mapserver_map_file().read_geotiff_metadata_rasterio(geotiff_file)
+    assert header[2] == '2021:09:10 12:33:18'
+
+
+def test_read_tiff_header_errors(make_geotiff, tmp_path):
+    from mapserver_tools.tiff_header import read_tiff_header
+    from mapserver_tools.tiff_header import tiff_header_error
+
+    not_tiff = tmp_path / 'not.tif'
+    not_tiff.write_bytes(b'<?xml version="1.0"?>')
+    empty = tmp_path / 'empty.tif'
+    empty.write_bytes(b'')
+    truncated = tmp_path / 'truncated.tif'
+    with open(make_geotiff('full.tif', width=8, height=8), 'rb') as fh:
+        truncated.write_bytes(fh.read()[:9])
+    no_datetime = make_geotiff('no_datetime.tif', width=8, height=8, tiff_datetime=None)
+
+    for tiff_file in (not_tiff, empty, truncated, no_datetime):
+        with pytest.raises(tiff_header_error):
+            read_tiff_header(str(tiff_file))
+
+
+def test_read_geotiff_metadata_fallback(make_geotiff, mocker):
+    from mapserver_tools.tiff_header import tiff_header_error
+    from mapserver_tools.edit_wms_mmd_xml_files import generate_mapserver_map_file
+
+    geotiff_file = make_geotiff('overview_20210910_123318.tif', width=8, height=8)
+    mocker.patch('mapserver_tools.edit_wms_mmd_xml_files.read_tiff_header', side_effect=tiff_header_error)
+    gmmf = generate_mapserver_map_file()
+    rasterio_reader = mocker.spy(gmmf, 'read_geotiff_metadata_rasterio')
+    assert gmmf.read_geotiff_metadata(geotiff_file) == (8, 8, '2021:09:10 12:33:18')
+    assert rasterio_reader.call_count == 1
+
+    gmmf = generate_mapserver_map_file(use_tiff_header_reader=False)
+    assert gmmf.read_geotiff_metadata(geotiff_file) == (8, 8, '2021:09:10 12:33:18')
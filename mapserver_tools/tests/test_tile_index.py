@@ -0,0 +1,93 @@
+"""Test the tile index writer and the time dimension map file
+"""
+
+import os
+
+import pytest
+
+CONFIG = {'layers': [{'match': 'overview',
+                      'name': 'Overview',
+                      'title': 'Overview'},
+                     {'match': 'natural_with_night_fog',
+                      'name': 'natural_with_night_fog',
+                      'title': 'Natural with night fog'}]}
+
+
+def test_write_tile_index(tmp_path):
+    from mapserver_tools.tile_index import read_tile_index
+    from mapserver_tools.tile_index import write_tile_index
+    shapefile = str(tmp_path / 'overview')
+    records = [('/data/overview_20210910_123318.tif', '2021-09-10T12:33:18Z', (-1e6, 8.2e6, -7.6e5, 8.5e6)),
+               ('/data/overview_20210910_140000.tif', '2021-09-10T14:00:00Z', (-9e5, 8.1e6, -7e5, 8.4e6))]
+
+    assert write_tile_index(shapefile, records)
+    assert sorted(os.listdir(str(tmp_path))) == ['overview.dbf', 'overview.shp', 'overview.shx']
+    assert read_tile_index(shapefile) == records
+    with open(shapefile + '.shp', 'rb') as fh:
+        shp = fh.read()
+    with open(shapefile + '.shx', 'rb') as fh:
+        shx = fh.read()
+    assert len(shp) == 100 + 2 * 136
+    assert len(shx) == 100 + 2 * 8
+    assert shp[:4] == shx[:4] == b'\x00\x00\x27\x0a'
+
+    assert not write_tile_index(shapefile, records)
+    assert write_tile_index(shapefile, records[:1])
+    assert read_tile_index(shapefile) == records[:1]
+
+    with pytest.raises(ValueError):
+        write_tile_index(shapefile, [])
+
+    # Longer locations do not fit a dbf field and would be cut off
+    long_location = '/data/' + 'x' * 245 + '.tif'
+    with pytest.raises(ValueError, match='x.tif of tile index .*overview is longer than 254 bytes'):
+        write_tile_index(shapefile, records + [(long_location, '2021-09-10T15:00:00Z', (-9e5, 8.1e6, -7e5, 8.4e6))])
+    assert read_tile_index(shapefile) == records[:1]
+    assert write_tile_index(shapefile, [(long_location[:-1], '2021-09-10T15:00:00Z', (-9e5, 8.1e6, -7e5, 8.4e6))])
+    assert read_tile_index(shapefile)[0][0] == long_location[:-1]
+
+
+def test_read_tiff_bounds(make_geotiff):
+    import rasterio
+    from mapserver_tools.tiff_header import read_tiff_bounds
+    for name, profile in [('little.tif', {}), ('big.tif', {'BIGTIFF': 'YES', 'ENDIANNESS': 'BIG'})]:
+        geotiff_file = make_geotiff(name, width=24, height=27, **profile)
+        with rasterio.open(geotiff_file) as dataset:
+            assert read_tiff_bounds(geotiff_file) == tuple(dataset.bounds)
+
+
+def test_time_index_map_file(make_geotiff, tmp_path):
+    from mapserver_tools.edit_wms_mmd_xml_files import generate_mapserver_map_file
+    from mapserver_tools.tile_index import read_tile_index
+    input_data_files = [make_geotiff('overview_20210910_140000.tif', width=24, height=27,
+                                     tiff_datetime='2021:09:10 14:00:00'),
+                        make_geotiff('overview_20210910_123318.tif', width=24, height=27),
+                        make_geotiff('natural_with_night_fog_20210910_123318.tif', width=24, height=27)]
+    tile_index_dir = tmp_path / 'tile-index'
+    tile_index_dir.mkdir()
+    map_file_dir = tmp_path / 'map-files'
+    map_file_dir.mkdir()
+
+    gmmf = generate_mapserver_map_file()
+    data = gmmf.generate_time_index_render_data('http://localhost', '/data', 'mapserver-okd.map',
+                                                input_data_files, CONFIG, workers=2)
+    assert [layer['layer_name'] for layer in data['layers']] == ['Overview', 'natural_with_night_fog']
+    overview = data['layers'][0]
+    assert overview['time_extent'] == '2021-09-10T12:33:18Z,2021-09-10T14:00:00Z'
+    assert overview['time_default'] == '2021-09-10T14:00:00Z'
+    assert overview['tile_index'] == '/data/mapserver/tile-index/mapserver-okd-Overview.shp'
+    assert overview['extent'] == '-1000000.0 8473000.0 -976000.0 8500000.0'
+
+    assert gmmf.write_tile_indexes(str(tile_index_dir), data) == 2
+    assert gmmf.write_tile_indexes(str(tile_index_dir), data) == 0
+    records = read_tile_index(str(tile_index_dir / 'mapserver-okd-Overview'))
+    assert [record[:2] for record in records] == [('/data/overview_20210910_123318.tif', '2021-09-10T12:33:18Z'),
+                                                  ('/data/overview_20210910_140000.tif', '2021-09-10T14:00:00Z')]
+
+    template = gmmf.load_template('templates', 'map-file-template-okd-satellite-time.map')
+    assert gmmf.write_map_file(str(map_file_dir), 'mapserver-okd.map', template, data)
+    map_file = (map_file_dir / 'mapserver-okd.map').read_text()
+    assert map_file.count('TILEINDEX') == 2
+    assert 'TILEINDEX "/data/mapserver/tile-index/mapserver-okd-Overview.shp"' in map_file
+    assert '"wms_timeextent" "2021-09-10T12:33:18Z,2021-09-10T14:00:00Z"' in map_file
+    assert '"wms_timeitem" "time"' in map_file
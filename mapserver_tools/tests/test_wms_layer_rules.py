@@ -0,0 +1,97 @@
+"""Test the WMS layer selection rules
+"""
+
+import os
+import shutil
+
+import pytest
+
+TESTDATA = 'mapserver_tools/tests/testdata/noaa19-avhrr-20210901070230-20210901071648.xml'
+FAST_API = 'https://fastapi-dev.s-enda.k8s.met.no/api/get_mapserv'
+NS = {'mmd': 'http://www.met.no/schema/mmd',
+      'gml': 'http://www.opengis.net/gml'}
+
+RULES = {'default': ['overview'],
+         'rules': [{'token': 'iband', 'layers': ['hr_overview']},
+                   {'platform': 'NOAA-19', 'instrument': 'AVHRR/3', 'layers': ['noaa19_overview']},
+                   {'regex': '^metop[abc]-avhrr-', 'layers': ['metop_overview']},
+                   {'contains': 'viirs-dnb', 'layers': ['adaptive_dnb']},
+                   {'token': 'viirs', 'layers': ['viirs_overview']}]}
+
+
+def test_etc_rules_are_the_built_in_rules():
+    from mapserver_tools.edit_wms_mmd_xml_files import read_yaml_config_file
+    from mapserver_tools.wms_layer_rules import DEFAULT_WMS_LAYER_RULES
+    assert read_yaml_config_file('etc/wms-layer-rules.yaml') == DEFAULT_WMS_LAYER_RULES
+
+
+def test_select():
+    from mapserver_tools.wms_layer_rules import wms_layer_rules
+    rules = wms_layer_rules(RULES)
+    assert rules.select('noaa20-viirs-iband-20220517115900-20220517121313') == ['hr_overview']
+    # The first rule in the file wins, also when a later rule is found through the index
+    assert rules.select('noaa20-viirs-dnb-20220517115900-20220517121313') == ['adaptive_dnb']
+    assert rules.select('noaa20-viirs-mband-20220517115900-20220517121313') == ['viirs_overview']
+    assert rules.select('metopb-avhrr-20220517115900-20220517121313') == ['metop_overview']
+    assert rules.select('noaa19-avhrr-20210901070230-20210901071648') == ['overview']
+    assert rules.select('noaa19-avhrr-20210901070230-20210901071648', 'noaa-19', 'AVHRR/3') == ['noaa19_overview']
+    assert rules.select('noaa19-avhrr-20210901070230-20210901071648', 'NOAA-19', 'AVHRR/2') == ['overview']
+    # Tokens are whole parts of the name, not substrings
+    assert rules.select('noaa20-viirsx-20220517115900-20220517121313') == ['overview']
+
+
+def test_built_in_rules_match_substrings():
+    from mapserver_tools.edit_wms_mmd_xml_files import select_wms_layers
+    iband_layers = ['hr_overview', 'ir_window_channel']
+    assert select_wms_layers('noaa20-viirs-iband-20220517115900-20220517121313') == iband_layers
+    # Names the built in rules matched before there were rules, with iband or dnb inside a part of the name
+    assert select_wms_layers('noaa20-viirs-ibands-20220517115900-20220517121313') == iband_layers
+    assert select_wms_layers('noaa20-viirsdnb-20220517115900-20220517121313') == ['adaptive_dnb']
+    assert select_wms_layers('noaa19-avhrr-20210901070230-20210901071648') == ['overview', 'ir_window_channel']
+
+
+def test_many_rules_use_the_index():
+    from mapserver_tools.wms_layer_rules import wms_layer_rules
+    config = {'default': [], 'rules': [{'token': 'product{}'.format(i), 'layers': ['layer{}'.format(i)]}
+                                       for i in range(10000)]}
+    rules = wms_layer_rules(config)
+    assert rules.unindexed == []
+    assert rules.select('noaa20-product9999-20220517115900-20220517121313') == ['layer9999']
+    assert rules.select('noaa20-unknown-20220517115900-20220517121313') == []
+
+
+def test_invalid_rules():
+    from mapserver_tools.wms_layer_rules import wms_layer_rules
+    from mapserver_tools.wms_layer_rules import wms_layer_rules_error
+    for config in ({'rules': [{'token': 'iband'}]},
+                   {'rules': [{'layers': ['overview']}]},
+                   {'default': 'overview'}):
+        with pytest.raises(wms_layer_rules_error):
+            wms_layer_rules(config)
+
+
+def test_load_wms_layer_rules(tmp_path):
+    from mapserver_tools.wms_layer_rules import load_wms_layer_rules
+    from mapserver_tools.wms_layer_rules import wms_layer_rules_error
+    assert load_wms_layer_rules() is load_wms_layer_rules(None)
+    assert load_wms_layer_rules('etc/wms-layer-rules.yaml') is load_wms_layer_rules('etc/wms-layer-rules.yaml')
+    with pytest.raises(wms_layer_rules_error):
+        load_wms_layer_rules(str(tmp_path / 'missing.yaml'))
+
+
+@pytest.mark.parametrize('stream', [False, True])
+def test_batch_with_platform_rules(tmp_path, stream):
+    import yaml
+    from mapserver_tools.edit_wms_mmd_xml_files import edit_wms_mmd_xml_files
+    from mapserver_tools.batch_edit_wms_mmd_xml_files import batch_edit_mmd_xml_files
+    rules_file = str(tmp_path / 'rules.yaml')
+    with open(rules_file, 'w') as fh:
+        yaml.safe_dump(RULES, fh)
+    mmd_xml_file = str(tmp_path / os.path.basename(TESTDATA))
+    shutil.copy(TESTDATA, mmd_xml_file)
+
+    results = batch_edit_mmd_xml_files([mmd_xml_file], FAST_API, workers=1, stream=stream,
+                                       layer_rules_file=rules_file)
+    assert results[0][1], results[0][2]
+    xroot = edit_wms_mmd_xml_files().open_mmd_xml_file(mmd_xml_file, NS).getroot()
+    assert [layer.text for layer in xroot.iter('{%s}wms_layer' % NS['mmd'])] == ['noaa19_overview']
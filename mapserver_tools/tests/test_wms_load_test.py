@@ -0,0 +1,207 @@
+"""Test the WMS load test harness
+"""
+
+from urllib.parse import parse_qs
+
+CONFIG = {'layers': [{'match': 'overview', 'name': 'Overview', 'title': 'Overview'},
+                     {'match': 'natural_with_night_fog', 'name': 'natural_with_night_fog',
+                      'title': 'Natural with night fog'}]}
+
+
+def _write_map_files(tmp_path, make_geotiff):
+    from mapserver_tools.edit_wms_mmd_xml_files import generate_mapserver_map_file
+
+    overview = make_geotiff('overview_20210910_123318.tif', width=24, height=27)
+    later = make_geotiff('overview_20210910_140000.tif', width=24, height=27, tiff_datetime='2021:09:10 14:00:00')
+    natural = make_geotiff('natural_with_night_fog_20210910_123318.tif', width=24, height=27)
+    map_file_dir = tmp_path / 'map-files'
+    map_file_dir.mkdir()
+    gmmf = generate_mapserver_map_file()
+    data = gmmf.generate_render_data('http://localhost', str(tmp_path), 'single.map', [overview, natural], CONFIG)
+    # Point DATA at the local files, the extent is read from them
+    for layer, geotiff in zip(data['layers'], [overview, natural]):
+        layer['geotiff_filename'] = geotiff
+    gmmf.write_map_file(str(map_file_dir), 'single.map',
+                        gmmf.load_template('templates', 'map-file-template-okd-satellite.map'), data)
+    data = gmmf.generate_time_index_render_data('http://localhost', '/data', 'time.map', [overview, later, natural],
+                                                CONFIG)
+    gmmf.write_map_file(str(map_file_dir), 'time.map',
+                        gmmf.load_template('templates', 'map-file-template-okd-satellite-time.map'), data)
+    return map_file_dir
+
+
+def test_request_mix_from_map_files(tmp_path, make_geotiff):
+    import pytest
+
+    from mapserver_tools.wms_load_test import read_map_file_targets
+    from mapserver_tools.wms_load_test import request_kind
+    from mapserver_tools.wms_load_test import wms_request_mix
+
+    map_file_dir = _write_map_files(tmp_path, make_geotiff)
+    single, time_index = read_map_file_targets([str(map_file_dir)])
+    assert single['map'] == str(tmp_path / 'mapserver/map-files/single.map')
+    # The map is in EPSG:25833, which is not in its wms_srs, so mapserver would refuse it
+    assert single['wms_srs'] == ['EPSG:3978', 'EPSG:4326', 'EPSG:4269', 'EPSG:3857']
+    assert single['crs'] == 'EPSG:3857'
+    assert single['layers'][0]['name'] == 'Overview'
+    assert single['layers'][0]['times'] == ['2021-09-10T12:33:18Z']
+    extent = (-3402278.73, 11405154.86, -3294017.89, 11513830.74)
+    assert single['layers'][0]['extent'] == pytest.approx(extent)
+    assert time_index['map'] == '/data/mapserver/map-files/time.map'
+    assert time_index['layers'][0]['times'] == ['2021-09-10T12:33:18Z', '2021-09-10T14:00:00Z']
+    assert time_index['layers'][0]['extent'] == pytest.approx(extent)
+
+    geographic = read_map_file_targets([str(map_file_dir / 'time.map')], crs='EPSG:4326')[0]
+    assert geographic['layers'][0]['extent'] == pytest.approx((-30.5632, 71.0084, -29.5907, 71.3236), abs=1e-4)
+
+    targets = read_map_file_targets([str(map_file_dir / 'time.map')],
+                                    layer_config={'layers': CONFIG['layers'][:1]})
+    assert [layer['name'] for layer in targets[0]['layers']] == ['Overview']
+
+    queries = wms_request_mix([time_index], 400, getcapabilities_ratio=0.1, zoom_levels=3, latest_time_ratio=1.0,
+                              seed=1)
+    assert queries == wms_request_mix([time_index], 400, getcapabilities_ratio=0.1, zoom_levels=3,
+                                      latest_time_ratio=1.0, seed=1)
+    kinds = [request_kind(query) for query in queries]
+    assert 20 < kinds.count('GetCapabilities') < 60
+    widths = set()
+    for query in queries:
+        params = parse_qs(query, keep_blank_values=True)
+        assert params['map'] == ['/data/mapserver/map-files/time.map']
+        if params['REQUEST'] == ['GetMap']:
+            latest = {'Overview': '2021-09-10T14:00:00Z', 'natural_with_night_fog': '2021-09-10T12:33:18Z'}
+            assert params['TIME'] == [latest[params['LAYERS'][0]]]
+            assert params['CRS'] == ['EPSG:3857']
+            minx, miny, maxx, maxy = [float(value) for value in params['BBOX'][0].split(',')]
+            bounds = time_index['layers'][0]['extent']
+            assert bounds[0] <= minx < maxx <= bounds[2] + 1 and bounds[1] <= miny < maxy <= bounds[3] + 1
+            widths.add(round(maxx - minx))
+    width = round(time_index['layers'][0]['extent'][2] - time_index['layers'][0]['extent'][0])
+    assert sorted(widths) == [round(width / 4), round(width / 2), width]
+
+    # WMS 1.3.0 bboxes in EPSG:4326 are latitude first
+    query = wms_request_mix([geographic], 1, getcapabilities_ratio=0, zoom_levels=1, seed=1)[0]
+    assert parse_qs(query)['BBOX'] == [','.join(repr(value) for value in (
+        geographic['layers'][0]['extent'][1], geographic['layers'][0]['extent'][0],
+        geographic['layers'][0]['extent'][3], geographic['layers'][0]['extent'][2]))]
+
+
+def test_read_access_log(tmp_path):
+    from mapserver_tools.wms_load_test import read_access_log
+
+    access_log = tmp_path / 'access.log'
+    access_log.write_text(
+        '10.0.0.1 - - [10/Sep/2021:12:00:00 +0000] "GET /cgi-bin/mapserv?map=/a.map&SERVICE=WMS&REQUEST=GetMap'
+        '&LAYERS=Overview HTTP/1.1" 200 1234 "-" "curl/7.68.0"\n'
+        '10.0.0.1 - - [10/Sep/2021:12:00:01 +0000] "GET /server-status-remote HTTP/1.1" 200 99\n'
+        '10.0.0.1 - - [10/Sep/2021:12:00:02 +0000] "POST /cgi-bin/mapserv HTTP/1.1" 200 99\n'
+        'garbage\n'
+        '10.0.0.2 - - [10/Sep/2021:12:00:03 +0000] "GET /?request=GetCapabilities&map=/a.map HTTP/1.0" 200 99\n')
+    assert read_access_log(str(access_log)) == ['map=/a.map&SERVICE=WMS&REQUEST=GetMap&LAYERS=Overview',
+                                                'request=GetCapabilities&map=/a.map']
+    assert len(read_access_log(str(access_log), wms_only=False)) == 3
+
+
+def test_load_test_against_stub(tmp_path, make_geotiff, capsys):
+    import json
+
+    from mapserver_tools.wms_load_test import main
+    from mapserver_tools.wms_load_test import percentile
+    from mapserver_tools.wms_load_test import run_load_test
+    from mapserver_tools.wms_load_test import stub_wms_server
+    from mapserver_tools.wms_load_test import summarize_results
+
+    assert percentile([1, 2, 3, 4], 50) == 2
+    assert percentile([1, 2, 3, 4], 99) == 4
+    assert percentile([], 50) is None
+
+    queries = ['map=/a.map&REQUEST=GetCapabilities'] + ['map=/a.map&REQUEST=GetMap&LAYERS=Overview'] * 99
+    with stub_wms_server(error_rate=0.5, seed=3) as stub:
+        results, elapsed = run_load_test(stub.url, queries + ['map=/a.map'], concurrency=4)
+    summary = summarize_results(results, elapsed)
+    assert summary['requests'] == 101
+    assert summary['by_request']['GetCapabilities']['errors'] == 0
+    assert 20 < summary['by_request']['GetMap']['errors'] < 80
+    assert summary['error_types']['HTTP 400'] == 1
+    assert summary['status'] == {'200': 100, '400': 1}
+    assert summary['p50'] <= summary['p99'] <= summary['max']
+
+    # Four requests of 0.1s handled one at a time queue up behind each other
+    with stub_wms_server(latency=0.1, max_concurrent=1) as stub:
+        results, elapsed = run_load_test(stub.url, queries[:4], concurrency=4)
+    summary = summarize_results(results, elapsed)
+    assert summary['errors'] == 0
+    assert summary['max'] >= 0.35 and elapsed >= 0.4
+
+    map_file_dir = _write_map_files(tmp_path, make_geotiff)
+    output = str(tmp_path / 'summary.json')
+    assert main(['--stub', '--stub-latency', '0', '-m', str(map_file_dir), '-n', '50', '-j', '4', '--seed', '2',
+                 '-o', output]) == 0
+    out = capsys.readouterr().out
+    assert out.splitlines()[-2].startswith('total')
+    with open(output) as fh:
+        assert json.load(fh)['requests'] == 50
+
+
+def test_replay_whole_access_log(tmp_path, mocker, capsys):
+    from mapserver_tools import wms_load_test
+
+    access_log = tmp_path / 'access.log'
+    access_log.write_text(''.join(
+        '10.0.0.1 - - [10/Sep/2021:12:00:00 +0000] "GET /cgi-bin/mapserv?map=/a.map&REQUEST=GetMap&LAYERS=Overview'
+        '&n={} HTTP/1.1" 200 1234\n'.format(i) for i in range(1200)))
+    run_load_test = mocker.patch.object(wms_load_test, 'run_load_test', return_value=([], 1.0))
+
+    assert wms_load_test.main(['-u', 'http://localhost/', '-a', str(access_log)]) == 0
+    assert len(run_load_test.call_args[0][1]) == 1200
+    assert 'dropped' not in capsys.readouterr().out
+
+    assert wms_load_test.main(['-u', 'http://localhost/', '-a', str(access_log), '-n', '10']) == 0
+    assert len(run_load_test.call_args[0][1]) == 10
+    assert 'Replaying the first 10 of 1200 logged requests, 1190 dropped' in capsys.readouterr().out
+
+
+def test_service_exceptions_are_errors(tmp_path, make_geotiff, capsys):
+    import json
+
+    from mapserver_tools.wms_load_test import _send
+    from mapserver_tools.wms_load_test import main
+    from mapserver_tools.wms_load_test import run_load_test
+    from mapserver_tools.wms_load_test import stub_wms_server
+    from mapserver_tools.wms_load_test import summarize_results
+
+    # GetMap requests in the map file CRS, which is not in its wms_srs, are refused like mapserver does
+    queries = ['map=/a.map&REQUEST=GetMap&LAYERS=Overview&CRS=EPSG:25833',
+               'map=/a.map&REQUEST=GetMap&LAYERS=Overview&CRS=EPSG:3857']
+    with stub_wms_server(crs={'EPSG:3857'}) as stub:
+        results, elapsed = run_load_test(stub.url, queries, concurrency=1)
+    assert [result[4] for result in results] == ['ServiceException InvalidCRS', None]
+
+    class response():
+        status_code = 200
+        headers = {'Content-Type': 'text/xml; charset=UTF-8'}
+        content = (b'<?xml version="1.0" encoding="UTF-8"?>\n<ServiceExceptionReport version="1.3.0" '
+                   b'xmlns="http://www.opengis.net/ogc"><ServiceException>msLoadMap(): Unable to access '
+                   b'file.</ServiceException></ServiceExceptionReport>')
+
+    class session():
+        def get(self, url, timeout):
+            return response()
+
+    assert _send(session(), 'http://localhost/?REQUEST=GetCapabilities', 'GetCapabilities', 1)[4] == \
+        'ServiceException'
+    response.content = b'<WMS_Capabilities version="1.3.0"/>'
+    assert _send(session(), 'http://localhost/?REQUEST=GetCapabilities', 'GetCapabilities', 1)[4] is None
+    assert summarize_results(results, elapsed)['error_types'] == {'ServiceException InvalidCRS': 1}
+
+    # The generated mix only uses a CRS of the wms_srs of the map files
+    map_file_dir = _write_map_files(tmp_path, make_geotiff)
+    output = str(tmp_path / 'summary.json')
+    assert main(['--stub', '--stub-latency', '0', '-m', str(map_file_dir), '-n', '20', '-o', output]) == 0
+    with open(output) as fh:
+        assert json.load(fh)['errors'] == 0
+    assert main(['--stub', '--stub-latency', '0', '-m', str(map_file_dir), '-n', '20', '--crs', 'EPSG:25833',
+                 '--getcapabilities-ratio', '0', '-o', output]) == 0
+    assert 'EPSG:25833 is not in the wms_srs of the map file' in capsys.readouterr().out
+    with open(output) as fh:
+        assert json.load(fh)['error_types'] == {'ServiceException InvalidCRS': 20}
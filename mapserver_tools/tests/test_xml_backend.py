@@ -0,0 +1,90 @@
+"""Test that the lxml xml backend gives the same mmd output as ElementTree
+"""
+
+import io
+import inspect
+import importlib
+
+import pytest
+
+NS = {'mmd': 'http://www.met.no/schema/mmd',
+      'gml': 'http://www.opengis.net/gml'}
+
+DOCUMENT = '''<?xml version="1.0" encoding="UTF-8"?>
+<!-- leading comment -->
+<mmd:mmd xmlns:mmd="http://www.met.no/schema/mmd" xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"
+         xmlns:x="urn:unknown" xsi:schemaLocation="http://www.met.no/schema/mmd mmd.xsd">
+  <mmd:metadata_identifier>id-1</mmd:metadata_identifier>
+  <!-- inner comment -->after comment
+  <?pi data?>
+  <mmd:title xml:lang="no">Blå &amp; &lt;grønn&gt;</mmd:title>
+  <mmd:keywords x:a="line&#10;break&#9;tab &quot;q&quot;"><mmd:keyword/></mmd:keywords>
+  <x:empty></x:empty>
+  <mmd:data_access>
+    <mmd:type>OGC WMS</mmd:type>
+  </mmd:data_access>
+</mmd:mmd>
+'''
+
+# Existing tests of the mmd editing, run again with lxml as the default backend
+EXISTING_TESTS = [
+    ('test_py_mmd_edit_resource', 'test_open_mmd_xml_file_fnf'),
+    ('test_py_mmd_edit_resource', 'test_get_metadata_indentifier_from_mmd_xml'),
+    ('test_py_mmd_edit_resource', 'test_remove_wms_from_mmd_xml'),
+    ('test_py_mmd_edit_resource', 'test_add_wms_to_mmd_xml_old'),
+    ('test_py_mmd_edit_resource', 'test_add_wms_to_mmd_xml'),
+    ('test_py_mmd_edit_resource', 'test_read_layers_from_getcapabilities'),
+    ('test_batch_edit_wms_mmd_xml_files', 'test_batch_edit_mmd_xml_files'),
+    ('test_mmd_document_processor', 'test_edit_mmd_xml_file_same_as_methods'),
+    ('test_mmd_document_processor', 'test_lookups'),
+    ('test_mmd_document_processor', 'test_parse_layers_from_getcapabilities'),
+    ('test_stream_wms_mmd_xml_files', 'test_rewrite_mmd_xml_file'),
+]
+
+
+def _rewrite(backend, document):
+    from mapserver_tools.edit_wms_mmd_xml_files import edit_wms_mmd_xml_files
+
+    ewmxf = edit_wms_mmd_xml_files(backend=backend)
+    xtree = ewmxf.open_mmd_xml_file(io.BytesIO(document.encode('utf-8')), NS)
+    xroot = xtree.getroot()
+    ewmxf.remove_wms_from_mmd_xml(xroot, NS)
+    ewmxf.add_wms_to_mmd_xml(xroot, 'https://server/path.nc', ['overview', 'ir_window_channel'])
+    return ewmxf.xml.tostring(xtree)
+
+
+@pytest.mark.parametrize('module, name', EXISTING_TESTS)
+def test_existing_tests_with_lxml(module, name, monkeypatch, request):
+    pytest.importorskip('lxml')
+    monkeypatch.setenv('MAPSERVER_TOOLS_XML_BACKEND', 'lxml')
+    test = getattr(importlib.import_module('mapserver_tools.tests.' + module), name)
+    test(*[request.getfixturevalue(arg) for arg in inspect.signature(test).parameters])
+
+
+def test_lxml_output_same_as_etree():
+    pytest.importorskip('lxml')
+    expected = _rewrite('etree', DOCUMENT)
+    assert b'xmlns:xsi=' in expected
+    assert _rewrite('lxml', DOCUMENT) == expected
+
+
+def test_stream_output_same_as_etree():
+    from mapserver_tools.stream_wms_mmd_xml_files import stream_edit_wms_mmd_xml_files
+
+    output = io.BytesIO()
+    stream_edit_wms_mmd_xml_files(NS).rewrite_mmd_xml_stream(
+        io.BytesIO(DOCUMENT.encode('utf-8')), output, ('https://server/path.nc', ['overview', 'ir_window_channel']))
+    assert output.getvalue() == _rewrite('etree', DOCUMENT)
+
+
+def test_get_xml_backend(monkeypatch):
+    from mapserver_tools.xml_backend import get_xml_backend
+    from mapserver_tools.xml_backend import lxml_available
+    from mapserver_tools.xml_backend import xml_backend_error
+
+    assert get_xml_backend('etree').name == 'etree'
+    assert get_xml_backend('auto').name == ('lxml' if lxml_available() else 'etree')
+    monkeypatch.delenv('MAPSERVER_TOOLS_XML_BACKEND', raising=False)
+    assert get_xml_backend().name == 'etree'
+    with pytest.raises(xml_backend_error):
+        get_xml_backend('minidom')
@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2021, 2022
+
+# Author(s):
+
+#   Trygve Aspenes
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Read ImageWidth, ImageLength, DateTime and the GeoTIFF georeferencing from the first IFD of a TIFF or BigTIFF file.
+
+Only the few bytes of the header and the first IFD are touched, through
+mmap, so this is much cheaper than opening the file with rasterio/GDAL.
+"""
+
+import mmap
+import struct
+
+IMAGE_WIDTH = 256
+IMAGE_LENGTH = 257
+DATE_TIME = 306
+MODEL_PIXEL_SCALE = 33550
+MODEL_TIEPOINT = 33922
+
+# TIFF field type -> (struct format, size in bytes)
+_field_types = {1: ('B', 1), 2: ('s', 1), 3: ('H', 2), 4: ('I', 4), 12: ('d', 8), 16: ('Q', 8)}
+
+
+class tiff_header_error(ValueError):
+    pass
+
+
+def _read_tags(buf, tags):
+    if len(buf) < 8:
+        raise tiff_header_error("File too small to be a TIFF file")
+    if buf[:2] == b'II':
+        order = '<'
+    elif buf[:2] == b'MM':
+        order = '>'
+    else:
+        raise tiff_header_error("Not a TIFF file")
+    magic, = struct.unpack_from(order + 'H', buf, 2)
+    if magic == 42:
+        ifd_offset, = struct.unpack_from(order + 'I', buf, 4)
+        count_format, entry_format, entry_size, inline_size = 'H', 'HHI4s', 12, 4
+    elif magic == 43:
+        if len(buf) < 16:
+            raise tiff_header_error("File too small to be a BigTIFF file")
+        ifd_offset, = struct.unpack_from(order + 'Q', buf, 8)
+        count_format, entry_format, entry_size, inline_size = 'Q', 'HHQ8s', 20, 8
+    else:
+        raise tiff_header_error("Unknown TIFF version {}".format(magic))
+
+    try:
+        entries, = struct.unpack_from(order + count_format, buf, ifd_offset)
+        first_entry = ifd_offset + struct.calcsize(order + count_format)
+        values = {}
+        for i in range(entries):
+            tag, field_type, count, value = struct.unpack_from(order + entry_format, buf,
+                                                               first_entry + i * entry_size)
+            if tag not in tags:
+                continue
+            if field_type not in _field_types:
+                raise tiff_header_error("Unsupported field type {} for tag {}".format(field_type, tag))
+            fmt, size = _field_types[field_type]
+            if count * size <= inline_size:
+                data = value[:count * size]
+            else:
+                offset, = struct.unpack(order + ('I' if inline_size == 4 else 'Q'), value)
+                data = buf[offset:offset + count * size]
+                if len(data) != count * size:
+                    raise tiff_header_error("Value of tag {} is outside the file".format(tag))
+            if fmt == 's':
+                values[tag] = bytes(data).split(b'\0', 1)[0].decode('ascii', 'replace')
+            elif count == 1:
+                values[tag] = struct.unpack(order + fmt, data[:size])[0]
+            else:
+                values[tag] = struct.unpack(order + fmt * count, data)
+    except struct.error as exc:
+        raise tiff_header_error("Truncated TIFF IFD: {}".format(exc))
+    return values
+
+
+def _read_file_tags(tiff_file, tags):
+    with open(tiff_file, 'rb') as fh:
+        try:
+            buf = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            raise tiff_header_error("Empty file")
+        try:
+            values = _read_tags(buf, tags)
+        finally:
+            buf.close()
+    for tag in tags:
+        if tag not in values:
+            raise tiff_header_error("Tag {} not found in the first IFD of {}".format(tag, tiff_file))
+    return values
+
+
+def read_tiff_header(tiff_file):
+    """Return (width, height, DateTime) of the first image in tiff_file.
+
+    DateTime is returned as written in the file, 'YYYY:MM:DD HH:MM:SS'.
+    Raises tiff_header_error if the file is not a TIFF or lacks one of the tags.
+    """
+    values = _read_file_tags(tiff_file, (IMAGE_WIDTH, IMAGE_LENGTH, DATE_TIME))
+    return values[IMAGE_WIDTH], values[IMAGE_LENGTH], values[DATE_TIME]
+
+
+def read_tiff_bounds(tiff_file):
+    """Return (minx, miny, maxx, maxy) of the first image in tiff_file in its own CRS.
+
+    Only north up images georeferenced with ModelPixelScale and a single
+    ModelTiepoint are handled, raises tiff_header_error for anything else.
+    """
+    values = _read_file_tags(tiff_file, (IMAGE_WIDTH, IMAGE_LENGTH, MODEL_PIXEL_SCALE, MODEL_TIEPOINT))
+    scale = values[MODEL_PIXEL_SCALE]
+    tiepoint = values[MODEL_TIEPOINT]
+    if not isinstance(scale, tuple) or not isinstance(tiepoint, tuple) or len(tiepoint) != 6:
+        raise tiff_header_error("Unsupported georeferencing in {}".format(tiff_file))
+    i, j, _, x, y, _ = tiepoint
+    minx = x - i * scale[0]
+    maxy = y + j * scale[1]
+    return (minx, maxy - values[IMAGE_LENGTH] * scale[1], minx + values[IMAGE_WIDTH] * scale[0], maxy)
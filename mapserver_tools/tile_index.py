@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2021, 2022
+
+# Author(s):
+
+#   Trygve Aspenes
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Write and read mapserver raster tile indexes as ESRI shapefiles.
+
+A tile index holds one polygon per GeoTIFF file, the footprint of the file,
+with a location attribute (the file name as seen by mapserver) and a time
+attribute. A raster LAYER with TILEINDEX pointing at the index and
+wms_timeitem set to the time attribute serves all the files as one layer
+with a WMS TIME dimension.
+
+The shapefiles are written with the standard library only, so there is no
+dependency on OGR/fiona. The .shp, .shx and .dbf files are each written with
+write_if_changed.
+"""
+
+import struct
+
+from mapserver_tools.atomic_write import write_if_changed
+
+SHAPE_POLYGON = 5
+# Character fields in dbf files are at most 254 bytes wide
+MAX_FIELD_WIDTH = 254
+
+_polygon_content_length = 4 + 32 + 4 + 4 + 4 + 5 * 16
+
+
+def _shp_header(file_length, bounds):
+    return b''.join([struct.pack('>7i', 9994, 0, 0, 0, 0, 0, file_length // 2),
+                     struct.pack('<2i', 1000, SHAPE_POLYGON),
+                     struct.pack('<8d', bounds[0], bounds[1], bounds[2], bounds[3], 0.0, 0.0, 0.0, 0.0)])
+
+
+def _polygon(bounds):
+    minx, miny, maxx, maxy = bounds
+    # Outer rings are clockwise in shapefiles
+    ring = [(minx, miny), (minx, maxy), (maxx, maxy), (maxx, miny), (minx, miny)]
+    content = struct.pack('<i4d2ii', SHAPE_POLYGON, minx, miny, maxx, maxy, 1, len(ring), 0)
+    return content + b''.join(struct.pack('<2d', x, y) for x, y in ring)
+
+
+def _dbf(fields, rows, date):
+    header_length = 32 + 32 * len(fields) + 1
+    record_length = 1 + sum(width for _, width in fields)
+    out = [struct.pack('<4BIHH20x', 3, date[0] - 1900, date[1], date[2], len(rows), header_length, record_length)]
+    for name, width in fields:
+        out.append(struct.pack('<11sc4xBB14x', name.encode('ascii'), b'C', width, 0))
+    out.append(b'\r')
+    for row in rows:
+        out.append(b' ')
+        for (_, width), value in zip(fields, row):
+            out.append(value.encode('utf-8').ljust(width, b' '))
+    out.append(b'\x1a')
+    return b''.join(out)
+
+
+def union_bounds(bounds_list):
+    """Return the bounding box of a list of (minx, miny, maxx, maxy)."""
+    return (min(b[0] for b in bounds_list), min(b[1] for b in bounds_list),
+            max(b[2] for b in bounds_list), max(b[3] for b in bounds_list))
+
+
+def write_tile_index(shapefile, records, location_field='location', time_field='time'):
+    """Write a tile index shapefile from records of (location, time, (minx, miny, maxx, maxy)).
+
+    shapefile is the path without the .shp extension. Times are written as
+    given, use the ISO format mapserver expects, eg. 2021-09-10T12:33:18Z.
+    Returns True if any of the files was written, False if all were unchanged.
+    Raises ValueError if a location is longer than the 254 bytes a dbf field holds.
+    """
+    if not records:
+        raise ValueError("A tile index needs at least one record")
+    for record in records:
+        if len(record[0].encode('utf-8')) > MAX_FIELD_WIDTH:
+            raise ValueError("Location {} of tile index {} is longer than {} bytes".format(
+                record[0], shapefile, MAX_FIELD_WIDTH))
+    bounds = union_bounds([record[2] for record in records])
+    record_size = 8 + _polygon_content_length
+    shp = [_shp_header(100 + len(records) * record_size, bounds)]
+    shx = [_shp_header(100 + len(records) * 8, bounds)]
+    for number, (_, _, record_bounds) in enumerate(records, 1):
+        shp.append(struct.pack('>2i', number, _polygon_content_length // 2))
+        shp.append(_polygon(record_bounds))
+        shx.append(struct.pack('>2i', (100 + (number - 1) * record_size) // 2, _polygon_content_length // 2))
+
+    location_width = max(len(record[0].encode('utf-8')) for record in records)
+    time_width = max(len(record[1]) for record in records)
+    fields = [(location_field, location_width), (time_field, time_width)]
+    # Date of the newest record rather than today, so an unchanged index gives identical bytes
+    newest = max(record[1] for record in records)
+    date = (int(newest[0:4]), int(newest[5:7]), int(newest[8:10]))
+    dbf = _dbf(fields, [(record[0], record[1]) for record in records], date)
+
+    written = write_if_changed(shapefile + '.shp', b''.join(shp))
+    written = write_if_changed(shapefile + '.shx', b''.join(shx)) or written
+    written = write_if_changed(shapefile + '.dbf', dbf) or written
+    return written
+
+
+def read_tile_index(shapefile):
+    """Return the records of a tile index written by write_tile_index, as (location, time, bounds)."""
+    with open(shapefile + '.shp', 'rb') as fh:
+        shp = fh.read()
+    with open(shapefile + '.dbf', 'rb') as fh:
+        dbf = fh.read()
+    count, header_length, record_length = struct.unpack_from('<IHH', dbf, 4)
+    widths = []
+    offset = 32
+    while dbf[offset:offset + 1] != b'\r':
+        widths.append(dbf[offset + 16])
+        offset += 32
+    records = []
+    offset = 100
+    for i in range(count):
+        row = dbf[header_length + i * record_length + 1:header_length + (i + 1) * record_length]
+        values = []
+        for width in widths:
+            values.append(row[:width].decode('utf-8').rstrip(' '))
+            row = row[width:]
+        _, length = struct.unpack_from('>2i', shp, offset)
+        bounds = struct.unpack_from('<4d', shp, offset + 12)
+        offset += 8 + length * 2
+        records.append((values[0], values[1], bounds))
+    return records
@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2021, 2022
+
+# Author(s):
+
+#   Trygve Aspenes
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Select the WMS layers of an MMD file from rules, see etc/wms-layer-rules.yaml.
+
+A rules config looks like:
+
+default: [overview, ir_window_channel]
+rules:
+  - contains: iband
+    layers: [hr_overview, ir_window_channel]
+  - platform: NOAA-20
+    instrument: VIIRS
+    layers: [overview]
+
+A rule can have any of these conditions, all must match:
+
+token       a part of the MMD basename split on - _ and .
+contains    a substring of the MMD basename
+regex       a regular expression matched with re.search on the MMD basename
+platform    the mmd:platform/mmd:short_name of the MMD file
+instrument  the mmd:platform/mmd:instrument/mmd:short_name of the MMD file
+
+All comparisons except regex ignore case. The first matching rule in the
+file wins, default is used when no rule matches. Rules with a token,
+platform or instrument are indexed on it, so only the rules that can match
+are tested, however many rules there are.
+"""
+
+import re
+
+# The substrings the WMS layers were selected on before there were rules
+DEFAULT_WMS_LAYER_RULES = {'default': ['overview', 'ir_window_channel'],
+                           'rules': [{'contains': 'iband', 'layers': ['hr_overview', 'ir_window_channel']},
+                                     {'contains': 'dnb', 'layers': ['adaptive_dnb']}]}
+
+_indexed_conditions = ('token', 'platform', 'instrument')
+_conditions = _indexed_conditions + ('contains', 'regex')
+_token_separators = re.compile('[-_.]')
+
+
+class wms_layer_rules_error(ValueError):
+    pass
+
+
+class wms_layer_rules():
+    """Rules config compiled once into indexes, reused for any number of MMD files."""
+
+    def __init__(self, config):
+        self.config = config
+        if not isinstance(config.get('default', []), list):
+            raise wms_layer_rules_error("default must be a list of layers")
+        self.default = config.get('default', [])
+        self.rules = []
+        self.index = dict((condition, {}) for condition in _indexed_conditions)
+        self.unindexed = []
+        for number, rule in enumerate(config.get('rules') or []):
+            if not isinstance(rule.get('layers'), list):
+                raise wms_layer_rules_error("Rule without a list of layers: {}".format(rule))
+            conditions = dict((key, rule[key]) for key in _conditions if key in rule)
+            if not conditions:
+                raise wms_layer_rules_error("Rule without any of {}: {}".format(', '.join(_conditions), rule))
+            for key, value in conditions.items():
+                conditions[key] = re.compile(value) if key == 'regex' else str(value).lower()
+            self.rules.append((conditions, rule['layers']))
+            for key in _indexed_conditions:
+                if key in conditions:
+                    self.index[key].setdefault(conditions[key], []).append(number)
+                    break
+            else:
+                self.unindexed.append(number)
+
+    def _matches(self, conditions, bn, tokens, platform, instrument):
+        for key, value in conditions.items():
+            if key == 'token':
+                if value not in tokens:
+                    return False
+            elif key == 'contains':
+                if value not in bn.lower():
+                    return False
+            elif key == 'regex':
+                if not value.search(bn):
+                    return False
+            elif key == 'platform':
+                if platform is None or value != platform.lower():
+                    return False
+            elif key == 'instrument':
+                if instrument is None or value != instrument.lower():
+                    return False
+        return True
+
+    def select(self, bn, platform=None, instrument=None):
+        """Return the WMS layers for the MMD basename bn and its platform and instrument short names."""
+        tokens = set(_token_separators.split(bn.lower()))
+        candidates = set(self.unindexed)
+        for token in tokens:
+            candidates.update(self.index['token'].get(token, ()))
+        if platform is not None:
+            candidates.update(self.index['platform'].get(platform.lower(), ()))
+        if instrument is not None:
+            candidates.update(self.index['instrument'].get(instrument.lower(), ()))
+        for number in sorted(candidates):
+            conditions, layers = self.rules[number]
+            if self._matches(conditions, bn, tokens, platform, instrument):
+                return list(layers)
+        return list(self.default)
+
+
+def compile_wms_layer_rules(config):
+    """Return wms_layer_rules for config, which may already be compiled."""
+    if isinstance(config, wms_layer_rules):
+        return config
+    return wms_layer_rules(config)
+
+
+_loaded = {}
+
+
+def load_wms_layer_rules(rules_file=None):
+    """Return the compiled rules of rules_file, or the built in rules if it is None.
+
+    Compiled rules are kept per file, so worker processes read each file once.
+    """
+    rules = _loaded.get(rules_file)
+    if rules is None:
+        if rules_file is None:
+            config = DEFAULT_WMS_LAYER_RULES
+        else:
+            from mapserver_tools.edit_wms_mmd_xml_files import read_yaml_config_file
+            config = read_yaml_config_file(rules_file)
+            if config is None:
+                raise wms_layer_rules_error("Could not read WMS layer rules from {}".format(rules_file))
+        rules = wms_layer_rules(config)
+        _loaded[rules_file] = rules
+    return rules
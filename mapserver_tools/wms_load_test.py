@@ -0,0 +1,625 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2021, 2022
+
+# Author(s):
+
+#   Trygve Aspenes
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Load test a mapserver or mapcache WMS with realistic request mixes.
+
+Used to size the Fcgid settings of containers/mapserver/mapserver.conf
+(FcgidMaxProcessesPerClass, FcgidMaxRequestsPerProcess, ...) from measured
+latencies instead of guesswork.
+
+Requests are either made from map files written by this package, see
+read_map_file_targets and wms_request_mix, or replayed from an apache access
+log, see read_access_log. A request mix has:
+
+- a share of GetCapabilities requests per map file,
+- GetMap requests of a random layer, at a zoom level drawn from weights
+  decaying by zoom_decay per level, so overview requests are most common,
+  of a tile sized bbox at a random position in the layer extent,
+- the newest time of the layer for latest_time_ratio of the GetMap requests
+  and a random time of the layer for the rest,
+- a CRS the map file offers in its wms_srs, see choose_crs, with the layer
+  extents reprojected to it.
+
+run_load_test sends the requests from concurrency threads, as fast as the
+target answers or paced to rate requests per second, and summarize_results
+gives the latency percentiles, throughput and error rates. ServiceException
+answers, which mapserver sends with status 200, and GetMap answers that are
+not images count as errors.
+
+stub_wms_server is a local WMS look-alike with configurable latency, error
+rate and number of requests handled at a time, like FcgidMaxProcessesPerClass,
+so the harness can be tried without a mapserver.
+"""
+
+import os
+import re
+import glob
+import time
+import random
+import threading
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+from mapserver_tools.tiff_header import read_tiff_bounds
+
+PERCENTILES = (50, 90, 95, 99)
+
+_layer_re = re.compile(r'^\s*LAYER\s*$', re.M)
+_name_re = re.compile(r'^\s*NAME\s+"([^"]*)"', re.M)
+_extent_re = re.compile(r'^\s*EXTENT\s+(\S+)\s+(\S+)\s+(\S+)\s+(\S+)', re.M)
+_data_re = re.compile(r'^\s*DATA\s+"?([^"\s]+)"?', re.M)
+_time_extent_re = re.compile(r'"wms_timeextent"\s+"([^"]*)"')
+_online_resource_map_re = re.compile(r'"wms_onlineresource"\s+"[^"]*[?&]map=([^&"]+)')
+_epsg_re = re.compile(r'"init=epsg:(\d+)"', re.I)
+_wms_srs_re = re.compile(r'"wms_srs"\s+"([^"]*)"')
+_service_exception_re = re.compile(br'<(?:\w+:)?ServiceException\b(?:[^>]*\bcode="([^"]*)")?')
+_access_log_re = re.compile(r'"(?:GET|HEAD) (\S+) HTTP/[\d.]+" (\d{3}|-)')
+
+
+# CRSs tried in this order when the map file CRS is not one of its wms_srs
+PREFERRED_CRS = ('EPSG:3857', 'EPSG:4326')
+# Geographic CRSs with latitude first in WMS 1.3.0 bboxes
+_lat_lon_crs = ('EPSG:4326', 'EPSG:4269')
+
+
+class wms_load_test_error(ValueError):
+    pass
+
+
+def _layer_times(time_extent):
+    """Return the times of a wms_timeextent of a map file: a list of times or start/end of one time."""
+    if not time_extent:
+        return []
+    if ',' in time_extent:
+        return sorted(time_extent.split(','))
+    start, _, end = time_extent.partition('/')
+    return sorted(set([start, end or start]))
+
+
+def choose_crs(map_crs, wms_srs, crs=None):
+    """Return the CRS to request a map in: crs, map_crs if the map offers it, or one of PREFERRED_CRS it offers.
+
+    wms_srs is the list of CRSs in the wms_srs metadata of the map, mapserver
+    refuses GetMap requests in other CRSs with an InvalidCRS exception.
+    """
+    if crs:
+        if wms_srs and crs not in wms_srs:
+            print("{} is not in the wms_srs of the map file, {}".format(crs, ' '.join(wms_srs)))
+        return crs
+    if not wms_srs or map_crs in wms_srs:
+        return map_crs
+    for preferred in PREFERRED_CRS:
+        if preferred in wms_srs:
+            return preferred
+    return wms_srs[0]
+
+
+def transform_extent(extent, src_crs, dst_crs):
+    """Return extent in src_crs as (minx, miny, maxx, maxy) in dst_crs."""
+    if src_crs == dst_crs:
+        return tuple(extent)
+    from rasterio.warp import transform_bounds
+
+    return tuple(transform_bounds(src_crs, dst_crs, *extent))
+
+
+def read_map_file(map_file, default_extent=None, crs=None):
+    """Return the WMS target of a map file written from the templates of this package.
+
+    The target is a dict with the map path as seen by mapserver, from
+    wms_onlineresource, the CRS and the layers with name, extent and times.
+    The CRS is crs or picked from the wms_srs of the map by choose_crs, and the
+    extents are reprojected to it. The extent of a layer is its EXTENT,
+    default_extent or the bounds of its DATA GeoTIFF, in the map CRS. Layers
+    without any are left out with a message.
+    """
+    with open(map_file, 'r') as fh:
+        content = fh.read()
+    map_path = _online_resource_map_re.search(content)
+    epsg = _epsg_re.search(content)
+    map_crs = 'EPSG:{}'.format(epsg.group(1)) if epsg else 'EPSG:4326'
+    # Only the MAP part before the first layer, layers may have their own wms_srs
+    wms_srs = _wms_srs_re.search(_layer_re.split(content)[0])
+    wms_srs = wms_srs.group(1).upper().split() if wms_srs else []
+    target_crs = choose_crs(map_crs, wms_srs, crs)
+    layers = []
+    # Each block runs from a LAYER line to the next, the first is the MAP part before the layers
+    for layer_block in _layer_re.split(content)[1:]:
+        name = _name_re.search(layer_block)
+        if name is None:
+            continue
+        extent = _extent_re.search(layer_block)
+        try:
+            extent = tuple(float(value) for value in extent.groups()) if extent else None
+        except ValueError:
+            extent = None
+        if extent is None and default_extent is not None:
+            extent = tuple(default_extent)
+        elif extent is None:
+            data = _data_re.search(layer_block)
+            try:
+                extent = read_tiff_bounds(data.group(1)) if data else None
+            except (OSError, ValueError):
+                extent = None
+        if extent is None:
+            print("No extent for layer {} in {}, give a default extent. Skipping it.".format(name.group(1),
+                                                                                             map_file))
+            continue
+        time_extent = _time_extent_re.search(layer_block)
+        layers.append({'name': name.group(1),
+                       'extent': transform_extent(extent, map_crs, target_crs),
+                       'times': _layer_times(time_extent.group(1) if time_extent else None)})
+    return {'map': map_path.group(1) if map_path else os.path.abspath(map_file),
+            'crs': target_crs,
+            'wms_srs': wms_srs,
+            'layers': layers}
+
+
+def read_map_file_targets(inputs, default_extent=None, layer_config=None, pattern='*.map', crs=None):
+    """Return the WMS targets of the map files in inputs: files, directories or glob patterns.
+
+    See read_map_file for default_extent and crs.
+    With a layer config, see etc/okd-satellite-layer-metadata.yaml, only the
+    layers named in it are kept. Map files without layers are left out.
+    """
+    map_files = []
+    for name in inputs:
+        if os.path.isdir(name):
+            map_files.extend(sorted(glob.glob(os.path.join(name, pattern))))
+        elif os.path.exists(name):
+            map_files.append(name)
+        else:
+            map_files.extend(sorted(glob.glob(name)))
+    names = None
+    if layer_config is not None:
+        names = set(layer['name'] for layer in layer_config.get('layers', []))
+    targets = []
+    for map_file in map_files:
+        target = read_map_file(map_file, default_extent, crs)
+        if names is not None:
+            target['layers'] = [layer for layer in target['layers'] if layer['name'] in names]
+        if target['layers']:
+            targets.append(target)
+    return targets
+
+
+def getcapabilities_query(target, version='1.3.0'):
+    return urlencode([('map', target['map']), ('SERVICE', 'WMS'), ('VERSION', version),
+                      ('REQUEST', 'GetCapabilities')])
+
+
+def getmap_query(target, layer, bbox, width=256, height=256, time_value=None, image_format='image/png',
+                 version='1.3.0'):
+    if version == '1.3.0' and target['crs'] in _lat_lon_crs:
+        bbox = (bbox[1], bbox[0], bbox[3], bbox[2])
+    params = [('map', target['map']), ('SERVICE', 'WMS'), ('VERSION', version), ('REQUEST', 'GetMap'),
+              ('LAYERS', layer['name']), ('STYLES', ''), ('CRS', target['crs']),
+              ('BBOX', ','.join(repr(value) for value in bbox)), ('WIDTH', str(width)), ('HEIGHT', str(height)),
+              ('FORMAT', image_format)]
+    if time_value:
+        params.append(('TIME', time_value))
+    return urlencode(params)
+
+
+def zoom_weights(zoom_levels=6, zoom_decay=0.6):
+    """Return the weight of each zoom level, level 0 showing the full extent."""
+    return [zoom_decay ** level for level in range(zoom_levels)]
+
+
+def tile_bbox(extent, zoom, rng):
+    """Return a random bbox of a tile at zoom in extent, the extent is split in 2**zoom tiles each way."""
+    minx, miny, maxx, maxy = extent
+    tiles = 2 ** zoom
+    width = (maxx - minx) / tiles
+    height = (maxy - miny) / tiles
+    column = rng.randrange(tiles)
+    row = rng.randrange(tiles)
+    return (minx + column * width, miny + row * height, minx + (column + 1) * width, miny + (row + 1) * height)
+
+
+def wms_request_mix(targets, count, getcapabilities_ratio=0.05, zoom_levels=6, zoom_decay=0.6,
+                    latest_time_ratio=0.5, tile_size=256, image_format='image/png', seed=None):
+    """Return count WMS query strings for targets from read_map_file_targets, see the module documentation."""
+    if not targets:
+        raise wms_load_test_error("No map files with layers to make requests for")
+    rng = random.Random(seed)
+    weights = zoom_weights(zoom_levels, zoom_decay)
+    levels = list(range(zoom_levels))
+    queries = []
+    for _ in range(count):
+        target = rng.choice(targets)
+        if rng.random() < getcapabilities_ratio:
+            queries.append(getcapabilities_query(target))
+            continue
+        layer = rng.choice(target['layers'])
+        zoom = rng.choices(levels, weights)[0]
+        time_value = None
+        if layer['times']:
+            time_value = layer['times'][-1] if rng.random() < latest_time_ratio else rng.choice(layer['times'])
+        queries.append(getmap_query(target, layer, tile_bbox(layer['extent'], zoom, rng), tile_size, tile_size,
+                                    time_value, image_format))
+    return queries
+
+
+def read_access_log(access_log, wms_only=True):
+    """Return the query strings of the GET requests in an apache common or combined format access log.
+
+    With wms_only only requests with a REQUEST parameter are kept.
+    """
+    queries = []
+    with open(access_log, 'r', errors='replace') as fh:
+        for line in fh:
+            match = _access_log_re.search(line)
+            if match is None:
+                continue
+            query = urlsplit(match.group(1)).query
+            if wms_only and 'request' not in (key.lower() for key, _ in parse_qsl(query)):
+                continue
+            queries.append(query)
+    return queries
+
+
+def request_kind(query):
+    """Return the WMS REQUEST parameter of query, 'other' if it has none."""
+    for key, value in parse_qsl(query, keep_blank_values=True):
+        if key.lower() == 'request':
+            return value
+    return 'other'
+
+
+def _query_crs(query):
+    for key, value in parse_qsl(query, keep_blank_values=True):
+        if key.lower() in ('crs', 'srs'):
+            return value.upper()
+    return None
+
+
+def _send(session, url, kind, timeout):
+    start = time.perf_counter()
+    try:
+        response = session.get(url, timeout=timeout)
+        content = response.content
+    except Exception as exc:
+        return kind, None, time.perf_counter() - start, 0, type(exc).__name__
+    seconds = time.perf_counter() - start
+    error = None
+    exception = None
+    if not response.headers.get('Content-Type', '').startswith('image/'):
+        exception = _service_exception_re.search(content[:4096])
+    if response.status_code >= 400:
+        error = 'HTTP {}'.format(response.status_code)
+    elif exception is not None:
+        # Mapserver answers errors with status 200, eg. an InvalidCRS exception to a GetMap in another CRS
+        error = 'ServiceException' + (' ' + exception.group(1).decode('ascii', 'replace') if exception.group(1) else '')
+    elif kind.lower() == 'getmap' and not response.headers.get('Content-Type', '').startswith('image/'):
+        error = 'ServiceException'
+    return kind, response.status_code, seconds, len(content), error
+
+
+def run_load_test(base_url, queries, concurrency=8, duration=None, rate=None, timeout=30):
+    """Send queries to base_url from concurrency threads.
+
+    Every query is sent once, or the queries are cycled until duration
+    seconds have passed. With rate the requests are started at rate per
+    second, as far as the threads keep up, else as fast as the target
+    answers. Returns the results, (request kind, status, seconds, bytes,
+    error) per request, and the elapsed seconds.
+    """
+    import requests
+
+    if not queries:
+        raise wms_load_test_error("No requests to send")
+    separator = '&' if '?' in base_url else '?'
+    urls = [(base_url + separator + query, request_kind(query)) for query in queries]
+    lock = threading.Lock()
+    state = {'next': 0}
+    results = []
+    start = time.perf_counter()
+    deadline = start + duration if duration else None
+
+    def _next_request():
+        with lock:
+            index = state['next']
+            if deadline is None and index >= len(urls):
+                return None, None
+            state['next'] += 1
+        return index, urls[index % len(urls)]
+
+    def _worker():
+        session = requests.Session()
+        worker_results = []
+        try:
+            while True:
+                index, request = _next_request()
+                if request is None:
+                    break
+                if rate:
+                    delay = start + index / rate - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+                if deadline is not None and time.perf_counter() >= deadline:
+                    break
+                worker_results.append(_send(session, request[0], request[1], timeout))
+        finally:
+            session.close()
+            with lock:
+                results.extend(worker_results)
+
+    threads = [threading.Thread(target=_worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, time.perf_counter() - start
+
+
+def percentile(sorted_values, pct):
+    """Nearest rank percentile of sorted_values."""
+    if not sorted_values:
+        return None
+    rank = max(1, -(-len(sorted_values) * pct // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def _latency_summary(results, elapsed):
+    seconds = sorted(result[2] for result in results)
+    errors = sum(1 for result in results if result[4] is not None)
+    summary = {'requests': len(results),
+               'errors': errors,
+               'error_rate': errors / len(results) if results else 0.0,
+               'throughput': len(results) / elapsed if elapsed > 0 else 0.0,
+               'bytes': sum(result[3] for result in results),
+               'mean': sum(seconds) / len(seconds) if seconds else None,
+               'max': seconds[-1] if seconds else None}
+    for pct in PERCENTILES:
+        summary['p{}'.format(pct)] = percentile(seconds, pct)
+    return summary
+
+
+def summarize_results(results, elapsed):
+    """Return the latency percentiles, throughput and error rates of run_load_test results, total and per kind."""
+    summary = _latency_summary(results, elapsed)
+    summary['elapsed'] = elapsed
+    summary['by_request'] = {}
+    for kind in sorted(set(result[0] for result in results)):
+        summary['by_request'][kind] = _latency_summary([r for r in results if r[0] == kind], elapsed)
+    summary['status'] = {}
+    summary['error_types'] = {}
+    for _, status, _, _, error in results:
+        key = str(status) if status is not None else 'none'
+        summary['status'][key] = summary['status'].get(key, 0) + 1
+        if error is not None:
+            summary['error_types'][error] = summary['error_types'].get(error, 0) + 1
+    return summary
+
+
+def _ms(seconds):
+    return '{:8.1f}'.format(seconds * 1000) if seconds is not None else '{:>8}'.format('-')
+
+
+def print_summary(summary, file=None):
+    """Print a summary from summarize_results as a table, latencies in ms."""
+    columns = ['p{}'.format(pct) for pct in PERCENTILES] + ['max', 'mean']
+    header = '{:<18}{:>9}{:>9}{:>8}{:>9}'.format('request', 'count', 'req/s', 'errors', 'err %')
+    print(header, *('{:>8}'.format(column) for column in columns), file=file)
+    rows = sorted(summary['by_request'].items()) + [('total', summary)]
+    for kind, row in rows:
+        line = '{:<18}{:>9}{:>9.1f}{:>8}{:>9.2f}'.format(kind, row['requests'], row['throughput'],
+                                                         row['errors'], 100 * row['error_rate'])
+        print(line, *(_ms(row[column]) for column in columns), file=file)
+    status = ', '.join('{}: {}'.format(key, value) for key, value in sorted(summary['status'].items()))
+    errors = ', '.join('{}: {}'.format(key, value) for key, value in sorted(summary['error_types'].items()))
+    print("{} requests in {:.2f}s, status {}{}".format(summary['requests'], summary['elapsed'], status,
+                                                       ', errors ' + errors if errors else ''), file=file)
+
+
+_STUB_CAPABILITIES = (b'<?xml version="1.0" encoding="UTF-8"?>\n'
+                      b'<WMS_Capabilities xmlns="http://www.opengis.net/wms" version="1.3.0">'
+                      b'<Service><Name>WMS</Name></Service><Capability><Layer><Name>stub</Name></Layer></Capability>'
+                      b'</WMS_Capabilities>\n')
+_STUB_EXCEPTION = (b'<?xml version="1.0" encoding="UTF-8"?>\n'
+                   b'<ServiceExceptionReport xmlns="http://www.opengis.net/ogc" version="1.3.0">'
+                   b'<ServiceException>msDrawMap(): Image handling error.</ServiceException>'
+                   b'</ServiceExceptionReport>\n')
+_STUB_INVALID_CRS = (b'<?xml version="1.0" encoding="UTF-8"?>\n'
+                     b'<ServiceExceptionReport xmlns="http://www.opengis.net/ogc" version="1.3.0">'
+                     b'<ServiceException code="InvalidCRS">msWMSLoadGetMapParams(): WMS server error. '
+                     b'Invalid CRS given : CRS must be valid for all requested layers.</ServiceException>'
+                     b'</ServiceExceptionReport>\n')
+
+
+def _stub_png():
+    import zlib
+    import struct
+
+    def chunk(kind, data):
+        return b''.join([struct.pack('>I', len(data)), kind, data, struct.pack('>I', zlib.crc32(kind + data))])
+
+    # A 1x1 white RGB image
+    return b''.join([b'\x89PNG\r\n\x1a\n', chunk(b'IHDR', struct.pack('>IIBBBBB', 1, 1, 8, 2, 0, 0, 0)),
+                     chunk(b'IDAT', zlib.compress(b'\x00\xff\xff\xff')), chunk(b'IEND', b'')])
+
+
+class stub_wms_server():
+    """Local WMS look-alike for trying the harness, for use in a with statement.
+
+    Every request takes latency seconds, exponentially distributed around it
+    with random_latency. At most max_concurrent requests are handled at a
+    time, the others wait like requests waiting for a free fcgid process.
+    error_rate of the GetMap requests get a ServiceException with status 200,
+    the way mapserver answers errors. With crs set, GetMap requests in a CRS
+    not in it get an InvalidCRS exception, like a CRS missing from wms_srs.
+    The url attribute is the base URL.
+    """
+
+    def __init__(self, latency=0.0, random_latency=False, error_rate=0.0, max_concurrent=None, seed=None,
+                 crs=None):
+        from http.server import BaseHTTPRequestHandler, HTTPServer
+        from socketserver import ThreadingMixIn
+
+        rng = random.Random(seed)
+        rng_lock = threading.Lock()
+        slots = threading.BoundedSemaphore(max_concurrent) if max_concurrent else None
+        png = _stub_png()
+
+        class handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                query = urlsplit(self.path).query
+                kind = request_kind(query).lower()
+                with rng_lock:
+                    delay = rng.expovariate(1.0 / latency) if latency and random_latency else latency
+                    failed = rng.random() < error_rate
+                if slots is not None:
+                    slots.acquire()
+                try:
+                    if delay:
+                        time.sleep(delay)
+                finally:
+                    if slots is not None:
+                        slots.release()
+                if kind == 'getcapabilities':
+                    body, content_type = _STUB_CAPABILITIES, 'text/xml'
+                elif kind == 'getmap' and crs is not None and _query_crs(query) not in crs:
+                    body, content_type = _STUB_INVALID_CRS, 'text/xml'
+                elif kind == 'getmap' and not failed:
+                    body, content_type = png, 'image/png'
+                elif kind == 'getmap':
+                    body, content_type = _STUB_EXCEPTION, 'application/vnd.ogc.se_xml'
+                else:
+                    self.send_error(400, 'Missing REQUEST parameter')
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        class server(ThreadingMixIn, HTTPServer):
+            daemon_threads = True
+
+        self.server = server(('127.0.0.1', 0), handler)
+        self.url = 'http://127.0.0.1:{}/cgi-bin/mapserv'.format(self.server.server_address[1])
+
+    def __enter__(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, kwargs={'poll_interval': 0.05})
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+
+def build_parser():
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        prog='mapserver-wms-load-test',
+        description="Send a realistic mix of WMS requests to mapserver or mapcache and report latencies.")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("-u", "--url", help="Base URL of the WMS, eg. http://localhost/cgi-bin/mapserv")
+    target.add_argument("--stub", action='store_true', help="Run against a local stub WMS, to try the harness.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("-m", "--map-files", nargs='+', help="Map files, directories or glob patterns.")
+    source.add_argument("-a", "--access-log", help="Apache access log to replay.")
+    parser.add_argument("-c", "--config", help="Layer config yaml file, only the layers in it are requested.")
+    parser.add_argument("--extent", nargs=4, type=float, metavar=('MINX', 'MINY', 'MAXX', 'MAXY'),
+                        help="Extent of layers without EXTENT in the map file, in the map file CRS.")
+    parser.add_argument("--crs",
+                        help="CRS of the GetMap requests, eg. EPSG:3857. Default: the map file CRS if it is in "
+                             "its wms_srs, else EPSG:3857 or EPSG:4326 if they are, else the first of wms_srs.")
+    parser.add_argument("-n", "--requests", type=int,
+                        help="Number of requests in the mix. Default: 1000, or all of the access log")
+    parser.add_argument("-d", "--duration", type=float,
+                        help="Send the requests over and over for this many seconds.")
+    parser.add_argument("-j", "--concurrency", type=int, default=8, help="Requests at a time. Default: 8")
+    parser.add_argument("--rate", type=float, help="Requests per second to start. Default: as fast as possible")
+    parser.add_argument("--timeout", type=float, default=30, help="Request timeout in seconds. Default: 30")
+    parser.add_argument("--getcapabilities-ratio", type=float, default=0.05,
+                        help="Share of GetCapabilities requests. Default: 0.05")
+    parser.add_argument("--zoom-levels", type=int, default=6, help="Zoom levels of the GetMap bboxes. Default: 6")
+    parser.add_argument("--zoom-decay", type=float, default=0.6,
+                        help="Weight of each zoom level relative to the one above. Default: 0.6")
+    parser.add_argument("--latest-time-ratio", type=float, default=0.5,
+                        help="Share of GetMap requests for the newest time. Default: 0.5")
+    parser.add_argument("--tile-size", type=int, default=256, help="GetMap WIDTH and HEIGHT. Default: 256")
+    parser.add_argument("--seed", type=int, help="Random seed, for a repeatable request mix.")
+    parser.add_argument("-o", "--output", help="Write the summary as JSON to this file.")
+    parser.add_argument("--stub-latency", type=float, default=0.05,
+                        help="Mean seconds per stub request. Default: 0.05")
+    parser.add_argument("--stub-error-rate", type=float, default=0.0, help="Share of failing stub GetMap requests.")
+    parser.add_argument("--stub-max-concurrent", type=int,
+                        help="Requests the stub handles at a time, like FcgidMaxProcessesPerClass.")
+    return parser
+
+
+def main(argv=None):
+    cmd_args = build_parser().parse_args(argv)
+    stub_crs = None
+    try:
+        if cmd_args.access_log:
+            queries = read_access_log(cmd_args.access_log)
+            if cmd_args.requests is not None and cmd_args.requests < len(queries):
+                print("Replaying the first {} of {} logged requests, {} dropped".format(
+                    cmd_args.requests, len(queries), len(queries) - cmd_args.requests))
+                queries = queries[:cmd_args.requests]
+        else:
+            layer_config = None
+            if cmd_args.config:
+                from mapserver_tools.edit_wms_mmd_xml_files import read_yaml_config_file
+
+                layer_config = read_yaml_config_file(cmd_args.config)
+                if layer_config is None:
+                    return 1
+            targets = read_map_file_targets(cmd_args.map_files, cmd_args.extent, layer_config, crs=cmd_args.crs)
+            if all(target['wms_srs'] for target in targets):
+                # The stub only accepts what the map files offer, like mapserver
+                stub_crs = set(crs for target in targets for crs in target['wms_srs'])
+            requests = cmd_args.requests if cmd_args.requests is not None else 1000
+            queries = wms_request_mix(targets, requests, cmd_args.getcapabilities_ratio,
+                                      cmd_args.zoom_levels, cmd_args.zoom_decay, cmd_args.latest_time_ratio,
+                                      cmd_args.tile_size, seed=cmd_args.seed)
+        if cmd_args.stub:
+            with stub_wms_server(cmd_args.stub_latency, True, cmd_args.stub_error_rate,
+                                 cmd_args.stub_max_concurrent, cmd_args.seed, stub_crs) as stub:
+                results, elapsed = run_load_test(stub.url, queries, cmd_args.concurrency, cmd_args.duration,
+                                                 cmd_args.rate, cmd_args.timeout)
+        else:
+            results, elapsed = run_load_test(cmd_args.url, queries, cmd_args.concurrency, cmd_args.duration,
+                                             cmd_args.rate, cmd_args.timeout)
+    except wms_load_test_error as exc:
+        print(exc)
+        return 1
+    summary = summarize_results(results, elapsed)
+    print_summary(summary)
+    if cmd_args.output:
+        import json
+
+        with open(cmd_args.output, 'w') as fh:
+            json.dump(summary, fh, indent=2, sort_keys=True)
+    return 0
@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2021, 2022
+
+# Author(s):
+
+#   Trygve Aspenes
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""XML backends used to parse, build and write mmd documents.
+
+etree   xml.etree.ElementTree from the standard library, the default.
+lxml    lxml.etree, parsing with the libxml2 C parser. Documents are written
+        with et_compatible_serializer, so the output is the same bytes as
+        with etree.
+auto    lxml if it is installed, otherwise etree.
+
+When no backend is given the MAPSERVER_TOOLS_XML_BACKEND environment variable
+is used, etree if it is not set. lxml is an optional dependency, it is only
+imported when asked for.
+"""
+
+import io
+import os
+import xml.etree.ElementTree as et
+
+XML_BACKENDS = ('auto', 'etree', 'lxml')
+
+
+class xml_backend_error(ValueError):
+    pass
+
+
+class etree_backend():
+    name = 'etree'
+
+    def register_namespaces(self, ns):
+        for prefix, uri in ns.items():
+            et.register_namespace(prefix, uri)
+
+    def parse(self, source):
+        return et.parse(source)
+
+    def fromstring(self, text):
+        return et.fromstring(text)
+
+    def SubElement(self, parent, tag):
+        # The prefixed tag is written as it is, the prefix must be declared by the root
+        return et.SubElement(parent, tag)
+
+    def tostring(self, xtree):
+        buf = io.BytesIO()
+        xtree.write(buf, encoding='UTF-8')
+        return buf.getvalue()
+
+
+class lxml_backend():
+    name = 'lxml'
+
+    def __init__(self):
+        from lxml import etree
+
+        self.etree = etree
+        self.parser = etree.XMLParser(huge_tree=True)
+
+    def register_namespaces(self, ns):
+        # The serializer takes the prefixes from the ElementTree registry
+        for prefix, uri in ns.items():
+            et.register_namespace(prefix, uri)
+
+    def parse(self, source):
+        if isinstance(source, str):
+            # Open the file here to get FileNotFoundError like with etree
+            with open(source, 'rb') as fh:
+                return self.etree.parse(fh, self.parser)
+        return self.etree.parse(source, self.parser)
+
+    def fromstring(self, text):
+        if isinstance(text, str):
+            text = text.encode('utf-8')
+        return self.etree.fromstring(text, self.parser)
+
+    def SubElement(self, parent, tag):
+        # lxml does not allow prefixed tags, resolve the prefix with the namespaces in scope
+        if ':' in tag:
+            prefix, local = tag.split(':', 1)
+            uri = parent.nsmap.get(prefix) or dict((p, u) for u, p in et._namespace_map.items()).get(prefix)
+            if uri is None:
+                raise xml_backend_error("Unknown namespace prefix {} in {}".format(prefix, tag))
+            tag = '{%s}%s' % (uri, local)
+        return self.etree.SubElement(parent, tag)
+
+    def tostring(self, xtree):
+        from mapserver_tools.stream_wms_mmd_xml_files import default_prefixes
+        from mapserver_tools.stream_wms_mmd_xml_files import et_compatible_serializer
+
+        root = xtree.getroot() if hasattr(xtree, 'getroot') else xtree
+        return et_compatible_serializer(default_prefixes()).tostring(root)
+
+
+def lxml_available():
+    try:
+        import lxml.etree  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+_backends = {}
+
+
+def get_xml_backend(name=None):
+    """Return the xml backend name, one of XML_BACKENDS, or name itself if it already is a backend."""
+    if name is None:
+        name = os.environ.get('MAPSERVER_TOOLS_XML_BACKEND', 'etree')
+    if not isinstance(name, str):
+        return name
+    if name == 'auto':
+        name = 'lxml' if lxml_available() else 'etree'
+    backend = _backends.get(name)
+    if backend is None:
+        if name == 'etree':
+            backend = etree_backend()
+        elif name == 'lxml':
+            try:
+                backend = lxml_backend()
+            except ImportError:
+                raise xml_backend_error("The lxml xml backend needs lxml, install it with pip install lxml")
+        else:
+            raise xml_backend_error("Unknown xml backend {}, use one of {}".format(name, ', '.join(XML_BACKENDS)))
+        _backends[name] = backend
+    return backend
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2021, 2022
+
+# Author(s):
+
+#   Trygve Aspenes
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import sys
+import argparse
+
+from mapserver_tools.edit_wms_mmd_xml_files import read_yaml_config_file
+from mapserver_tools.edit_wms_mmd_xml_files import generate_mapserver_map_file
+from mapserver_tools.geotiff_metadata_cache import geotiff_metadata_cache
+from mapserver_tools.render_environment import render_environment
+from mapserver_tools.map_file_daemon import create_watcher
+from mapserver_tools.map_file_daemon import map_file_generator_service
+from mapserver_tools.product_catalog import product_catalog
+from mapserver_tools.instrumentation import add_instrumentation_arguments
+from mapserver_tools.instrumentation import instrumentation_from_args
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument("-c", "--config", default='etc/okd-satellite-layer-metadata.yaml',
+                        help="Layer config yaml file.")
+    parser.add_argument("-i", "--input-dir", nargs='+', required=True,
+                        help="Directories to watch for incoming GeoTIFF files.")
+    parser.add_argument("-o", "--map-file-output-dir", required=True,
+                        help="Directory to write the map files to.")
+    parser.add_argument("-s", "--server-name", required=True,
+                        help="Hostname of the mapserver service.")
+    parser.add_argument("-d", "--mapserver-data-dir", default='/data',
+                        help="Data directory as seen by mapserver.")
+    parser.add_argument("-t", "--map-template-input-dir", default='templates/',
+                        help="Directory with the map file templates.")
+    parser.add_argument("-n", "--map-template-file-name", default='map-file-template-okd-satellite.map',
+                        help="Map file template.")
+    parser.add_argument("--map-output-file", default='mapserver-{product}.map',
+                        help="Map file name, {product} is replaced with the product key.")
+    parser.add_argument("--bytecode-cache-dir",
+                        help="Directory for the compiled template cache.")
+    parser.add_argument("--metadata-cache",
+                        help="sqlite file caching the size and time of the GeoTIFF files between runs.")
+    parser.add_argument("--pattern", default='*.tif', help="File name pattern of the GeoTIFF files.")
+    parser.add_argument("--settle", type=float, default=5.0,
+                        help="Seconds without new files before a complete product is rendered.")
+    parser.add_argument("--timeout", type=float, default=600.0,
+                        help="Seconds without new files before an incomplete product is rendered.")
+    parser.add_argument("--workers", type=int, default=1, help="Threads reading GeoTIFF metadata.")
+    parser.add_argument("--cog-output-dir",
+                        help="Rewrite GeoTIFF files that are not tiled, have no overviews or are not compressed as "
+                             "Cloud Optimized GeoTIFFs to this directory, seen by mapserver as "
+                             "{mapserver-data-dir}/mapserver/cog, and use them in the map file.")
+    parser.add_argument("--cog-workers", type=int, default=1, help="Processes writing Cloud Optimized GeoTIFFs.")
+    parser.add_argument("--catalog", help="sqlite product catalog to record the map files and GeoTIFF files in.")
+    parser.add_argument("--polling", action='store_true', help="Poll the directories instead of using inotify.")
+    parser.add_argument("--scan-existing", action='store_true',
+                        help="Also handle the files already in the directories at startup.")
+    add_instrumentation_arguments(parser)
+
+    cmd_args = parser.parse_args()
+
+    config = read_yaml_config_file(cmd_args.config)
+    if config is None:
+        sys.exit(1)
+
+    watcher = create_watcher(cmd_args.input_dir, cmd_args.pattern, cmd_args.scan_existing,
+                             use_inotify=not cmd_args.polling)
+    metadata_cache = geotiff_metadata_cache(cache_file=cmd_args.metadata_cache)
+    gmmf = generate_mapserver_map_file(metadata_cache=metadata_cache,
+                                       render_env=render_environment(cmd_args.bytecode_cache_dir))
+    service = map_file_generator_service(watcher, config, cmd_args.server_name, cmd_args.mapserver_data_dir,
+                                         cmd_args.map_file_output_dir, cmd_args.map_template_input_dir,
+                                         cmd_args.map_template_file_name, cmd_args.map_output_file,
+                                         settle=cmd_args.settle, timeout=cmd_args.timeout,
+                                         workers=cmd_args.workers, gmmf=gmmf,
+                                         cog_output_dir=cmd_args.cog_output_dir, cog_workers=cmd_args.cog_workers,
+                                         catalog=product_catalog(cmd_args.catalog) if cmd_args.catalog else None)
+    with instrumentation_from_args(cmd_args) as metrics:
+
+        def stop():
+            # Keep the textfile current while running, not only at exit
+            if metrics is not None and cmd_args.metrics_prometheus:
+                metrics.write_prometheus(cmd_args.metrics_prometheus)
+            return False
+
+        try:
+            service.run(stop)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            metadata_cache.close()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2021, 2022
+
+# Author(s):
+
+#   Trygve Aspenes
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import sys
+import argparse
+
+from mapserver_tools.input_files import collect_input_files
+from mapserver_tools.edit_wms_mmd_xml_files import read_yaml_config_file
+from mapserver_tools.edit_wms_mmd_xml_files import generate_mapserver_map_file
+from mapserver_tools.mapcache_config import collect_tilesets
+from mapserver_tools.mapcache_config import generate_mapcache_config
+from mapserver_tools.mapcache_config import write_mapcache_config
+from mapserver_tools.mapcache_config import seeding_plan
+from mapserver_tools.mapcache_config import run_seeding_plan
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+        description="Write mapcache.xml for the time dimension map file of many GeoTIFF files and seed the cache.")
+
+    parser.add_argument("-c", "--config", default='etc/okd-satellite-layer-metadata.yaml',
+                        help="Layer config yaml file.")
+    parser.add_argument("-i", "--input", nargs='+', required=True,
+                        help="GeoTIFF files, directories or glob patterns.")
+    parser.add_argument("-o", "--mapcache-xml", required=True, help="mapcache.xml file to write.")
+    parser.add_argument("-s", "--mapserver-url", required=True,
+                        help="URL of mapserv, eg. https://mapserver-dev.s-enda.k8s.met.no/cgi-bin/mapserv?")
+    parser.add_argument("-u", "--mapcache-url", help="Public URL of the mapcache service.")
+    parser.add_argument("-d", "--mapserver-data-dir", default='/data',
+                        help="Data directory as seen by mapserver.")
+    parser.add_argument("--map-output-file", default='mapserver-okd-satellite.map',
+                        help="Map file name used by mapserver-time-index-map-file.py.")
+    parser.add_argument("--cache-base", default='/data/mapcache', help="Directory of the mapcache disk cache.")
+    parser.add_argument("--grid", nargs='+', default=['WGS84', 'GoogleMapsCompatible'], help="Grids to cache.")
+    parser.add_argument("--pattern", default='*.tif', help="File name pattern of the GeoTIFF files in directories.")
+    parser.add_argument("--workers", type=int, default=1, help="Threads reading GeoTIFF metadata.")
+    parser.add_argument("--seed", action='store_true', help="Seed the cache after writing mapcache.xml.")
+    parser.add_argument("--dry-run", action='store_true', help="Only print the mapcache_seed commands.")
+    parser.add_argument("--min-zoom", type=int, default=0, help="Lowest zoom level to seed.")
+    parser.add_argument("--max-zoom", type=int, default=5, help="Highest zoom level to seed.")
+    parser.add_argument("--max-times", type=int, help="Seed only the newest times of each tileset.")
+    parser.add_argument("--jobs", type=int, default=4, help="mapcache_seed processes running at a time.")
+    parser.add_argument("--threads", type=int, default=2, help="Threads per mapcache_seed process.")
+    parser.add_argument("--mapcache-seed", default='mapcache_seed', help="mapcache_seed executable.")
+
+    cmd_args = parser.parse_args()
+
+    config = read_yaml_config_file(cmd_args.config)
+    if config is None:
+        sys.exit(1)
+    input_data_files = collect_input_files(cmd_args.input, pattern=cmd_args.pattern)
+    if not input_data_files:
+        print("No GeoTIFF files found.")
+        sys.exit(1)
+
+    gmmf = generate_mapserver_map_file()
+    data = gmmf.generate_time_index_render_data(None, cmd_args.mapserver_data_dir, cmd_args.map_output_file,
+                                                input_data_files, config, workers=cmd_args.workers)
+    tilesets = collect_tilesets([data])
+    mapcache = generate_mapcache_config(tilesets, cmd_args.mapserver_url, cmd_args.mapcache_url,
+                                        cache_base=cmd_args.cache_base, grids=cmd_args.grid)
+    if write_mapcache_config(cmd_args.mapcache_xml, mapcache):
+        print("Wrote {}".format(cmd_args.mapcache_xml))
+    else:
+        print("{} unchanged".format(cmd_args.mapcache_xml))
+
+    if cmd_args.seed or cmd_args.dry_run:
+        plan = seeding_plan(tilesets, range(cmd_args.min_zoom, cmd_args.max_zoom + 1), cmd_args.grid,
+                            max_times=cmd_args.max_times)
+        results = run_seeding_plan(plan, cmd_args.mapcache_xml, jobs=cmd_args.jobs, threads=cmd_args.threads,
+                                   dry_run=cmd_args.dry_run, mapcache_seed=cmd_args.mapcache_seed)
+        if any(returncode not in (0, None) for _, returncode, _ in results):
+            sys.exit(1)
@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2021, 2022
+
+# Author(s):
+
+#   Trygve Aspenes
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import sys
+import argparse
+
+from mapserver_tools.input_files import collect_input_files
+from mapserver_tools.cog_preprocess import optimize_geotiffs
+from mapserver_tools.edit_wms_mmd_xml_files import read_yaml_config_file
+from mapserver_tools.edit_wms_mmd_xml_files import generate_mapserver_map_file
+from mapserver_tools.geotiff_metadata_cache import geotiff_metadata_cache
+from mapserver_tools.product_catalog import geotiffs_from_render_data
+from mapserver_tools.product_catalog import map_file_settings
+from mapserver_tools.product_catalog import product_catalog
+from mapserver_tools.render_environment import render_environment
+from mapserver_tools.instrumentation import add_instrumentation_arguments
+from mapserver_tools.instrumentation import instrumentation_from_args
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+        description="Write one map file with a TIME dimension per layer for many GeoTIFF files.")
+
+    parser.add_argument("-c", "--config", default='etc/okd-satellite-layer-metadata.yaml',
+                        help="Layer config yaml file.")
+    parser.add_argument("-i", "--input", nargs='+', required=True,
+                        help="GeoTIFF files, directories or glob patterns.")
+    parser.add_argument("-o", "--map-file-output-dir", required=True,
+                        help="Directory to write the map file to.")
+    parser.add_argument("-x", "--tile-index-output-dir", required=True,
+                        help="Directory to write the tile indexes to, seen by mapserver as "
+                             "<mapserver-data-dir>/mapserver/tile-index.")
+    parser.add_argument("-s", "--server-name", required=True,
+                        help="Hostname of the mapserver service.")
+    parser.add_argument("-d", "--mapserver-data-dir", default='/data',
+                        help="Data directory as seen by mapserver.")
+    parser.add_argument("-t", "--map-template-input-dir", default='templates/',
+                        help="Directory with the map file templates.")
+    parser.add_argument("-n", "--map-template-file-name", default='map-file-template-okd-satellite-time.map',
+                        help="Map file template.")
+    parser.add_argument("--map-output-file", default='mapserver-okd-satellite.map',
+                        help="Map file name.")
+    parser.add_argument("--bytecode-cache-dir",
+                        help="Directory for the compiled template cache.")
+    parser.add_argument("--metadata-cache",
+                        help="sqlite file caching the size and time of the GeoTIFF files between runs.")
+    parser.add_argument("--pattern", default='*.tif', help="File name pattern of the GeoTIFF files in directories.")
+    parser.add_argument("--workers", type=int, default=1, help="Threads reading GeoTIFF metadata.")
+    parser.add_argument("--cog-output-dir",
+                        help="Rewrite GeoTIFF files that are not tiled, have no overviews or are not compressed as "
+                             "Cloud Optimized GeoTIFFs to this directory, seen by mapserver as "
+                             "{mapserver-data-dir}/mapserver/cog, and use them in the map file.")
+    parser.add_argument("--cog-workers", type=int, default=1, help="Processes writing Cloud Optimized GeoTIFFs.")
+    parser.add_argument("--catalog",
+                        help="sqlite product catalog. Nothing is done if the map file was made from the same "
+                             "unchanged files and settings before, else the map file and GeoTIFF files are recorded.")
+    add_instrumentation_arguments(parser)
+
+    cmd_args = parser.parse_args()
+
+    config = read_yaml_config_file(cmd_args.config)
+    if config is None:
+        sys.exit(1)
+    input_data_files = collect_input_files(cmd_args.input, pattern=cmd_args.pattern)
+    if not input_data_files:
+        print("No GeoTIFF files found.")
+        sys.exit(1)
+
+    catalog = product_catalog(cmd_args.catalog) if cmd_args.catalog else None
+    map_file = os.path.join(cmd_args.map_file_output_dir, cmd_args.map_output_file)
+    settings = map_file_settings(cmd_args.server_name, cmd_args.mapserver_data_dir,
+                                 os.path.join(cmd_args.map_template_input_dir, cmd_args.map_template_file_name),
+                                 config, cmd_args.cog_output_dir)
+    if catalog is not None and catalog.map_file_unchanged(map_file, input_data_files, settings):
+        print("Map file {} is up to date with its {} files".format(cmd_args.map_output_file, len(input_data_files)))
+        sys.exit(0)
+
+    with instrumentation_from_args(cmd_args):
+        metadata_cache = geotiff_metadata_cache(cache_file=cmd_args.metadata_cache)
+        gmmf = generate_mapserver_map_file(metadata_cache=metadata_cache,
+                                           render_env=render_environment(cmd_args.bytecode_cache_dir))
+        template = gmmf.load_template(cmd_args.map_template_input_dir, cmd_args.map_template_file_name)
+        if template is None:
+            sys.exit(1)
+        cog_files = None
+        if cmd_args.cog_output_dir:
+            cog_files, _ = optimize_geotiffs(input_data_files, cmd_args.cog_output_dir, workers=cmd_args.cog_workers)
+            print("{} of {} GeoTIFF files optimized".format(len(cog_files), len(input_data_files)))
+        data = gmmf.generate_time_index_render_data(cmd_args.server_name, cmd_args.mapserver_data_dir,
+                                                    cmd_args.map_output_file, input_data_files, config,
+                                                    workers=cmd_args.workers, cog_files=cog_files)
+        metadata_cache.close()
+        try:
+            written = gmmf.write_tile_indexes(cmd_args.tile_index_output_dir, data)
+        except ValueError as exc:
+            print("Could not write tile index: {}".format(exc))
+            sys.exit(1)
+        print("Wrote {} of {} tile indexes for {} files".format(written, len(data['layers']), len(input_data_files)))
+        if gmmf.write_map_file(cmd_args.map_file_output_dir, cmd_args.map_output_file, template, data):
+            print("Wrote map file {}".format(cmd_args.map_output_file))
+        else:
+            print("Map file {} unchanged".format(cmd_args.map_output_file))
+        if catalog is not None:
+            catalog.record_map_file(map_file, geotiffs_from_render_data(input_data_files, data), settings)
+            catalog.close()